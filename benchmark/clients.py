@@ -0,0 +1,130 @@
+## End to end benchmark of the source clients against local mock servers, no tenant or network needed
+## run from project root: python -m benchmark.clients [--scale small|medium|large] [--latency 0.05] [--throttle 0.01] [--sources ad,ns,bd,is,la]
+##   --record path : also record the interactions to a cassette (.json or .json.gz)
+##   --replay path : serve a recorded cassette instead of the mock servers
+## live clients are recorded the same way from a notebook, eg: Bolddesk(url, key, http_adapter=RecordTransport(path)) then .save()
+import argparse, time
+from datetime import datetime, timedelta, timezone
+import requests
+from urllib3.util import Retry
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import RequestsTransport
+
+from benchmark import generators as gen
+from benchmark.mock_servers import GraphServer, NetsuiteServer, BolddeskServer, InfosecServer, LogsAnalyticsServer
+from benchmark.transport import MockTransport, RecordTransport, ReplayTransport
+from module.metrics import RunMetrics
+
+## fixed time spans, recorded Log Analytics queries replay only for the same span
+LA_START = (gen.EPOCH + timedelta(days=30)).replace(tzinfo=timezone.utc)
+
+
+## Static token for the azure sdk clients
+class MockCredential:
+
+    def get_token(self, *scopes, **kwargs) -> AccessToken:
+        return AccessToken('mock-access-token', int(time.time()) + 3600)
+
+
+## azure-core transport over a requests adapter factory, sdk retries are left to the sdk pipeline
+## responses are measured by the sdk client policy (logsanalytics.HttpMetricsPolicy), not by a requests hook
+def azure_transport(http_adapter) -> RequestsTransport:
+    s = requests.Session()
+    s.mount('https://', http_adapter(max_retries=Retry(total=False, redirect=False, raise_on_status=False)))
+    return RequestsTransport(session=s, session_owner=False)
+
+
+## (source, call name, function returning a dataframe or list) of each benchmarked call
+def get_calls(sources, http_adapter) -> list:
+    calls = []
+    if 'ad' in sources:
+        from module.azure_ad import AzureAD
+        ad = AzureAD('mock-tenant', 'mock-client', 'mock-secret', http_adapter=http_adapter)
+        calls += [
+            ('ad', 'list_users',              lambda: ad.list_users(refresh=True)),
+            ('ad', 'list_groups',             lambda: ad.list_groups(refresh=True)),
+            ('ad', 'list_groups_umembers',    lambda: ad.list_groups_umembers()),
+            ('ad', 'list_groups_gmembers',    lambda: ad.list_groups_gmembers()),
+            ('ad', 'list_devices_users',      lambda: ad.list_devices_users()),
+            ('ad', 'list_service_principals', lambda: ad.list_service_principals()),
+            ('ad', 'list_auth_details',       lambda: ad.list_auth_details()),
+        ]
+    if 'ns' in sources:
+        from module.netsuite import Netsuite
+        ns = Netsuite('1234567', 'key', 'secret', 'token', 'token_secret', http_adapter=http_adapter)
+        calls += [
+            ('ns', 'list_subsidiaries', lambda: ns.list_subsidiaries(refresh=True)),
+            ('ns', 'list_employees',    lambda: ns.list_employees(refresh=True)),
+            ('ns', 'list_partners',     lambda: ns.list_partners(refresh=True)),
+            ('ns', 'list_login_audits', lambda: ns.list_login_audits(since='2024-01-01')),
+            ('ns', 'list_script_logs',  lambda: ns.list_script_logs()),
+        ]
+    if 'bd' in sources:
+        from module.bolddesk import Bolddesk
+        bd = Bolddesk('https://mock.bolddesk.com/api/v1/', 'mock-key', http_adapter=http_adapter)
+        calls += [
+            ('bd', 'list_agents',    lambda: bd.list_agents(refresh=True)),
+            ('bd', 'list_contacts',  lambda: bd.list_contacts(refresh=True)),
+            ('bd', 'list_tickets',   lambda: bd.list_tickets(refresh=True)),
+            ('bd', 'enrich_tickets', lambda: bd.enrich_tickets(bd.list_tickets().ticketId.head(1000).tolist())['details']),
+        ]
+    if 'is' in sources:
+        from module.infosec import Infosec
+        infosec = Infosec('https://securityiq-eu.infosecinstitute.com/api/v2', 'mock-key', http_adapter=http_adapter)
+        calls += [
+            ('is', 'list_learners',         lambda: infosec.list_learners(refresh=True)),
+            ('is', 'list_learner_progress', lambda: infosec.list_learner_progress()),
+            ('is', 'list_timeline_events',  lambda: infosec.list_timeline_events()),
+        ]
+    if 'la' in sources:
+        from module.logsanalytics import LogsAnalytics
+        la = LogsAnalytics('mock-workspace', MockCredential(), transport=azure_transport(http_adapter))
+        calls += [
+            ('la', 'list_signins', lambda: la.list_signins(time_span=(LA_START, timedelta(days=1)))),
+            ('la', 'list_audits',  lambda: la.list_audits(time_span=(LA_START, timedelta(days=1)))),
+            ('la', 'list_rollup',  lambda: la.list_rollup('signins_daily_user_app_country', time_span=(LA_START, timedelta(days=7)))),
+        ]
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', default='small', choices=list(gen.SCALES))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds of random latency')
+    parser.add_argument('--throttle', type=float, default=0.0, help='share of requests answered 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds of throttled requests')
+    parser.add_argument('--sources', default='ad,ns,bd,is,la')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', help='cassette to record')
+    parser.add_argument('--replay', help='cassette to replay')
+    args = parser.parse_args()
+
+    ## simulated latency and throttling are not recorded, they apply again on replay
+    options = dict(latency=args.latency, jitter=args.jitter, throttle_rate=args.throttle, retry_after=args.retry_after, seed=args.seed)
+    servers = [server(args.scale, args.seed) for server in (GraphServer, NetsuiteServer, BolddeskServer, InfosecServer, LogsAnalyticsServer)]
+    if args.replay:
+        transport = ReplayTransport(args.replay, **options)
+    elif args.record:
+        transport = RecordTransport(args.record, inner=MockTransport(servers), **options)
+    else:
+        transport = MockTransport(servers, **options)
+
+    metrics = RunMetrics('benchmark_clients')
+    print(f"{'call':<28} {'rows':>9} {'seconds':>9} {'requests':>9} {'MB':>8} {'rows/s':>10}")
+    for source, name, call in get_calls(args.sources.split(','), transport):
+        with metrics.table(f'{source}.{name}') as record:
+            start = time.perf_counter()
+            result = call()
+            elapsed = time.perf_counter() - start
+        rows = len(result)
+        print(f"{source + '.' + name:<28} {rows:>9} {elapsed:>9.2f} {record['http_requests']:>9} {record['http_bytes']/1024**2:>8.1f} {rows/elapsed if elapsed else 0:>10.0f}")
+
+    print(f"\ntransport: {transport.stats['requests']} requests, {transport.stats['throttled']} throttled, {transport.stats['bytes']/1024**2:.1f} MB")
+    if args.record:
+        transport.save()
+        print(f'recorded {len(transport.interactions)} interactions to {args.record}')
+
+
+if __name__ == '__main__':
+    main()
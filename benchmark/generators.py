@@ -0,0 +1,428 @@
+## Synthetic source records for the mock servers, generated on demand from (seed, kind, index)
+## any record can be rebuilt alone, so pages of a 500k tickets dataset are served without holding the dataset in memory
+## records reference each other by index (manager, members, owners...), ids are derived from the index
+import hashlib, random, uuid
+from datetime import datetime, timedelta
+
+## dataset sizes, by scale name
+SCALES = {
+    'small' : {'users': 500,    'groups': 50,    'devices': 300,    'service_principals': 50,   'managed_devices': 200,
+               'agents': 20,    'contacts': 500,    'tickets': 2_000,   'ticket_history': 3,
+               'learners': 500,    'campaigns': 10,  'runs': 3,  'timeline_events': 2_000,
+               'ns_rows': 500,     'la_rows_per_hour': 200},
+    'medium': {'users': 5_000,  'groups': 500,   'devices': 3_000,  'service_principals': 300,  'managed_devices': 2_000,
+               'agents': 100,   'contacts': 5_000,  'tickets': 50_000,  'ticket_history': 5,
+               'learners': 5_000,  'campaigns': 40,  'runs': 6,  'timeline_events': 50_000,
+               'ns_rows': 5_000,   'la_rows_per_hour': 2_000},
+    'large' : {'users': 50_000, 'groups': 5_000, 'devices': 30_000, 'service_principals': 2_000, 'managed_devices': 20_000,
+               'agents': 500,   'contacts': 50_000, 'tickets': 500_000, 'ticket_history': 8,
+               'learners': 50_000, 'campaigns': 100, 'runs': 12, 'timeline_events': 500_000,
+               'ns_rows': 50_000,  'la_rows_per_hour': 20_000},
+}
+
+DEPARTMENTS = ['Finance', 'Engineering', 'Operations', 'Sales', 'Human Resources', 'IT', 'Legal', 'Procurement']
+COUNTRIES   = ['Malaysia', 'Singapore', 'Indonesia', 'Thailand', 'Norway', 'Vietnam', 'India', 'United Arab Emirates']
+CITIES      = ['Kuala Lumpur', 'Singapore', 'Jakarta', 'Bangkok', 'Oslo', 'Hanoi', 'Mumbai', 'Dubai']
+TITLES      = ['Engineer', 'Analyst', 'Manager', 'Technician', 'Consultant', 'Director', 'Officer']
+FIRST_NAMES = ['Adam', 'Aisha', 'Chen', 'Daniel', 'Farah', 'Hiro', 'Ingrid', 'Kumar', 'Lina', 'Minh', 'Nur', 'Ola', 'Priya', 'Siti', 'Tom']
+LAST_NAMES  = ['Abdullah', 'Berg', 'Chua', 'Hansen', 'Ibrahim', 'Lee', 'Nguyen', 'Patel', 'Rahman', 'Santoso', 'Tan', 'Wong']
+SKUS        = ['05e9a617-0261-4cee-bb44-138d3ef5d965', '6fd2c87f-b296-42f0-b197-1e91e994b900', 'c7df2760-2c81-4ef7-b578-5b5392b571df']
+AUTH_METHODS = ['microsoftAuthenticatorPush', 'microsoftAuthenticatorPasswordless', 'mobilePhone', 'softwareOneTimePasscode', 'windowsHelloForBusiness', 'email']
+TICKET_STATUS = ['Open', 'In Progress', 'Waiting on Customer', 'Resolved', 'Closed']
+
+EPOCH = datetime(2023, 1, 1)
+
+
+## random generator of a record, same (seed, kind, index) always gives the same values
+def rng(seed, kind, index) -> random.Random:
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+## stable guid of a record
+def guid(seed, kind, index) -> str:
+    return str(uuid.UUID(hashlib.md5(f'{seed}:{kind}:{index}'.encode()).hexdigest()))
+
+
+## random datetime between EPOCH and EPOCH + days
+def random_date(r, days=600) -> datetime:
+    return EPOCH + timedelta(seconds=r.randrange(days * 86400))
+
+
+def iso(value) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def person(r) -> (str, str):
+    return r.choice(FIRST_NAMES), r.choice(LAST_NAMES)
+
+
+############################
+## Graph (Azure AD)
+############################
+
+def graph_user(seed, scale, i) -> dict:
+    r = rng(seed, 'user', i)
+    first, last = person(r)
+    manager = i // 10
+    country = r.randrange(len(COUNTRIES))
+    return {
+        'id'                : guid(seed, 'user', i),
+        'createdDateTime'   : iso(random_date(r)),
+        'userType'          : 'Guest' if i % 20 == 19 else 'Member',
+        'accountEnabled'    : r.random() > 0.05,
+        'assignedLicenses'  : [{'disabledPlans': [], 'skuId': sku} for sku in r.sample(SKUS, r.randint(0, 2))],
+        'assignedPlans'     : [{'assignedDateTime': iso(random_date(r)), 'capabilityStatus': 'Enabled', 'service': 'exchange', 'servicePlanId': guid(seed, 'plan', r.randrange(40))}],
+        'passwordProfile'   : {'forceChangePasswordNextSignIn': r.random() < 0.02, 'forceChangePasswordNextSignInWithMfa': False, 'password': None},
+        'userPrincipalName' : f'user{i}@contoso.com',
+        'mailNickName'      : f'user{i}',
+        'displayName'       : f'{first} {last}',
+        'department'        : r.choice(DEPARTMENTS),
+        'companyName'       : 'Contoso',
+        'employeeType'      : r.choice(['Employee', 'Contractor']),
+        'employeeId'        : str(100000 + i),
+        'jobTitle'          : f'{r.choice(TITLES)} ',
+        'mobilePhone'       : f'+60 1{r.randrange(10**8):08d}',
+        'city'              : CITIES[country],
+        'officeLocation'    : CITIES[country],
+        'country'           : f'{COUNTRIES[country]} ',
+        'signInSessionsValidFromDateTime': iso(random_date(r)),
+        'manager'           : {'@odata.type': '#microsoft.graph.user', 'id': guid(seed, 'user', manager), 'displayName': f'Manager {manager}',
+                               'employeeId': str(100000 + manager), 'userPrincipalName': f'user{manager}@contoso.com'},
+    }
+
+
+## groups of a user: i % G and (i // G) % G, see graph_group_members() for the reverse
+def graph_user_groups(seed, scale, i) -> list:
+    n_groups = scale['groups']
+    return sorted({i % n_groups, (i // n_groups) % n_groups})
+
+
+def graph_group(seed, scale, g) -> dict:
+    r = rng(seed, 'group', g)
+    kind = g % 4  ## M365, security, mail-enabled security, distribution
+    return {
+        'id'               : guid(seed, 'group', g),
+        'createdDateTime'  : iso(random_date(r)),
+        'description'      : f'Group {g}',
+        'displayName'      : f'{r.choice(DEPARTMENTS)} {g}',
+        'groupTypes'       : ['Unified'] if kind == 0 else [],
+        'mail'             : f'group{g}@contoso.com' if kind != 1 else None,
+        'mailEnabled'      : kind != 1,
+        'securityEnabled'  : kind in (1, 2),
+        'mailNickname'     : f'group{g}',
+        'visibility'       : 'Private' if kind == 0 else None,
+        'securityIdentifier': f'S-1-12-1-{g}',
+        'allowExternalSenders'  : r.random() < 0.1,
+        'hideFromAddressLists'  : False,
+        'hideFromOutlookClients': False,
+    }
+
+
+## users of a group, reverse of graph_user_groups()
+def graph_group_members(seed, scale, g) -> list:
+    n_users, n_groups = scale['users'], scale['groups']
+    members = set(range(g, n_users, n_groups))
+    for q in range(g, (n_users - 1) // n_groups + 1, n_groups):
+        members.update(range(q * n_groups, min((q + 1) * n_groups, n_users)))
+    return sorted(members)
+
+
+## nested groups of a group, every 10th group holds the next one
+def graph_group_subgroups(seed, scale, g) -> list:
+    return [g + 1] if g % 10 == 0 and g + 1 < scale['groups'] else []
+
+
+def graph_group_owners(seed, scale, g) -> list:
+    return [(g * 17) % scale['users']]
+
+
+def graph_device(seed, scale, d) -> dict:
+    r = rng(seed, 'device', d)
+    os_name = r.choice(['Windows', 'iOS', 'Android', 'MacMDM'])
+    return {
+        'id'                            : guid(seed, 'device_object', d),
+        'deviceId'                      : guid(seed, 'device', d),
+        'accountEnabled'                : r.random() > 0.05,
+        'approximateLastSignInDateTime' : iso(random_date(r)),
+        'createdDateTime'               : iso(random_date(r)),
+        'displayName'                   : f'{os_name.upper()}-{d:06d}',
+        'isCompliant'                   : r.random() > 0.2,
+        'operatingSystem'               : os_name,
+        'operatingSystemVersion'        : f'{r.randint(10, 17)}.{r.randint(0, 9)}',
+        'profileType'                   : 'RegisteredDevice',
+        'registrationDateTime'          : iso(random_date(r)),
+        'trustType'                     : r.choice(['AzureAd', 'Workplace', 'ServerAd']),
+    }
+
+
+def graph_device_users(seed, scale, d) -> list:
+    return [d % scale['users']]
+
+
+def graph_managed_device(seed, scale, d) -> dict:
+    r = rng(seed, 'managed_device', d)
+    user = d % scale['users']
+    return {
+        'id'                 : guid(seed, 'managed_device', d),
+        'userId'             : guid(seed, 'user', user),
+        'deviceName'         : f'MD-{d:06d}',
+        'managedDeviceOwnerType': r.choice(['company', 'personal']),
+        'enrolledDateTime'   : iso(random_date(r)),
+        'lastSyncDateTime'   : iso(random_date(r)),
+        'operatingSystem'    : r.choice(['Windows', 'iOS', 'Android']),
+        'complianceState'    : r.choice(['compliant', 'noncompliant', 'unknown']),
+        'osVersion'          : f'{r.randint(10, 17)}.{r.randint(0, 9)}',
+        'azureADDeviceId'    : guid(seed, 'device', d),
+        'userPrincipalName'  : f'user{user}@contoso.com',
+        'model'              : r.choice(['Latitude 7440', 'iPhone 15', 'Galaxy S23', 'ThinkPad X1']),
+        'serialNumber'       : f'SN{r.randrange(10**9):09d}',
+    }
+
+
+def graph_service_principal(seed, scale, p) -> dict:
+    r = rng(seed, 'service_principal', p)
+    return {
+        'id'                        : guid(seed, 'service_principal', p),
+        'appId'                     : guid(seed, 'app', p),
+        'createdDateTime'           : iso(random_date(r)),
+        'accountEnabled'            : True,
+        'displayName'               : f'App {p}',
+        'homepage'                  : None,
+        'notes'                     : None,
+        'preferredSingleSignOnMode' : r.choice([None, 'saml', 'password']),
+        'signInAudience'            : 'AzureADMyOrg',
+        'servicePrincipalType'      : 'Application',
+        'appRoleAssignmentRequired' : r.random() < 0.3,
+        'oauth2PermissionScopes'    : [{'id': guid(seed, 'scope', p * 10 + k), 'value': f'scope{k}'} for k in range(r.randint(0, 3))],
+        'keyCredentials'            : [{'keyId': guid(seed, 'key', p)}] if r.random() < 0.3 else [],
+        'passwordCredentials'       : [{'keyId': guid(seed, 'secret', p)}] if r.random() < 0.5 else [],
+        'owners'                    : [{'@odata.type': '#microsoft.graph.user', 'id': guid(seed, 'user', (p * 31) % scale['users'])}],
+    }
+
+
+def graph_registration_details(seed, scale, i) -> dict:
+    r = rng(seed, 'registration', i)
+    methods = r.sample(AUTH_METHODS, r.randint(0, 3))
+    return {
+        'id'                                  : guid(seed, 'user', i),
+        'userPrincipalName'                   : f'user{i}@contoso.com',
+        'userDisplayName'                     : f'User {i}',
+        'isMfaRegistered'                     : bool(methods),
+        'isMfaCapable'                        : bool(methods),
+        'isPasswordlessCapable'               : 'microsoftAuthenticatorPasswordless' in methods,
+        'methodsRegistered'                   : methods,
+        'systemPreferredAuthenticationMethods': methods[:1],
+        'lastUpdatedDateTime'                 : iso(random_date(r)),
+    }
+
+
+############################
+## Bolddesk
+############################
+
+def bd_agent(seed, scale, a) -> dict:
+    r = rng(seed, 'agent', a)
+    first, last = person(r)
+    return {
+        'userId'            : 1000 + a,
+        'name'              : f'{first} {last}',
+        'displayName'       : f'{first} {last}',
+        'emailId'           : f'Agent{a}@Contoso.com',
+        'isVerified'        : True,
+        'status'            : 'Active',
+        'roles'             : [{'roleId': role, 'roleName': f'Role {role}'} for role in r.sample(range(1, 8), r.randint(1, 2))],
+        'availabilityStatus': {'id': 1, 'name': 'Available'},
+        'shortCode'         : f'{first[0]}{last[0]}',
+        'colorCode'         : '#1E90FF',
+        'createdOn'         : iso(random_date(r)),
+        'lastModifiedOn'    : iso(random_date(r)),
+        'lastActivityOn'    : iso(random_date(r)),
+    }
+
+
+def bd_contact(seed, scale, c) -> dict:
+    r = rng(seed, 'contact', c)
+    first, last = person(r)
+    country = r.randrange(len(COUNTRIES))
+    return {
+        'userId'            : 100000 + c,
+        'contactName'       : f'{first} {last}',
+        'contactDisplayName': f'{first} {last}',
+        'emailId'           : f'User{c}@Contoso.com',
+        'contactMobileNo'   : f'+60 1{r.randrange(10**8):08d}',
+        'contactJobTitle'   : r.choice(TITLES),
+        'isVerified'        : r.random() > 0.1,
+        'isBlocked'         : False,
+        'timeZoneId'        : r.choice([1, 7, 37, 123]),
+        'createdOn'         : iso(random_date(r)),
+        'lastModifiedOn'    : iso(random_date(r)),
+        'contactCustomFields': {
+            'cf_contactCountry'       : COUNTRIES[country],
+            'cf_contactCity'          : CITIES[country],
+            'cf_contactManagerEmailId': f'user{c // 10}@contoso.com',
+            'cf_contactManagerUserId' : 100000 + c // 10,
+        },
+    }
+
+
+def bd_ticket(seed, scale, t) -> dict:
+    r = rng(seed, 'ticket', t)
+    created = random_date(r)
+    status = r.choice(TICKET_STATUS)
+    closed = created + timedelta(hours=r.randint(1, 500)) if status == 'Closed' else None
+    contact = r.randrange(scale['contacts'])
+    agent = r.randrange(scale['agents'])
+    return {
+        'ticketId'           : 1 + t,
+        'title'              : f'Ticket {t}',
+        'status'             : {'id': TICKET_STATUS.index(status) + 1, 'description': status},
+        'priority'           : {'id': 2, 'description': r.choice(['Low', 'Normal', 'High', 'Urgent'])},
+        'category'           : {'id': 3, 'description': r.choice(DEPARTMENTS)},
+        'requestedBy'        : {'userId': 100000 + contact, 'displayName': f'User {contact}', 'emailId': f'user{contact}@contoso.com'},
+        'agent'              : {'userId': 1000 + agent, 'displayName': f'Agent {agent}'},
+        'brandId'            : 1,
+        'isSpam'             : False,
+        'createdOn'          : iso(created),
+        'closedOn'           : iso(closed) if closed else None,
+        'lastStatusChangedOn': iso(closed or created + timedelta(hours=1)),
+        'responseDue'        : iso(created + timedelta(hours=8)),
+        'resolutionDue'      : iso(created + timedelta(days=3)),
+        'lastRepliedOn'      : iso(created + timedelta(hours=2)),
+        'lastUpdatedOn'      : iso(closed or created + timedelta(hours=2)),
+        ## custom fields of the offboarding category, top level in the list api
+        'cf_last_date_of_service' : iso(created + timedelta(days=14)) if t % 10 == 0 else None,
+        'cf_last_day_of_retention': iso(created + timedelta(days=90)) if t % 10 == 0 else None,
+    }
+
+
+def bd_ticket_detail(seed, scale, t) -> dict:
+    detail = bd_ticket(seed, scale, t)
+    r = rng(seed, 'ticket_detail', t)
+    detail['customFields'] = {'cf_location': r.choice(CITIES), 'cf_asset_tag': f'AT{r.randrange(10**6):06d}', 'cf_impact': r.choice(['Low', 'High'])}
+    detail['status'] = detail['status']['description']
+    return detail
+
+
+def bd_ticket_history(seed, scale, t) -> list:
+    ticket = bd_ticket(seed, scale, t)
+    r = rng(seed, 'ticket_history', t)
+    changed = datetime.strptime(ticket['createdOn'], '%Y-%m-%dT%H:%M:%SZ')
+    history, status = [], 'Open'
+    changes = r.randint(1, scale['ticket_history'])
+    for k in range(changes):
+        new_status = ticket['status']['description'] if k == changes - 1 else r.choice(TICKET_STATUS)
+        changed += timedelta(hours=r.randint(1, 48))
+        history += [{'fieldName': 'Status', 'oldValue': status, 'newValue': new_status, 'updatedOn': iso(changed),
+                     'updatedBy': {'userId': 1000 + r.randrange(scale['agents']), 'displayName': 'Agent'}}]
+        status = new_status
+    return history
+
+
+def bd_timezones() -> list:
+    return [
+        {'id': 1,   'description': '(UTC+05:30) Chennai, Kolkata, Mumbai, New Delhi'},
+        {'id': 7,   'description': '(UTC+07:00) Bangkok, Hanoi, Jakarta'},
+        {'id': 15,  'description': '(UTC+05:00) Islamabad, Karachi'},
+        {'id': 27,  'description': '(UTC+04:00) Abu Dhabi, Muscat, Dubai'},
+        {'id': 37,  'description': '(UTC+08:00) Kuala Lumpur, Singapore'},
+        {'id': 123, 'description': '(UTC+01:00) Amsterdam, Berlin, Oslo, Stockholm'},
+        {'id': 124, 'description': '(UTC+01:00) Casablanca'},
+    ]
+
+
+############################
+## Infosec
+############################
+
+def is_learner(seed, scale, l) -> dict:
+    r = rng(seed, 'learner', l)
+    first, last = person(r)
+    return {
+        'id'        : 500000 + l,
+        'email'     : f'user{l}@contoso.com',
+        'first_name': first,
+        'last_name' : last,
+        'department': r.choice(DEPARTMENTS),
+        'modified'  : iso(random_date(r)),
+    }
+
+
+def is_campaign(seed, scale, c) -> dict:
+    r = rng(seed, 'campaign', c)
+    return {
+        'id'        : 9000 + c,
+        'name'      : f'Campaign {c}',
+        'type'      : 'awareness' if c % 3 else 'phishing',
+        'status'    : 'active',
+        'created_at': iso(random_date(r)),
+    }
+
+
+## runs of a campaign, all but the last one are completed
+def is_run(seed, scale, c, k) -> dict:
+    r = rng(seed, 'run', f'{c}:{k}')
+    return {
+        'id'        : (9000 + c) * 100 + k,
+        'name'      : f'Run {k}',
+        'status'    : 'completed' if k < scale['runs'] - 1 else 'active',
+        'start_date': iso(random_date(r)),
+    }
+
+
+## learners of a run, a slice of the learners of the same size in every run
+def is_run_learners(seed, scale, c, k) -> range:
+    size = max(1, scale['learners'] // 4)
+    start = ((c * scale['runs'] + k) * size) % scale['learners']
+    return range(start, start + size)
+
+
+def is_run_learner(seed, scale, c, k, l) -> dict:
+    r = rng(seed, 'run_learner', f'{c}:{k}:{l}')
+    status = r.choice(['completed', 'started', 'not_started'])
+    return {
+        'id'          : 500000 + l % scale['learners'],
+        'status'      : status,
+        'completed_on': iso(random_date(r)) if status == 'completed' else None,
+    }
+
+
+def is_timeline_event(seed, scale, e) -> dict:
+    r = rng(seed, 'timeline_event', e)
+    campaign = r.randrange(scale['campaigns'])
+    return {
+        'id'             : 700000 + e,
+        'campaign_id'    : 'GiT' if e % 2 == 0 else str(9000 + campaign),
+        'campaign_run_id': (9000 + campaign) * 100 + r.randrange(scale['runs']),
+        'learner_id'     : 500000 + r.randrange(scale['learners']),
+        'type'           : r.choice(['completed-aware-module', 'started-aware-reminder', 'started-aware-module']),
+        'timestamp'      : iso(EPOCH + timedelta(minutes=e)),  ## events in time order
+    }
+
+
+############################
+## Netsuite SuiteQL and Log Analytics
+############################
+
+## value of a result column, by column name, for queries whose schema is only known from their select list
+## date formats follow the account preferences the list_ methods parse: dd/mm/yyyy, or iso for 'datetime'
+def column_value(r, name, row, n_rows):
+    name = name.lower()
+    if name in ('id', 'internalid'):
+        return row + 1
+    if name in ('datetime',):
+        return random_date(r).strftime('%Y-%m-%d %H:%M:%S')
+    if 'date' in name or name.endswith('on'):
+        return random_date(r).strftime('%d/%m/%Y')
+    if name.startswith('is') or name in ('giveaccess', 'partner_license', 'viewingallowed', 'itemsrestricted', 'subsidiaryviewingallowed'):
+        return r.choice(['T', 'F'])
+    if name == 'effectivesubsidiaries':
+        return ', '.join(str(s) for s in sorted(r.sample(range(1, 50), r.randint(1, 5))))
+    if name == 'segment':
+        return r.choice([-101, -102, -103])
+    if name.endswith('_id') or name in ('role', 'entity', 'user', 'parent', 'subsidiary', 'owner', 'supervisor', 'permlevel', 'perm_level', 'level', 'recordtypeid', 'script'):
+        return r.randint(1, max(1, min(n_rows, 1000)))
+    if 'email' in name:
+        return f'user{r.randrange(max(1, n_rows))}@contoso.com'
+    if name in ('status', 'result', 'type'):
+        return r.choice(['Success', 'Failure'])
+    return f'{name} {r.randrange(100)}'
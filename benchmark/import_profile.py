@@ -0,0 +1,59 @@
+## Import-time profile of the function app cold start, and of the modules each timer loads on first run
+## run from project root: python -m benchmark.import_profile [--top 15]
+import argparse, subprocess, sys
+
+## modules imported by each timer function, besides function_app itself
+FUNCTION_IMPORTS = {
+    'timer_update_ad_weekly'  : ['module.azure_ad', 'module.warehouse'],
+    'timer_update_ad'         : ['module.azure_ad', 'module.idgov'],
+    'timer_update_logs'       : ['module.logsanalytics', 'module.idgov'],
+    'timer_update_bd_care'    : ['module.bolddesk', 'module.warehouse', 'module.idgov'],
+    'timer_update_bd_helpdesk': ['module.bolddesk', 'module.warehouse', 'module.idgov'],
+    'timer_update_ns'         : ['pandas', 'module.netsuite', 'module.warehouse', 'module.idgov'],
+    'timer_update_ns_continue': ['module.warehouse', 'module.idgov'],
+    'timer_update_infosec'    : ['module.infosec', 'module.warehouse', 'module.idgov'],
+}
+
+
+## Run imports in a fresh interpreter, return [(module, self_us, cumulative_us, depth)]
+def import_times(statement) -> list:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows += [(name.strip(), int(self_us), int(cumulative_us), depth)]
+    return rows
+
+
+## Total time of the top level imports, in ms
+def total_ms(rows) -> float:
+    return sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    args = parser.parse_args()
+
+    ## cold start: what the host pays when indexing the function app
+    rows = import_times('import function_app')
+    print(f'function_app cold start: {total_ms(rows):.0f} ms')
+    print(f"\n{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:args.top]:
+        print(f'{cumulative_us/1000:>16.1f} {self_us/1000:>10.1f}  {name}')
+
+    ## first run of each function: its own imports on top of the function app
+    print(f"\n{'first run imports (ms)':>23}  function")
+    for function_name, modules in FUNCTION_IMPORTS.items():
+        rows = import_times('import function_app; ' + '; '.join(f'import {m}' for m in modules))
+        print(f'{total_ms(rows):>23.0f}  {function_name}')
+
+
+if __name__ == '__main__':
+    main()
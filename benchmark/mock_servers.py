@@ -0,0 +1,484 @@
+## Local mock servers of the source APIs, served through benchmark.transport.MockTransport
+## records come from benchmark.generators at the chosen scale, paging follows each API:
+##   Graph         : $top / @odata.nextLink ($skiptoken), $select and $expand, msal token endpoints
+##   Netsuite      : SuiteQL RESTlet, page / pageSize / totalPages, rows shaped from the query select list
+##   Bolddesk      : Page / PerPage (max 100), count if RequiresCounts
+##   Infosec       : page / limit
+##   LogsAnalytics : query API, rows shaped from the KQL project/extend/summarize stages, partial result past max_rows
+import json, math, re
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, unquote
+from benchmark import generators as gen
+
+
+## split text on separator outside of parentheses, eg: select list items, KQL pipe stages
+def split_top_level(text, separator=',') -> list:
+    items, depth, start = [], 0, 0
+    for i, c in enumerate(text):
+        depth += {'(': 1, ')': -1}.get(c, 0)
+        if c == separator and depth == 0:
+            items += [text[start:i]]
+            start = i + 1
+    return items + [text[start:]]
+
+
+class MockServer:
+
+    hosts  = ()  ## host names served, sub domains included
+    routes = []  ## (method, path regex, handler method name), first match wins
+
+    def __init__(self, scale='small', seed=0) -> None:
+        self.scale = dict(gen.SCALES[scale]) if isinstance(scale, str) else scale
+        self.seed  = seed
+
+    def matches(self, host) -> bool:
+        return any(host == h or host.endswith('.' + h) for h in self.hosts)
+
+    ## (status, headers, body) of a request
+    def handle(self, request) -> tuple:
+        parts  = urlsplit(request.url)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        for method, pattern, handler in self.routes:
+            match = re.search(pattern, unquote(parts.path))
+            if method == request.method and match:
+                return getattr(self, handler)(request, params, *match.groups())
+        return self.json({'error': {'code': 'NotFound', 'message': f'{request.method} {parts.path}'}}, status=404)
+
+    def json(self, data, status=200) -> tuple:
+        return status, {'Content-Type': 'application/json'}, json.dumps(data).encode()
+
+    def body(self, request) -> dict:
+        body = request.body or b'{}'
+        return json.loads(body.decode() if isinstance(body, bytes) else body)
+
+
+############################
+## Graph (Azure AD)
+############################
+
+class GraphServer(MockServer):
+
+    hosts = ('graph.microsoft.com', 'login.microsoftonline.com')
+    routes = [
+        ('GET',  r'^/([^/]+)/v2\.0/\.well-known/openid-configuration$', 'openid_configuration'),
+        ('POST', r'^/([^/]+)/oauth2/v2\.0/token$',                    'token'),
+        ('GET',  r'^/v1\.0/users$',                                   'users'),
+        ('GET',  r'^/v1\.0/users/user(\d+)@contoso\.com/mailboxSettings$', 'mailbox_settings'),
+        ('GET',  r'^/v1\.0/groups$',                                  'groups'),
+        ('GET',  r'^/v1\.0/groups/([0-9a-f-]+)$',                     'group'),
+        ('GET',  r'^/v1\.0/devices$',                                 'devices'),
+        ('GET',  r'^/v1\.0/deviceManagement/managedDevices$',         'managed_devices'),
+        ('GET',  r'^/v1\.0/servicePrincipals$',                       'service_principals'),
+        ('GET',  r'^/beta/reports/authenticationMethods/userRegistrationDetails$', 'registration_details'),
+    ]
+    max_top = 999
+
+    def __init__(self, scale='small', seed=0) -> None:
+        super().__init__(scale, seed)
+        self.group_index = None  ## group id -> index, built on first get of a single group
+
+    def openid_configuration(self, request, params, tenant):
+        base = f'https://login.microsoftonline.com/{tenant}'
+        return self.json({
+            'issuer'                : f'{base}/v2.0',
+            'authorization_endpoint': f'{base}/oauth2/v2.0/authorize',
+            'token_endpoint'        : f'{base}/oauth2/v2.0/token',
+            'device_authorization_endpoint': f'{base}/oauth2/v2.0/devicecode',
+        })
+
+    def token(self, request, params, tenant):
+        return self.json({'token_type': 'Bearer', 'expires_in': 3599, 'ext_expires_in': 3599, 'access_token': 'mock-access-token'})
+
+    ## one page of a collection of n records, make(i, select, expand) -> record
+    def page(self, request, params, n, make):
+        top  = min(int(params.get('$top', 100)), self.max_top)
+        skip = int(params.get('$skiptoken', 0))
+        select = params['$select'].split(',') if params.get('$select') else None
+        expand = self.parse_expand(params.get('$expand'))
+        data = {'value': [make(i, select, expand) for i in range(skip, min(skip + top, n))]}
+        if skip + top < n:
+            parts = urlsplit(request.url)
+            data['@odata.nextLink'] = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode({**params, '$skiptoken': skip + top}), ''))
+        return self.json(data)
+
+    ## 'manager($select=id,displayName)' -> {'manager': ['id', 'displayName']}, None select if not given
+    def parse_expand(self, expand) -> dict:
+        result = {}
+        for name, select in re.findall(r'(\w+)(?:\(\$select=([^)]*)\))?', expand or ''):
+            result[name] = select.split(',') if select else None
+        return result
+
+    def select(self, record, select) -> dict:
+        if select is None:
+            return record
+        return {k: v for k, v in record.items() if k in select or k.startswith('@odata')}
+
+    ## directory objects of an expanded navigation property
+    def objects(self, kind, indexes, select):
+        odata_type = {'user': '#microsoft.graph.user', 'group': '#microsoft.graph.group'}[kind]
+        make = gen.graph_user if kind == 'user' else gen.graph_group
+        if select == ['id']:  ## most expands only ask for ids, no need to build the record
+            return [{'@odata.type': odata_type, 'id': gen.guid(self.seed, kind, i)} for i in indexes]
+        return [dict(self.select(make(self.seed, self.scale, i), select), **{'@odata.type': odata_type}) for i in indexes]
+
+    def users(self, request, params):
+        def make(i, select, expand):
+            user = gen.graph_user(self.seed, self.scale, i)
+            manager = user.pop('manager')
+            user = self.select(user, select)
+            if 'manager' in expand:
+                user['manager'] = self.select(manager, expand['manager'])
+            if 'memberOf' in expand:
+                user['memberOf'] = self.objects('group', gen.graph_user_groups(self.seed, self.scale, i), expand['memberOf'])
+            return user
+        return self.page(request, params, self.scale['users'], make)
+
+    def mailbox_settings(self, request, params, i):
+        return self.json({'userPurpose': 'shared' if int(i) % 50 == 0 else 'user', 'timeZone': 'Singapore Standard Time'})
+
+    def groups(self, request, params):
+        def make(g, select, expand):
+            group = self.select(gen.graph_group(self.seed, self.scale, g), select)
+            if 'members' in expand:
+                group['members'] = self.objects('user', gen.graph_group_members(self.seed, self.scale, g), expand['members']) \
+                                 + self.objects('group', gen.graph_group_subgroups(self.seed, self.scale, g), expand['members'])
+            if 'owners' in expand:
+                group['owners'] = self.objects('user', gen.graph_group_owners(self.seed, self.scale, g), expand['owners'])
+            return group
+        return self.page(request, params, self.scale['groups'], make)
+
+    def group(self, request, params, group_id):
+        if self.group_index is None:
+            self.group_index = {gen.guid(self.seed, 'group', g): g for g in range(self.scale['groups'])}
+        if group_id not in self.group_index:
+            return self.json({'error': {'code': 'Request_ResourceNotFound', 'message': group_id}}, status=404)
+        select = params['$select'].split(',') if params.get('$select') else None
+        return self.json(self.select(gen.graph_group(self.seed, self.scale, self.group_index[group_id]), select))
+
+    def devices(self, request, params):
+        def make(d, select, expand):
+            device = self.select(gen.graph_device(self.seed, self.scale, d), select)
+            if 'registeredUsers' in expand:
+                device['registeredUsers'] = self.objects('user', gen.graph_device_users(self.seed, self.scale, d), expand['registeredUsers'])
+            return device
+        return self.page(request, params, self.scale['devices'], make)
+
+    def managed_devices(self, request, params):
+        return self.page(request, params, self.scale['managed_devices'], lambda d, select, expand: self.select(gen.graph_managed_device(self.seed, self.scale, d), select))
+
+    def service_principals(self, request, params):
+        def make(p, select, expand):
+            principal = gen.graph_service_principal(self.seed, self.scale, p)
+            owners = principal.pop('owners')
+            principal = self.select(principal, select)
+            if 'owners' in expand:
+                principal['owners'] = owners
+            return principal
+        return self.page(request, params, self.scale['service_principals'], make)
+
+    def registration_details(self, request, params):
+        return self.page(request, params, self.scale['users'], lambda i, select, expand: self.select(gen.graph_registration_details(self.seed, self.scale, i), select))
+
+
+############################
+## Netsuite SuiteQL RESTlet
+############################
+
+class NetsuiteServer(MockServer):
+
+    hosts  = ('restlets.api.netsuite.com',)
+    routes = [('POST', r'/app/site/hosting/restlet\.nl$', 'restlet')]
+
+    ## rows of the main table of a query, other tables have scale['ns_rows']
+    table_rows = {'subsidiary': 40, 'role': 300, 'department': 100, 'customrecordtype': 200, 'customlist': 200, 'script': 500, 'scriptdeployment': 800}
+
+    ## unique key columns of a row, for tables the clients pivot on
+    table_keys = {
+        'rolerestrictions': lambda row: {'role': row // 3 + 1, 'segment': -101 - row % 3},  ## one row per role and segment
+    }
+
+    def restlet(self, request, params):
+        body = self.body(request)
+        if body.get('action') != 'queryRun':
+            return self.json({'error': f"unsupported action {body.get('action')}"}, status=400)
+
+        query = body['query']
+        table, columns, aggregate = self.parse_query(query)
+        formats = self.parse_formats(query)
+        n_rows = 1 if aggregate else self.table_rows.get(table, self.scale['ns_rows'])
+        page, page_size = int(body.get('page', 0)), int(body.get('pageSize', 1000))
+        rows = []
+        for row in range(page * page_size, min((page + 1) * page_size, n_rows)):
+            r = gen.rng(self.seed, f'ns:{table}', row)
+            values = {c: gen.column_value(r, c, row, n_rows) for c in columns}
+            values.update((c, gen.random_date(r).strftime(f)) for c, f in formats.items() if c in values)
+            if table in self.table_keys:
+                values.update((c, v) for c, v in self.table_keys[table](row).items() if c in values)
+            rows += [values]
+        return self.json({'data': rows, 'totalPages': math.ceil(n_rows / page_size), 'totalRecords': n_rows, 'page': page})
+
+    ## (main table, result columns, single aggregate row) of a SuiteQL query
+    ## columns are the select list aliases, or the field names, lower case like SuiteQL returns them
+    def parse_query(self, query) -> (str, list, bool):
+        select, rest = self.split_select(query)
+        columns = []
+        for item in split_top_level(select):
+            item = item.strip()
+            if not item:
+                continue
+            alias = re.search(r'\bas\s+(\w+)\s*$', item, re.IGNORECASE)
+            name = alias.group(1) if alias else re.split(r'[.\s]', item)[-1]
+            columns += [name.lower()]
+
+        rest = rest.strip()
+        if rest.startswith('('):  ## sub query, main table is the inner one
+            table = self.parse_query(rest[1:])[0]
+        else:
+            table = re.match(r'(\w+)', rest).group(1).lower()
+        aggregate = bool(re.match(r'^\s*(to_char\s*\(\s*)?(max|min|count|sum)\s*\(', select, re.IGNORECASE)) and not re.search(r'\bgroup\s+by\b', query, re.IGNORECASE)
+        return table, columns, aggregate
+
+    ## strftime format of the TO_CHAR(date, 'YYYY-MM-DD HH:MI:SS') AS alias columns of a query, other dates are DD/MM/YYYY
+    def parse_formats(self, query) -> dict:
+        formats = {}
+        for fmt, alias in re.findall(r"\bto_char\s*\(.*?,\s*'([^']+)'\s*\)\s+as\s+(\w+)", query, re.IGNORECASE):
+            for token, directive in (('YYYY', '%Y'), ('MM', '%m'), ('DD', '%d'), ('HH24', '%H'), ('HH', '%H'), ('MI', '%M'), ('SS', '%S')):
+                fmt = fmt.replace(token, directive)
+            formats[alias.lower()] = fmt
+        return formats
+
+    ## (select list, text after the top level FROM)
+    def split_select(self, query) -> (str, str):
+        match = re.search(r'\bselect\s+(distinct\s+)?(top\s+\d+\s+)?', query, re.IGNORECASE)
+        start, depth = match.end(), 0
+        for i in range(start, len(query)):
+            depth += {'(': 1, ')': -1}.get(query[i], 0)
+            if depth == 0 and re.match(r'\bfrom\b', query[i:i+5], re.IGNORECASE) and not query[i-1].isalnum() and query[i-1] != '_':
+                return query[start:i], query[i+4:]
+        return query[start:], ''
+
+
+############################
+## Bolddesk
+############################
+
+class BolddeskServer(MockServer):
+
+    hosts  = ('bolddesk.com',)
+    routes = [
+        ('GET',   r'/agents$',                  'agents'),
+        ('GET',   r'/contacts$',                'contacts'),
+        ('GET',   r'/tickets$',                 'tickets'),
+        ('GET',   r'/tickets/(\d+)$',           'ticket'),
+        ('GET',   r'/tickets/(\d+)/history$',   'ticket_history'),
+        ('GET',   r'/tickets/(\d+)/messages$',  'ticket_messages'),
+        ('GET',   r'/locales/timezones$',       'timezones'),
+        ('GET',   r'/contact_groups$',          'empty_list'),
+        ('GET',   r'/roles$',                   'roles'),
+        ('GET',   r'/agents/(\d+)$',            'agent'),
+        ('GET',   r'/contacts/(\d+)$',          'contact'),
+        ('POST',  r'/(agents|contacts)$',       'created'),
+        ('POST',  r'/users/verify_manually/(\d+)$', 'updated'),
+        ('PUT',   r'/(agents|contacts)/.+$',    'updated'),
+        ('PATCH', r'/contacts/(\d+)/block$',    'updated'),
+    ]
+    max_per_page = 100
+
+    def page(self, params, n, make):
+        per_page = min(int(params.get('PerPage', 10)), self.max_per_page)
+        page = int(params.get('Page', 1))
+        data = {'result': [make(self.seed, self.scale, i) for i in range((page - 1) * per_page, min(page * per_page, n))]}
+        if params.get('RequiresCounts') == 'true':
+            data['count'] = n
+        return self.json(data)
+
+    def agents(self, request, params):
+        return self.page(params, self.scale['agents'], gen.bd_agent)
+
+    def contacts(self, request, params):
+        return self.page(params, self.scale['contacts'], gen.bd_contact)
+
+    def tickets(self, request, params):
+        return self.page(params, self.scale['tickets'], gen.bd_ticket)
+
+    def ticket(self, request, params, ticket_id):
+        return self.json(gen.bd_ticket_detail(self.seed, self.scale, int(ticket_id) - 1))
+
+    def ticket_history(self, request, params, ticket_id):
+        return self.json({'result': gen.bd_ticket_history(self.seed, self.scale, int(ticket_id) - 1)})
+
+    def ticket_messages(self, request, params, ticket_id):
+        count = gen.rng(self.seed, 'ticket_messages', ticket_id).randint(1, 20)
+        return self.json({'result': [{'id': int(ticket_id) * 100, 'description': 'message'}], 'count': count})
+
+    def timezones(self, request, params):
+        return self.page(params, len(gen.bd_timezones()), lambda seed, scale, i: gen.bd_timezones()[i])
+
+    def empty_list(self, request, params):
+        return self.json({'result': [], 'count': 0})
+
+    def roles(self, request, params):
+        return self.page(params, 7, lambda seed, scale, i: {'roleId': i + 1, 'roleName': f'Role {i + 1}'})
+
+    def agent(self, request, params, user_id):
+        return self.json(gen.bd_agent(self.seed, self.scale, int(user_id) - 1000))
+
+    def contact(self, request, params, user_id):
+        return self.json(gen.bd_contact(self.seed, self.scale, int(user_id) - 100000))
+
+    def created(self, request, params, kind):
+        return self.json({'id': 900000 + gen.rng(self.seed, 'created', request.body).randrange(10**5), 'message': f'{kind} created'}, status=201)
+
+    def updated(self, request, params, *args):
+        return self.json({'id': args[0] if args else None, 'message': 'updated'})
+
+
+############################
+## Infosec
+############################
+
+class InfosecServer(MockServer):
+
+    hosts  = ('infosecinstitute.com',)
+    routes = [
+        ('GET', r'/campaigns/(\d+)/runs/(\d+)/learners$', 'run_learners'),
+        ('GET', r'/campaigns/(\d+)/runs$',               'runs'),
+        ('GET', r'/campaigns$',                          'campaigns'),
+        ('GET', r'/learners$',                           'learners'),
+        ('GET', r'/timeline-events$',                    'timeline_events'),
+    ]
+    max_limit = 1000
+
+    def __init__(self, scale='small', seed=0) -> None:
+        super().__init__(scale, seed)
+        self.campaign_events = {}  ## campaign id -> indexes of its timeline events
+
+    ## one page of make(i) over indexes (range or list)
+    def page(self, params, indexes, make):
+        limit = min(int(params.get('limit', 100)), self.max_limit)
+        page = int(params.get('page', 1))
+        data = [make(i) for i in indexes[(page - 1) * limit: page * limit]]
+        return self.json({'data': data, 'meta': {'page': page, 'limit': limit, 'total': len(indexes)}})
+
+    def learners(self, request, params):
+        return self.page(params, range(self.scale['learners']), lambda l: gen.is_learner(self.seed, self.scale, l))
+
+    def campaigns(self, request, params):
+        return self.page(params, range(self.scale['campaigns']), lambda c: gen.is_campaign(self.seed, self.scale, c))
+
+    def runs(self, request, params, campaign_id):
+        c = int(campaign_id) - 9000
+        return self.page(params, range(self.scale['runs']), lambda k: gen.is_run(self.seed, self.scale, c, k))
+
+    def run_learners(self, request, params, campaign_id, run_id):
+        c, k = int(campaign_id) - 9000, int(run_id) % 100
+        indexes = gen.is_run_learners(self.seed, self.scale, c, k)
+        return self.page(params, indexes, lambda l: gen.is_run_learner(self.seed, self.scale, c, k, l))
+
+    ## events are one minute apart from gen.EPOCH, start_date skips to the first event at or after it
+    def timeline_events(self, request, params):
+        n = self.scale['timeline_events']
+        first = 0
+        if params.get('start_date'):
+            start = datetime.fromisoformat(params['start_date'].replace('Z', '')).replace(tzinfo=None)
+            first = max(0, math.ceil((start - gen.EPOCH) / timedelta(minutes=1)))
+
+        campaign_id = params.get('campaign_id')
+        if campaign_id is None:
+            indexes = range(first, n)
+        elif campaign_id == 'GiT':  ## even events
+            indexes = range(first + first % 2, n, 2)
+        else:
+            if campaign_id not in self.campaign_events:
+                self.campaign_events[campaign_id] = [e for e in range(1, n, 2) if gen.is_timeline_event(self.seed, self.scale, e)['campaign_id'] == campaign_id]
+            indexes = [e for e in self.campaign_events[campaign_id] if e >= first]
+        return self.page(params, indexes, lambda e: gen.is_timeline_event(self.seed, self.scale, e))
+
+
+############################
+## Log Analytics query API
+############################
+
+class LogsAnalyticsServer(MockServer):
+
+    hosts  = ('api.loganalytics.io',)
+    routes = [('POST', r'^/v1/workspaces/([^/]+)/query$', 'query')]
+    max_rows = 500000
+    summarize_rows_per_day = 200
+
+    def query(self, request, params, workspace_id):
+        body = self.body(request)
+        start, end = [datetime.fromisoformat(t.replace('Z', '+00:00')).replace(tzinfo=None) for t in body['timespan'].split('/')]
+        table, columns, summarized = self.parse_query(body['query'])
+
+        ## rows on a fixed time grid, the same rows are returned for overlapping time spans
+        per_hour = self.summarize_rows_per_day / 24 if summarized else self.scale['la_rows_per_hour']
+        interval = timedelta(hours=1) / per_hour
+        first = math.ceil((start - gen.EPOCH) / interval)
+        last  = math.ceil((end - gen.EPOCH) / interval)
+        count = max(0, last - first)
+
+        rows = []
+        for k in range(first, first + min(count, self.max_rows)):
+            r = gen.rng(self.seed, f'la:{table}', k)
+            rows += [[self.column_value(r, name, col_type, gen.EPOCH + k * interval) for name, col_type in columns]]
+
+        data = {'tables': [{'name': 'PrimaryResult', 'columns': [{'name': n, 'type': t} for n, t in columns], 'rows': rows}]}
+        if count > self.max_rows:
+            data['error'] = {'code': 'PartialError', 'message': 'There were some errors when processing your query.',
+                             'details': [{'code': 'EngineError', 'message': f'Query result set has exceeded the internal record count limit {self.max_rows}'}]}
+        return self.json(data)
+
+    ## (table, [(column, type)], summarized) from the project / project-away / extend / summarize stages
+    def parse_query(self, query) -> (str, list, bool):
+        stages = split_top_level(query, '|')
+        table = stages[0].strip().split()[0]
+        columns = {'TimeGenerated': 'datetime', 'Id': 'string'}
+        summarized = False
+        for stage in stages[1:]:
+            stage = stage.strip()
+            operator, _, args = stage.partition(' ')
+            if operator == 'project':
+                columns = {self.alias(a): self.column_type(self.alias(a)) for a in split_top_level(args) if a.strip()}
+            elif operator == 'project-away':
+                for a in args.split(','):
+                    columns.pop(a.strip(), None)
+            elif operator == 'extend':
+                columns.setdefault(self.alias(args), self.column_type(self.alias(args)))
+            elif operator == 'summarize':
+                measures, _, keys = args.partition(' by ')
+                columns = {self.alias(k): self.column_type(self.alias(k)) for k in split_top_level(keys)}
+                columns.update({self.alias(m): 'long' for m in split_top_level(measures)})
+                summarized = True
+        return table, list(columns.items()), summarized
+
+    def alias(self, expression) -> str:
+        return expression.split('=')[0].strip().split('(')[0].strip()
+
+    def column_type(self, name) -> str:
+        if name in ('TimeGenerated', 'Day'):
+            return 'datetime'
+        if name.endswith(('Details', 'Detail', 'modifiedProperties')):
+            return 'dynamic'
+        return 'string'
+
+    def column_value(self, r, name, col_type, time):
+        if col_type == 'datetime':
+            return gen.iso(time.replace(hour=0, minute=0, second=0, microsecond=0) if name == 'Day' else time)
+        if col_type == 'long':
+            return r.randint(1, 50)
+        if col_type == 'dynamic':
+            return json.dumps({'countryOrRegion': r.choice(['MY', 'SG', 'ID', 'NO']), 'city': r.choice(gen.CITIES)})
+        if name == 'Id':
+            return gen.guid(self.seed, 'la', r.random())
+        if 'userid' in name.lower():
+            return gen.guid(self.seed, 'user', r.randrange(self.scale['users']))
+        if 'upn' in name.lower() or 'userprincipalname' in name.lower():
+            return f"user{r.randrange(self.scale['users'])}@contoso.com"
+        if 'ip' in name.lower():
+            return f'10.{r.randrange(256)}.{r.randrange(256)}.{r.randrange(256)}'
+        if name == 'ResultType':
+            return r.choice(['0', '0', '0', '50126', '50140'])
+        if name in ('Country',):
+            return r.choice(['MY', 'SG', 'ID', 'NO'])
+        return f'{name} {r.randrange(20)}'
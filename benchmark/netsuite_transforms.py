@@ -0,0 +1,63 @@
+## Micro-benchmark of Netsuite role transforms on synthetic role catalogs
+## run from project root: python -m benchmark.netsuite_transforms
+import random, time
+import pandas as pd
+
+from module.netsuite import Netsuite
+
+## number of roles, the largest is well above our biggest role catalog
+SIZES = [1_000, 10_000, 100_000]
+SEGMENTS = [-101, -102, -103]
+RESTRICTIONS = ['Own', 'Own and Subordinates', 'Own, Subordinates and Unassigned']
+
+
+## roleRestrictions rows, 1-3 segments per role
+def make_restrictions(n_roles) -> pd.DataFrame:
+    rows = []
+    for role in range(n_roles):
+        for segment in random.sample(SEGMENTS, random.randint(1, 3)):
+            rows += [{
+                'viewingallowed' : random.choice(['T', 'F']),
+                'itemsrestricted': random.choice(['T', 'F']),
+                'restriction'    : random.choice(RESTRICTIONS),
+                'role'           : role,
+                'segment'        : segment
+            }]
+    return pd.DataFrame(rows)
+
+
+## roles with 1-50 effective subsidiaries
+def make_roles(n_roles) -> pd.DataFrame:
+    return pd.DataFrame({
+        'role_id': range(n_roles),
+        'role_effectivesubsidiaries': [', '.join(str(s) for s in random.sample(range(1, 200), random.randint(1, 50))) for _ in range(n_roles)]
+    })
+
+
+## best of n runs, in seconds
+def timeit(func, *args, repeat=3) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    random.seed(0)
+    ns = Netsuite('benchmark', '', '', '', '')
+
+    print(f"{'roles':>10} {'restriction rows':>17} {'encode (s)':>11} {'subsidiary rows':>16} {'explode (s)':>12}")
+    for n in SIZES:
+        restrictions_df = make_restrictions(n)
+        roles_df = make_roles(n)
+        t_encode  = timeit(ns.encode_role_restrictions, restrictions_df)
+        t_explode = timeit(ns.explode_role_subsidiaries, roles_df)
+        subsi_rows = len(ns.explode_role_subsidiaries(roles_df))
+        print(f'{n:>10} {len(restrictions_df):>17} {t_encode:>11.3f} {subsi_rows:>16} {t_explode:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+## End to end benchmark of the ETL pipelines against the mock sources and a local warehouse (SQLite or DuckDB), with regression tracking
+## run from project root: python -m benchmark.pipelines [--scales small,medium] [--pipelines save_to_warehouse,timer_update_ns]
+##   each (pipeline, scale) runs in its own interpreter, so that peak memory is its own
+##   results are appended to a JSON history (--history), and compared to the median of the last runs
+##   with the same pipeline, scale and options: exit code 1 if a metric regressed beyond its threshold
+##   --no-save : compare only, eg: while iterating on a change
+import argparse, json, os, subprocess, sys, tempfile, threading, time
+from datetime import datetime, timedelta
+from statistics import median
+from sqlalchemy import inspect
+
+from benchmark import generators as gen
+from benchmark.clients import MockCredential, azure_transport, LA_START
+from benchmark.mock_servers import GraphServer, NetsuiteServer, BolddeskServer, InfosecServer, LogsAnalyticsServer
+from benchmark.transport import MockTransport
+from module.metrics import get_peak_rss_mb, metrics_table
+
+HISTORY = os.path.join(os.path.dirname(__file__), 'history.json')
+
+## relative change allowed before a metric is a regression, and whether higher is better
+## http_requests is deterministic for a seed, unless throttled or fan-out workers race on the client caches
+THRESHOLDS = {
+    'wall_seconds' : (0.25, False),
+    'rows_per_sec' : (0.25, True),
+    'peak_rss_mb'  : (0.25, False),
+    'http_requests': (0.10, False),
+}
+
+
+## Local warehouse in place of Azure SQL, counting the rows loaded
+## rows are counted here rather than read from the metrics table, which holds measured tables only
+def get_warehouse(path, backend='sqlite'):
+    from module.warehouse import Warehouse, SQLiteBackend, DuckDBBackend
+
+    class BenchmarkWarehouse(Warehouse):
+        rows = 0
+        lock = threading.Lock()
+
+        def append(self, table_name, df) -> None:
+            if table_name != metrics_table:
+                with self.lock:
+                    self.rows += len(df)
+            super().append(table_name, df)
+
+        ## new tables are appended, and counted, by upsert
+        def upsert(self, table_name, df, keys) -> None:
+            if inspect(self.db_engine).has_table(table_name):
+                with self.lock:
+                    self.rows += len(df)
+            super().upsert(table_name, df, keys)
+
+    ## fan-out workers wait on each other writes
+    wh = BenchmarkWarehouse(backend=SQLiteBackend(path, timeout=60) if backend == 'sqlite' else DuckDBBackend(path))
+
+    ## control tables, created up front as in a deployed warehouse: concurrent workers would race to create them
+    wh.get_watermarks_table()
+    wh.get_run_state_table()
+    return wh
+
+
+## Pipelines, each a function(transport, wh) running the same code as its function app timer
+
+def run_save_to_warehouse(transport, wh):
+    from module.azure_ad import AzureAD
+    from module.idgov import save_to_warehouse
+    ad = AzureAD('mock-tenant', 'mock-client', 'mock-secret', http_adapter=transport)
+    save_to_warehouse(ad, None, wh=wh)
+
+def run_save_logs_to_warehouse(transport, wh):
+    from module.logsanalytics import LogsAnalytics
+    from module.idgov import save_logs_to_warehouse
+    la = LogsAnalytics('mock-workspace', MockCredential(), transport=azure_transport(transport))
+    save_logs_to_warehouse(la, None, time_span=(LA_START, timedelta(days=2)), include_raw=True, wh=wh)
+
+## AD users are merged with Netsuite employees and partners, loaded beforehand
+def setup_ns(transport, wh):
+    from module.azure_ad import AzureAD
+    wh.append('ad_users', AzureAD('mock-tenant', 'mock-client', 'mock-secret', http_adapter=transport).list_users())
+
+def get_netsuite(transport):
+    from module.netsuite import Netsuite
+    return Netsuite('1234567', 'key', 'secret', 'token', 'token_secret', http_adapter=transport)
+
+def run_timer_update_ns(transport, wh):
+    from module.idgov import run_save_jobs, get_ns_jobs, get_ns_merge_jobs
+    ns = get_netsuite(transport)
+    run_save_jobs(wh, 'timer_update_ns', get_ns_jobs(ns, wh) + get_ns_merge_jobs(ns, wh), time_budget=float('inf'))
+
+## fan-out mode, the in-memory queue workers standing for the queue_etl_worker instances
+def run_ns_fanout(transport, wh):
+    from module.idgov import start_fanout_run, process_work_item, get_ns_jobs, get_ns_merge_jobs
+    from module.workqueue import InMemoryWorkQueue
+    ns = get_netsuite(transport)
+    jobs, merge_jobs = get_ns_jobs(ns, wh), get_ns_merge_jobs(ns, wh)
+    queue = InMemoryWorkQueue()
+    start_fanout_run(queue, 'ns', [job[1] for job in jobs])
+    queue.run(lambda item, queue: process_work_item(item, wh, jobs, merge_jobs, queue))
+
+def run_timer_update_bd_care(transport, wh):
+    from module.bolddesk import Bolddesk
+    from module.idgov import save_bd_care_to_warehouse
+    save_bd_care_to_warehouse(Bolddesk('https://mock.bolddesk.com/api/v1/', 'mock-key', http_adapter=transport), wh)
+
+def run_timer_update_bd_helpdesk(transport, wh):
+    from module.bolddesk import Bolddesk
+    from module.idgov import save_bd_helpdesk_to_warehouse
+    save_bd_helpdesk_to_warehouse(Bolddesk('https://mock.bolddesk.com/api/v1/', 'mock-key', http_adapter=transport), wh)
+
+def run_timer_update_infosec(transport, wh):
+    from module.infosec import Infosec
+    from module.idgov import save_infosec_to_warehouse
+    save_infosec_to_warehouse(Infosec('https://securityiq-eu.infosecinstitute.com/api/v2', 'mock-key', http_adapter=transport), wh)
+
+## name -> (run, setup or None)
+PIPELINES = {
+    'save_to_warehouse'       : (run_save_to_warehouse,        None),
+    'save_logs_to_warehouse'  : (run_save_logs_to_warehouse,   None),
+    'timer_update_ns'         : (run_timer_update_ns,          setup_ns),
+    'ns_fanout'               : (run_ns_fanout,                setup_ns),
+    'timer_update_bd_care'    : (run_timer_update_bd_care,     None),
+    'timer_update_bd_helpdesk': (run_timer_update_bd_helpdesk, None),
+    'timer_update_infosec'    : (run_timer_update_infosec,     None),
+}
+
+
+## Run a pipeline once in this process, return its metrics
+## http_requests is counted by the transport and rows by the warehouse, setup excluded
+def run_pipeline(name, scale, latency=0.0, throttle=0.0, seed=0, warehouse='sqlite') -> dict:
+    run, setup = PIPELINES[name]
+    servers = [server(scale, seed) for server in (GraphServer, NetsuiteServer, BolddeskServer, InfosecServer, LogsAnalyticsServer)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wh = get_warehouse(os.path.join(temp_dir, 'warehouse.db'), warehouse)
+        if setup:
+            setup(MockTransport(servers), wh)
+            wh.rows = 0
+
+        transport = MockTransport(servers, latency=latency, throttle_rate=throttle, seed=seed)
+        start = time.perf_counter()
+        run(transport, wh)
+        wall_seconds = time.perf_counter() - start
+
+        wh.db_engine.dispose()
+
+    return {
+        'wall_seconds' : round(wall_seconds, 3),
+        'http_requests': transport.stats['requests'],
+        'rows'         : wh.rows,
+        'rows_per_sec' : round(wh.rows / wall_seconds, 1) if wall_seconds else None,
+        'peak_rss_mb'  : round(get_peak_rss_mb() or 0, 1),
+    }
+
+
+## Run a pipeline in a fresh interpreter, return its metrics
+def run_isolated(name, scale, options) -> dict:
+    command = [sys.executable, '-m', 'benchmark.pipelines', '--run', name, '--scales', scale,
+               '--latency', str(options['latency']), '--throttle', str(options['throttle']), '--seed', str(options['seed']),
+               '--warehouse', options['warehouse']]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{name} ({scale}) failed:\n{result.stderr.strip()}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def load_history(path) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_history(path, history) -> None:
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp_path, path)
+
+def get_commit() -> str:
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+## Median of each metric over the last runs of the same pipeline, scale and options, None if no runs
+def get_baseline(history, pipeline, scale, options, runs=5):
+    entries = [e for e in history if e['pipeline'] == pipeline and e['scale'] == scale and e['options'] == options][-runs:]
+    if not entries:
+        return None
+    return {name: median(e['metrics'][name] for e in entries) for name in THRESHOLDS if all(e['metrics'].get(name) is not None for e in entries)}
+
+
+## [(metric, baseline, value, change)] of the metrics regressed beyond their threshold
+def get_regressions(metrics, baseline, threshold=None) -> list:
+    regressions = []
+    for name, (limit, higher_is_better) in THRESHOLDS.items():
+        if not baseline.get(name) or metrics.get(name) is None:
+            continue
+        if threshold is not None and name != 'http_requests':
+            limit = threshold
+        change = (metrics[name] - baseline[name]) / baseline[name]
+        if (-change if higher_is_better else change) > limit:
+            regressions += [(name, baseline[name], metrics[name], change)]
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', default='small', help=f"comma separated, of: {','.join(gen.SCALES)}")
+    parser.add_argument('--pipelines', default=','.join(PIPELINES))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--throttle', type=float, default=0.0, help='share of requests answered 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warehouse', default='sqlite', choices=['sqlite', 'duckdb'], help='local warehouse backend, duckdb needs duckdb and duckdb-engine')
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--baseline-runs', type=int, default=5, help='last runs the baseline is the median of')
+    parser.add_argument('--threshold', type=float, help='relative change allowed for time, throughput and memory, default 0.25')
+    parser.add_argument('--no-save', action='store_true', help='do not append results to the history')
+    parser.add_argument('--run', help=argparse.SUPPRESS)  ## single pipeline in this process, used by run_isolated()
+    args = parser.parse_args()
+
+    options = {'latency': args.latency, 'throttle': args.throttle, 'seed': args.seed, 'warehouse': args.warehouse}
+    if args.run:
+        print(json.dumps(run_pipeline(args.run, args.scales, **options)))
+        return
+
+    history, commit, failed = load_history(args.history), get_commit(), False
+    print(f"{'pipeline':<26} {'scale':<7} {'seconds':>9} {'requests':>9} {'rows':>9} {'rows/s':>9} {'MB':>7}  vs baseline")
+    for scale in args.scales.split(','):
+        for pipeline in args.pipelines.split(','):
+            metrics = run_isolated(pipeline, scale, options)
+            baseline = get_baseline(history, pipeline, scale, options, args.baseline_runs)
+            regressions = get_regressions(metrics, baseline, args.threshold) if baseline else []
+
+            status = 'no baseline' if baseline is None else 'REGRESSED' if regressions else 'ok'
+            print(f"{pipeline:<26} {scale:<7} {metrics['wall_seconds']:>9.2f} {metrics['http_requests']:>9} {metrics['rows']:>9} {metrics['rows_per_sec'] or 0:>9.0f} {metrics['peak_rss_mb']:>7.0f}  {status}")
+            for name, before, after, change in regressions:
+                print(f'    {name}: {before:g} -> {after:g} ({change:+.0%})')
+            failed = failed or bool(regressions)
+
+            history += [{'timestamp': datetime.utcnow().isoformat(timespec='seconds'), 'commit': commit,
+                         'pipeline': pipeline, 'scale': scale, 'options': options, 'metrics': metrics}]
+
+    if not args.no_save:
+        save_history(args.history, history)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
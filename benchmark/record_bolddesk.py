@@ -0,0 +1,29 @@
+## Record the live Bolddesk responses of a ticket enrichment to a cassette, replayed by test/test_bolddesk.py
+## run from project root, with a closed ticket whose status changed at least once:
+##   BD_BASE_URL=https://xxx.bolddesk.com/api/v1/ BD_API_KEY=... python -m benchmark.record_bolddesk 12345
+## request headers (the API key) are never saved, see benchmark.transport.RecordTransport
+import argparse, os
+from benchmark.transport import RecordTransport
+from module.bolddesk import Bolddesk
+
+default_path = os.path.join('test', 'cassettes', 'bolddesk_ticket.json.gz')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ticket_id', type=int)
+    parser.add_argument('--path', default=default_path, help='cassette to record')
+    args = parser.parse_args()
+
+    transport = RecordTransport(args.path)
+    bd = Bolddesk(os.environ['BD_BASE_URL'], os.environ['BD_API_KEY'], http_adapter=transport)
+    tables = bd.enrich_tickets([args.ticket_id], max_workers=1)
+    transport.save()
+
+    print(f'recorded {len(transport.interactions)} interactions to {args.path}')
+    for name, df in tables.items():
+        print(f'{name}: {len(df)} rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+## HTTP transports for offline benchmarks, mounted by the source clients in place of requests HTTPAdapter
+##   MockTransport   : routes requests to local mock servers (benchmark.mock_servers), no network
+##   RecordTransport : sends requests through another transport (real HTTPAdapter by default) and records them to a cassette
+##   ReplayTransport : serves the interactions of a cassette, no network
+## a transport is an adapter factory: Bolddesk(..., http_adapter=transport) calls transport(max_retries=...) per session
+## the clients retry policy (urllib3 Retry) is applied the same way as by HTTPAdapter, throttled requests included
+import gzip, hashlib, io, json, os, random, threading, time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, RetryError
+from urllib3.exceptions import MaxRetryError
+from urllib3.response import HTTPResponse
+
+
+## Base transport: simulated latency and throttling on top of handle(request) -> (status, headers, body)
+class Transport:
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_rate=0.0, retry_after=1, seed=0) -> None:
+        self.latency       = latency        ## seconds added to every response
+        self.jitter        = jitter         ## +/- seconds of random latency
+        self.throttle_rate = throttle_rate  ## share of requests answered 429 with Retry-After
+        self.retry_after   = retry_after    ## Retry-After seconds of throttled requests, whole seconds only
+        self.random = random.Random(seed)
+        self.lock   = threading.Lock()
+        self.stats  = {'requests': 0, 'throttled': 0, 'bytes': 0}
+
+    ## adapter factory, same arguments as HTTPAdapter
+    def __call__(self, **kwargs) -> HTTPAdapter:
+        return TransportAdapter(self, **kwargs)
+
+    ## (status, headers, body bytes) of a request
+    def handle(self, request) -> tuple:
+        raise NotImplementedError
+
+    ## handle a request with simulated latency and throttling
+    def send(self, request) -> tuple:
+        with self.lock:
+            self.stats['requests'] += 1
+            delay     = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            throttled = self.random.random() < self.throttle_rate
+            if throttled:
+                self.stats['throttled'] += 1
+        if delay:
+            time.sleep(delay)
+        if throttled:
+            return 429, {'Retry-After': str(self.retry_after), 'Content-Type': 'application/json'}, b'{"error": "Too Many Requests"}'
+
+        status, headers, body = self.handle(request)
+        with self.lock:
+            self.stats['bytes'] += len(body)
+        return status, headers, body
+
+
+## requests adapter of a transport, applies max_retries to throttled and failed statuses like urllib3 does
+class TransportAdapter(HTTPAdapter):
+
+    def __init__(self, transport, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.transport = transport
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        retries = self.max_retries
+        while True:
+            status, headers, body = self.transport.send(request)
+            raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, preload_content=False,
+                               decode_content=False, request_method=request.method, request_url=request.url)
+            if not retries.is_retry(request.method, status, 'Retry-After' in headers):
+                return self.build_response(request, raw)
+            try:
+                retries = retries.increment(method=request.method, url=request.url, response=raw)
+            except MaxRetryError as e:
+                if retries.raise_on_status:
+                    raise RetryError(e, request=request)
+                return self.build_response(request, raw)
+            retries.sleep(raw)
+
+
+## Routes requests to mock servers by host, see benchmark.mock_servers
+class MockTransport(Transport):
+
+    def __init__(self, servers, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.servers = servers
+
+    def handle(self, request) -> tuple:
+        host = urlsplit(request.url).hostname
+        server = next((s for s in self.servers if s.matches(host)), None)
+        if server is None:
+            raise ConnectionError(f'MockTransport: no mock server for {host}', request=request)
+        return server.handle(request)
+
+
+## Key of a request in a cassette: method, url with sorted query string, hash of the (json normalised) body
+def request_key(request) -> str:
+    parts = urlsplit(request.url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    url   = urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+    body = request.body or b''
+    body = body.encode() if isinstance(body, str) else body
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True).encode()
+    except ValueError:
+        pass
+    digest = hashlib.sha1(body).hexdigest() if body else ''
+    return f'{request.method} {url} {digest}'
+
+
+## Cassette file: {"interactions": [{"key", "status", "headers", "body", "elapsed"}]}, gzip compressed if path ends with .gz
+## request headers are never saved, they hold the credentials
+def load_cassette(path) -> list:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)['interactions']
+
+
+def save_cassette(path, interactions) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    opener = gzip.open if path.endswith('.gz') else open
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with opener(temp_path, 'wt', encoding='utf-8') as f:
+        json.dump({'interactions': interactions}, f)
+    os.replace(temp_path, path)
+
+
+## Records interactions of another transport, real network by default, cassette is written by save()
+class RecordTransport(Transport):
+
+    def __init__(self, path, inner=HTTPAdapter, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path  = path
+        self.inner = inner()  ## single adapter, no retries: every attempt is recorded as is
+        self.interactions = []
+
+    def handle(self, request) -> tuple:
+        start = time.perf_counter()
+        response = self.inner.send(request)
+        elapsed = time.perf_counter() - start
+        headers = {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'retry-after', 'location')}
+        with self.lock:
+            self.interactions += [{
+                'key'    : request_key(request),
+                'status' : response.status_code,
+                'headers': headers,
+                'body'   : response.content.decode('utf-8', errors='replace'),
+                'elapsed': round(elapsed, 4)
+            }]
+        return response.status_code, headers, response.content
+
+    def save(self) -> None:
+        save_cassette(self.path, self.interactions)
+
+
+## Replays a cassette, repeated requests get their recorded responses in order, the last one is served again
+## latency='recorded' sleeps the recorded response time (times time_scale), otherwise latency/jitter apply
+class ReplayTransport(Transport):
+
+    def __init__(self, path, latency=0.0, time_scale=1.0, **kwargs) -> None:
+        super().__init__(latency=0.0 if latency == 'recorded' else latency, **kwargs)
+        self.recorded_latency = latency == 'recorded'
+        self.time_scale = time_scale
+        self.responses  = {}  ## key -> recorded responses, in order
+        self.served     = {}  ## key -> responses served so far
+        for interaction in load_cassette(path):
+            self.responses.setdefault(interaction['key'], []).append(interaction)
+
+    def handle(self, request) -> tuple:
+        key = request_key(request)
+        with self.lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                raise ConnectionError(f'ReplayTransport: no recorded interaction for {key}', request=request)
+            index = self.served.get(key, 0)
+            self.served[key] = index + 1
+        interaction = recorded[min(index, len(recorded) - 1)]
+        if self.recorded_latency:
+            time.sleep(interaction['elapsed'] * self.time_scale)
+        return interaction['status'], interaction['headers'], interaction['body'].encode('utf-8')
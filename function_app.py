@@ -1,9 +1,6 @@
 import azure.functions as func
-import logging, os
+import logging, os, tempfile, typing
 from datetime import datetime, timezone, timedelta
-from azure.keyvault.secrets import SecretClient
-from azure.identity import DefaultAzureCredential
-import pandas as pd
 
 from sys import path
 path.insert(0, 'module')
@@ -11,18 +8,18 @@ path.insert(0, 'module')
 app = func.FunctionApp()
 
 ## custom application modules
-from module.bolddesk  import Bolddesk
-from module.azure_ad  import AzureAD
-from module.netsuite  import Netsuite
-from module.warehouse import Warehouse
-from module.infosec   import Infosec 
-from module.idgov     import save_to_warehouse, add_new_user_to_bd, deactivate_invalid_agent
+## source modules (and pandas, sqlalchemy, msal, ...) are imported inside each function,
+## so a cold start only loads what the triggered function needs
+from module.keyvault  import get_credential, get_secrets
 # from module.google_sheet import GoogleSheet
 
 
 ## disable HTTP Logging
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.WARNING)
 
+## local cache folder, kept between invocations on a warm host
+cache_dir = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'idgov'))
+
 
 ## AD Weekly Jobs
 ## Schedule: Every Monday at :00 9am
@@ -32,25 +29,26 @@ logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(l
 def timer_update_ad_weekly(mytimer: func.TimerRequest) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_AD_WEEKLY: triggered.')    
 
+    ## load source modules
+    from module.azure_ad  import AzureAD
+    from module.warehouse import Warehouse
+    from module.metrics   import RunMetrics
+
     ###########################
     ## AD and Bolddesk
     ###########################
 
     ## credential obtained from managed identity or azure login, to access azure SQL and KV
-    def_credential = DefaultAzureCredential()
-
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    def_credential = get_credential()
 
     ## Secret Keys for Azure App Registration
-    tenant_id = kv_client.get_secret('azure-tenant-id').value
-    client_id = kv_client.get_secret('idgov-app-client-id').value
-    client_secret = kv_client.get_secret('idgov-app-client-secret').value
+    secrets = get_secrets(['azure-tenant-id', 'idgov-app-client-id', 'idgov-app-client-secret'])
+    tenant_id = secrets['azure-tenant-id']
+    client_id = secrets['idgov-app-client-id']
+    client_secret = secrets['idgov-app-client-secret']
 
     ## Initialize AD and Warehouse API Module
-    ad = AzureAD(tenant_id, client_id, client_secret)
+    ad = with_snapshots(AzureAD(tenant_id, client_id, client_secret), 'ad')
     wh = Warehouse(
         server=os.environ["DB_SERVER"],
         database=os.environ["DB_NAME"],
@@ -58,9 +56,12 @@ def timer_update_ad_weekly(mytimer: func.TimerRequest) -> None:
     )
 
     ## Update One Drive Usage
+    metrics = RunMetrics('timer_update_ad_weekly')
     table_name = 'ad_onedrive_usage'
-    df = ad.list_one_drive_usage()
-    wh.refresh_table_rows(table_name, df, column_name='refresh_date', value=df.refresh_date[0])
+    with metrics.table(table_name):
+        df = ad.list_one_drive_usage()
+        wh.refresh_table_rows(table_name, df, column_name='refresh_date', value=df.refresh_date[0])
+    metrics.save(wh)
 
     ## completed
     logging.info('\TIMER_UPDATE_AD_WEEKLY: completed.\n===========================================')
@@ -74,29 +75,29 @@ def timer_update_ad_weekly(mytimer: func.TimerRequest) -> None:
 def timer_update_ad(mytimer: func.TimerRequest) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_AD_BD: triggered.')    
 
+    ## load source modules
+    from module.azure_ad  import AzureAD
+    from module.idgov     import save_to_warehouse
+
     ###########################
     ## AD and Bolddesk
     ###########################
 
     ## credential obtained from managed identity or azure login, to access azure SQL and KV
-    def_credential = DefaultAzureCredential()
-
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    def_credential = get_credential()
 
     ## Secret Keys for Azure App Registration
-    tenant_id = kv_client.get_secret('azure-tenant-id').value
-    client_id = kv_client.get_secret('idgov-app-client-id').value
-    client_secret = kv_client.get_secret('idgov-app-client-secret').value
+    secrets = get_secrets(['azure-tenant-id', 'idgov-app-client-id', 'idgov-app-client-secret'])
+    tenant_id = secrets['azure-tenant-id']
+    client_id = secrets['idgov-app-client-id']
+    client_secret = secrets['idgov-app-client-secret']
 
     # ## Secret Keys for Bolddesk
     # bd_api_key = kv_client.get_secret('bolddesk-nera-it-api-key').value
     # bd_base_url = kv_client.get_secret('bolddesk-nera-it-api-base-url').value
 
     ## Initialize AD and Bolddesk API Module
-    ad = AzureAD(tenant_id, client_id, client_secret)
+    ad = with_snapshots(AzureAD(tenant_id, client_id, client_secret), 'ad')
     # bd = Bolddesk(bd_base_url, bd_api_key)
     
     ## run the jobs
@@ -108,50 +109,61 @@ def timer_update_ad(mytimer: func.TimerRequest) -> None:
     logging.info('\nTIMER_UPDATE_AD_BD: completed.\n===========================================')
 
 
+## Log Analytics ETL
+## Schedule: Hourly at :50 9am-6pm UTC, Monday - Friday
+@app.function_name(name="timer_update_logs")
+@app.schedule(schedule="0 50 1-10 * * 1-5", arg_name="mytimer", run_on_startup=False) 
+def timer_update_logs(mytimer: func.TimerRequest) -> None:
+    logging.info('\n===========================================\nTIMER_UPDATE_LOGS: triggered.')
+
+    ## load source modules
+    from module.logsanalytics import LogsAnalytics
+    from module.idgov     import save_logs_to_warehouse
+
+    ## credential obtained from managed identity or azure login, to access azure SQL and Log Analytics
+    def_credential = get_credential()
+
+    ## Initialize Log Analytics
+    la = with_snapshots(LogsAnalytics(logs_id=os.environ["LOGS_ANALYTICS_ID"], credential=def_credential), 'la')
+
+    ## rollups always, raw sign-in/audit logs streamed only if enabled, under the memory ceiling (MB)
+    include_raw = os.environ.get('LOGS_INCLUDE_RAW', 'false').lower() == 'true'
+    max_bytes   = int(os.environ.get('LOGS_MAX_MB', '256')) * 1024**2
+    save_logs_to_warehouse(la, def_credential, include_raw=include_raw, max_bytes=max_bytes)
+
+    logging.info('\nTIMER_UPDATE_LOGS: completed.\n===========================================')
+
+
 ## BD Nera Care ETL 
 ## Schedule: Hourly at :30 9am-6pm UTC, Monday - Friday
 @app.function_name(name="timer_update_bd_care")
 @app.schedule(schedule="0 30 1-10 * * 1-5", arg_name="mytimer", run_on_startup=False) 
 def timer_update_bd_care(mytimer: func.TimerRequest) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_NERA_CARE: triggered.')    
+
+    ## load source modules
+    from module.bolddesk  import Bolddesk
+    from module.warehouse import Warehouse
+    from module.idgov     import save_bd_care_to_warehouse
     
     ## default credential
-    def_credential = DefaultAzureCredential()  
-
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    def_credential = get_credential()
 
     ## Secret Keys for Bolddesk
-    bd_api_key = kv_client.get_secret ('bolddesk-nera-care-api-key').value
-    bd_base_url = kv_client.get_secret('bolddesk-nera-care-api-base-url').value
+    secrets = get_secrets(['bolddesk-nera-care-api-key', 'bolddesk-nera-care-api-base-url'])
+    bd_api_key = secrets['bolddesk-nera-care-api-key']
+    bd_base_url = secrets['bolddesk-nera-care-api-base-url']
 
     ## Initialize Bolddesk and Warehouse API Module
-    bd = Bolddesk(bd_base_url, bd_api_key)
+    bd = with_snapshots(Bolddesk(bd_base_url, bd_api_key, timezone_cache=os.path.join(cache_dir, 'bd_nera_care_timezones.json')), 'bd_care')
     wh = Warehouse(
             server=os.environ["DB_SERVER"],
             database=os.environ["DB_NAME"],
             credential=def_credential
     )
 
-    ## Contacts
-    df = bd.list_contacts()
-    table_name = 'bd_nera_care_contacts'
-    wh.erase(table_name)
-    wh.append(table_name, df)
-
-    ## Agents
-    df = bd.list_agents()
-    table_name = 'bd_nera_care_agents'
-    wh.erase(table_name)
-    wh.append(table_name, df)
-
-    ## Tickets
-    df = bd.list_tickets()
-    table_name = 'bd_nera_care_tickets'
-    wh.erase(table_name)
-    wh.append(table_name, df)
+    ## contacts, agents and tickets
+    save_bd_care_to_warehouse(bd, wh)
 
     logging.info('\nTIMER_UPDATE_NERA_CARE: completed.\n===========================================')
 
@@ -163,129 +175,149 @@ def timer_update_bd_care(mytimer: func.TimerRequest) -> None:
 def timer_update_bd_helpdesk(mytimer: func.TimerRequest) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_IT_HELPDESK: triggered.')
 
-    ## credential obtained from managed identity or azure login, to access azure SQL and KV
-    def_credential = DefaultAzureCredential()
+    ## load source modules
+    from module.bolddesk  import Bolddesk
+    from module.warehouse import Warehouse
+    from module.idgov     import save_bd_helpdesk_to_warehouse
 
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    ## credential obtained from managed identity or azure login, to access azure SQL and KV
+    def_credential = get_credential()
 
     ## Secret Keys for Bolddesk
-    bd_api_key  = kv_client.get_secret('bolddesk-nera-it-api-key').value
-    bd_base_url = kv_client.get_secret('bolddesk-nera-it-api-base-url').value
+    secrets = get_secrets(['bolddesk-nera-it-api-key', 'bolddesk-nera-it-api-base-url'])
+    bd_api_key  = secrets['bolddesk-nera-it-api-key']
+    bd_base_url = secrets['bolddesk-nera-it-api-base-url']
 
     ## Initialize Warehouse and Bolddesk
-    bd = Bolddesk(bd_base_url, bd_api_key)
+    bd = Bolddesk(bd_base_url, bd_api_key, timezone_cache=os.path.join(cache_dir, 'bd_helpdesk_timezones.json'))
+    bd = with_snapshots(bd, 'bd_helpdesk')
     wh = Warehouse(
         server=os.environ["DB_SERVER"],
         database=os.environ["DB_NAME"],
         credential=def_credential
     )
 
-    ##################
-    ### Tickets
-    ##################
-
-    ## get tickets
-    df = bd.list_tickets()
-
-    ## fix datetime columns
-    date_cols = ['cf_last_date_of_service', 'cf_last_day_of_retention', 'resolutionDue', 'createdOn', 'closedOn', 'responseDue', 'lastRepliedOn', 'lastUpdatedOn', 'lastStatusChangedOn',]
-    for col in date_cols:
-        df[col] = pd.to_datetime(df[col]).dt.tz_localize(None)
-
-    ## write to SQL
-    table_name = 'bd_helpdesk_tickets'
-    wh.erase(table_name)
-    wh.append(table_name, df)
+    ## tickets, details, custom fields and status history
+    ## enrichment is opt-in (BD_HELPDESK_ENRICH=1) until its endpoints are checked against a recorded response
+    save_bd_helpdesk_to_warehouse(bd, wh, enrich=os.environ.get('BD_HELPDESK_ENRICH') == '1')
 
     logging.info('\nTIMER_UPDATE_IT_HELPDESK: completed.\n===========================================')
 
 
 ## Netsuite ETL
 ## Schedule: Daily at 7am
+## with ETL_FANOUT=1, tables are put on the etl-work queue instead, for queue_etl_worker to process in parallel
 @app.function_name(name="timer_update_ns")
 @app.schedule(schedule="0 10 1-10 * * 1-5", arg_name="mytimer", run_on_startup=False) 
-def timer_update_ns(mytimer: func.TimerRequest) -> None:
+@app.queue_output(arg_name="work", queue_name="etl-work", connection="AzureWebJobsStorage")
+def timer_update_ns(mytimer: func.TimerRequest, work: func.Out[typing.List[str]]) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_NS: triggered.')    
-    
-    ## credential obtained from managed identity or azure login, to access azure SQL and KV
-    def_credential = DefaultAzureCredential()
 
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    if os.environ.get('ETL_FANOUT') == '1':
+        from module.idgov     import start_fanout_run, get_ns_jobs
+        from module.workqueue import StorageWorkQueue
+        ## one item per job queue_etl_worker runs, merge jobs run by the worker completing the last one
+        jobs = get_ns_jobs(get_netsuite(), get_warehouse())
+        start_fanout_run(StorageWorkQueue(work), 'ns', [job[1] for job in jobs])
+    else:
+        update_ns()
+    logging.info('\nTIMER_UPDATE_NS: completed.\n===========================================')
 
-    ## Secret Keys for Netsuite
-    account_id       = kv_client.get_secret('netsuite-account-id').value
-    consumer_key     = kv_client.get_secret('netsuite-consumer-key').value
-    consumer_secret  = kv_client.get_secret('netsuite-consumer-secret').value
-    token_id         = kv_client.get_secret('netsuite-token-id').value
-    token_secret     = kv_client.get_secret('netsuite-token-secret').value
-    # gcp_dashboard_bot_key = kv_client.get_secret('gcp-dashboard-bot-key').value
 
-    ## Initialize Netsuite
-    ns = Netsuite(account_id, consumer_key, consumer_secret, token_id, token_secret, script=1740)
+## Netsuite ETL continuation, resumes a run paused by its time budget or killed by the host timeout
+## Schedule: Every 5 minutes from :02 9am-7pm UTC, Monday - Friday, never at the same time as timer_update_ns (:10)
+@app.function_name(name="timer_update_ns_continue")
+@app.schedule(schedule="0 2-59/5 1-11 * * 1-5", arg_name="mytimer", run_on_startup=False) 
+def timer_update_ns_continue(mytimer: func.TimerRequest) -> None:
+    logging.info('\n===========================================\nTIMER_UPDATE_NS_CONTINUE: triggered.')    
+    update_ns(resume_only=True)
+    logging.info('\nTIMER_UPDATE_NS_CONTINUE: completed.\n===========================================')
 
-    ## initialize Warehouse
-    wh = Warehouse(
+
+## ETL fan-out worker, one table per message, scales out with function instances
+@app.function_name(name="queue_etl_worker")
+@app.queue_trigger(arg_name="item", queue_name="etl-work", connection="AzureWebJobsStorage")
+@app.queue_output(arg_name="work", queue_name="etl-work", connection="AzureWebJobsStorage")
+def queue_etl_worker(item: func.QueueMessage, work: func.Out[typing.List[str]]) -> None:
+
+    ## load source modules
+    from module.idgov     import process_work_item, get_ns_jobs, get_ns_merge_jobs
+    from module.workqueue import StorageWorkQueue
+
+    work_item = item.get_json()
+    logging.info(f'QUEUE_ETL_WORKER: {work_item}')
+
+    wh = get_warehouse()
+    if work_item['source'] == 'ns':
+        ns = get_netsuite()
+        process_work_item(work_item, wh, get_ns_jobs(ns, wh), get_ns_merge_jobs(ns, wh), StorageWorkQueue(work))
+
+
+## Warehouse of the ETL tables
+def get_warehouse():
+    from module.warehouse import Warehouse
+    return Warehouse(
         server=os.environ["DB_SERVER"],
         database=os.environ["DB_NAME"],
-        credential=def_credential
+        credential=get_credential()
     )
 
-    save_list = [
-        ('Processing ns_subsidiaries',         'ns_subsidiaries',         'list_subsidiaries'),       
-        ('Processing ns_roles',                'ns_roles',                'list_roles'),       
-        ('Processing ns_role_record_usage',    'ns_role_record_usage',    'list_role_record_usage'),
-        ('Processing ns_role_permissions',     'ns_role_permissions',     'list_role_permissions'),
-        ('Processing ns_role_subsidiaries',    'ns_role_subsidiaries',    'list_role_subsidiaries'),
-        ('Processing ns_employee_roles',       'ns_employee_roles',       'list_employee_roles'),
-        ('Processing ns_employee_license',     'ns_employee_license',     'list_employee_license'),
-        ('Processing ns_partner_roles',        'ns_partner_roles',        'list_partner_roles'),
-        ('Processing ns_login_audits',         'ns_login_audits',         'list_login_audits'),
-        ('Processing ns_login_failure',         'ns_login_failure',       'list_login_failure'),
-        ('Processing ns_union_employees_partners','ns_union_employees_partners', 'union_employees_partners'),
-        ('Processing ns_approval_matrix',      'ns_approval_matrix',      'list_approval_matrix'),
-        ('Processing ns_employee_all',         'ns_employee_all',         'list_employee_all'),
-        ('Processing ns_scripts',              'ns_scripts',              'list_scripts'),
-        ('Processing ns_client_scripts',              'ns_client_scripts',            'list_client_scripts'),
-        ('Processing ns_client_script_deployments',   'ns_client_script_deployments', 'list_client_script_deployments'),
-        ('Processing ns_script_logs',             'ns_script_logs', 'list_script_logs')
-    ]
-
-    ## run all saving jobs
-    for job in save_list:
-        logging.info(job[0])
-        ## Get Data
-        list_func = getattr(ns, job[2])
-        df = list_func()
-        ## refresh table 
-        wh.erase (job[1])
-        wh.append(job[1], df)
-
-    ## merge Netsuite Active Employees and AD users (ns_employees_ad_users)
-    ## This is a outer join, we are expecting all AD users to be Employees
-    table_name = 'ns_employees_ad_users'
-    users_df    = wh.get_table('ad_users')\
-                    .drop(columns=['id','passwordProfile_forceChangePasswordNextSignInWithMfa','passwordProfile_forceChangePasswordNextSignIn'])
-    users_df.columns = [ 'ad_'+c for c in users_df.columns]
-    employee_df = ns.list_employees(giveaccess_only=False, refresh=True, active_only=True)
-    df = pd.merge(employee_df, users_df, how='outer', left_on='email', right_on='ad_userPrincipalName')
-    wh.erase(table_name)
-    wh.append(table_name, df)
-
-    ## merge Netsuite Partners and AD users (ns_partners_ad_users)
-    ## This is a left join, not all AD users should be partners
-    table_name = 'ns_partners_ad_users'
-    partners_df = ns.list_partners(giveaccess_only=False, refresh=True)
-    df = pd.merge(partners_df, users_df, how='left', left_on='email', right_on='ad_userPrincipalName')
-    wh.erase(table_name)
-    wh.append(table_name, df)
 
-    logging.info('\nTIMER_UPDATE_NS: completed.\n===========================================')
+## Parquet snapshots of the list_* results of a source (module.snapshot), opt-in:
+##   SNAPSHOT_DIR       : local folder
+##   SNAPSHOT_CONTAINER : blob container of the AzureWebJobsStorage account, under SNAPSHOT_PREFIX
+## the source is returned as is if not enabled
+## needs pyarrow, and azure-storage-blob for SNAPSHOT_CONTAINER: copy them from requirements-optional.txt to requirements.txt
+def with_snapshots(source, source_name):
+    if not (os.environ.get('SNAPSHOT_DIR') or os.environ.get('SNAPSHOT_CONTAINER')):
+        return source
+
+    from module.snapshot import SnapshotStore, SnapshotSource
+    if os.environ.get('SNAPSHOT_DIR'):
+        store = SnapshotStore(os.environ['SNAPSHOT_DIR'])
+    else:
+        from azure.storage.blob import ContainerClient
+        container = ContainerClient.from_connection_string(os.environ['AzureWebJobsStorage'], os.environ['SNAPSHOT_CONTAINER'])
+        store = SnapshotStore(os.environ.get('SNAPSHOT_PREFIX', ''), container=container)
+    return SnapshotSource(source, source_name, store)
+
+
+## Netsuite source, credentials from Key Vault
+def get_netsuite():
+    from module.netsuite import Netsuite
+
+    ## Secret Keys for Netsuite
+    secrets = get_secrets(['netsuite-account-id', 'netsuite-consumer-key', 'netsuite-consumer-secret', 'netsuite-token-id', 'netsuite-token-secret'])
+    account_id       = secrets['netsuite-account-id']
+    consumer_key     = secrets['netsuite-consumer-key']
+    consumer_secret  = secrets['netsuite-consumer-secret']
+    token_id         = secrets['netsuite-token-id']
+    token_secret     = secrets['netsuite-token-secret']
+    # gcp_dashboard_bot_key = kv_client.get_secret('gcp-dashboard-bot-key').value
+
+    ns = Netsuite(account_id, consumer_key, consumer_secret, token_id, token_secret, script=1740, query_cache=os.path.join(cache_dir, 'ns_queries'))
+    return with_snapshots(ns, 'ns')
+
+
+## Netsuite tables refresh, progress kept in the run-state ledger (etl_run_state)
+## each invocation stops before exceeding NS_TIME_BUDGET seconds (host functionTimeout is 20 minutes)
+def update_ns(resume_only=False) -> None:
+
+    ## load source modules
+    from module.idgov import run_save_jobs, get_resumable_run, get_ns_jobs, get_ns_merge_jobs
+
+    wh = get_warehouse()
+
+    ## continuation only, when there is a run to resume
+    run_name = 'timer_update_ns'
+    if resume_only and get_resumable_run(wh, run_name) is None:
+        logging.info('update_ns(): nothing to resume')
+        return
+
+    ## run all saving jobs, resuming the last run if it did not complete
+    ns = get_netsuite()
+    jobs = get_ns_jobs(ns, wh) + get_ns_merge_jobs(ns, wh)
+    run_save_jobs(wh, run_name, jobs, time_budget=float(os.environ.get('NS_TIME_BUDGET', 900)))
 
 
 # ## Infosec ETL
@@ -341,19 +373,21 @@ def timer_update_ns(mytimer: func.TimerRequest) -> None:
 @app.schedule(schedule="0 40 1 * * 1-5", arg_name="mytimer", run_on_startup=False) 
 def timer_update_infosec(mytimer: func.TimerRequest) -> None:
     logging.info('\n===========================================\nTIMER_UPDATE_INFOSEC: triggered.')    
-    def_credential = DefaultAzureCredential()  
 
-    ## connect to Azure Key Vault securely
-    keyVaultName = os.environ["KEY_VAULT_NAME"]
-    KVUri = f"https://{keyVaultName}.vault.azure.net"
-    kv_client = SecretClient(vault_url=KVUri, credential=def_credential)
+    ## load source modules
+    from module.infosec   import Infosec
+    from module.warehouse import Warehouse
+    from module.idgov     import save_infosec_to_warehouse
+
+    def_credential = get_credential()
 
     ## Secret Keys for Infosec
-    api_key       = kv_client.get_secret('infosec-api-key').value
+    secrets = get_secrets(['infosec-api-key'])
+    api_key       = secrets['infosec-api-key']
 
     ## Initialize Module
     url = 'https://securityiq-eu.infosecinstitute.com/api/v2'
-    ifs = Infosec(url, api_key)
+    ifs = with_snapshots(Infosec(url, api_key, run_cache=os.path.join(cache_dir, 'infosec_runs')), 'infosec')
 
     ## initialize warehouse
     wh = Warehouse(
@@ -361,33 +395,9 @@ def timer_update_infosec(mytimer: func.TimerRequest) -> None:
         database=os.environ["DB_NAME"],
         credential=def_credential
     )
-    ##task name; db table name; method name to get info from infosec
-    save_list = [
-        ('saving ifs_learners',         'ifs_learners',         'list_learners'), 
-        ('saving ifs_campaigns',        'ifs_campaigns',        'list_campaigns'), 
-        ('saving ifs_learner_progress',  'ifs_learner_progress','list_learner_progress') 
-    ]
-
-        ## run all saving jobs
-    for job in save_list:
-        logging.info(job[0])
-        ## Get Data
-        list_func = getattr(ifs, job[2])
-        df = list_func()
-        ## refresh table 
-        wh.erase(job[1])
-        wh.append(job[1], df)
-
-    save_git = [
-        ('saving git_ifs_learner_progress',  'ifs_learner_progress','list_timeline_events')         
-    ]
-    for job in save_git:
-        logging.info(job[0])
-        ## Get Data
-        list_func = getattr(ifs, job[2])
-        df = list_func()
-        ## refresh table 
-        wh.append(job[1], df)
+
+    ## learners, campaigns and learner progress
+    save_infosec_to_warehouse(ifs, wh)
 
     ## completed
     logging.info('\nTIMER_UPDATE_INFOSEC: completed.\n===========================================')
\ No newline at end of file
@@ -2,34 +2,31 @@ from msal import ConfidentialClientApplication
 import pandas as pd
 import requests, logging
 from requests.adapters import HTTPAdapter, Retry
+from module.cache import DatasetCache
+from module.metrics import http_hook
+from module.static import load_static_csv
 
 class AzureAD:
 
     headers = {}
     access_token = ''
     base_url = 'https://graph.microsoft.com/v1.0/'
-    users_df = pd.DataFrame()
-    groups_df = pd.DataFrame()
-    groups_members_df = pd.DataFrame()
-    groups_umembers_df = pd.DataFrame()
-    groups_gmembers_df = pd.DataFrame()
-    groups_owners_df  = pd.DataFrame()
-    devices_df  = pd.DataFrame()
-    managed_devices_df = pd.DataFrame()
-    devices_users_df = pd.DataFrame()
-    targets_df   = pd.DataFrame()
-    applications_df = pd.DataFrame()
+    cache = None  ## per instance dataset cache
+    http_adapter = HTTPAdapter  ## adapter factory mounted on sessions, eg: a benchmark mock/replay transport
 
     ## Get access token and set Headers
     
-    def __init__(self, tenant_id, client_id, client_secret) -> None:
+    def __init__(self, tenant_id, client_id, client_secret, cache=None, http_adapter=HTTPAdapter) -> None:
         logging.info('AzureAD: initializing ...')
+        self.cache = cache or DatasetCache()
+        self.http_adapter = http_adapter
         authority_url = f"https://login.microsoftonline.com/{tenant_id}"
         scopes = ["https://graph.microsoft.com/.default"]
         auth_app = ConfidentialClientApplication(
             client_id=client_id, 
             authority=authority_url, 
-            client_credential=client_secret
+            client_credential=client_secret,
+            http_client=self.get_session()
         )
 
         # Get an access token from Azure AD
@@ -49,7 +46,8 @@ class AzureAD:
     def get_session(self, total=5, backoff_factor=1) -> dict:
         retries = Retry(total=total, backoff_factor=backoff_factor)
         s = requests.Session()
-        s.mount('https://', HTTPAdapter(max_retries=retries))
+        s.mount('https://', self.http_adapter(max_retries=retries))
+        s.hooks['response'].append(http_hook)
         return s
     
     def get(self, url, params=None) -> dict:
@@ -103,8 +101,9 @@ class AzureAD:
             display_cols = display_cols[:-2]
 
         ## return cache if available by default
-        if (not refresh) and (not self.users_df.empty):
-            return self.users_df.loc[:, display_cols]
+        cached = None if refresh else self.cache.get('users', copy=False)
+        if cached is not None:
+            return cached.loc[:, display_cols].copy()
         
         url = self.base_url + "users"
         params = {
@@ -147,7 +146,7 @@ class AzureAD:
         users_df = users_df.loc[:, all_cols]
 
         ## save cache with full columns
-        self.users_df = users_df
+        self.cache.put('users', users_df)
 
         ## return only chosesn columns
         df = users_df.loc[:, display_cols]
@@ -188,8 +187,9 @@ class AzureAD:
         logging.info('AzureAD: list_groups()')
 
         ## return cache if available by default
-        if not (refresh or self.groups_df.empty):
-            return self.groups_df
+        cached = None if refresh else self.cache.get('groups')
+        if cached is not None:
+            return cached
 
         url = f'{self.base_url}groups'        
         params = {
@@ -225,7 +225,7 @@ class AzureAD:
         df['groupTypes'] = df.groupTypes.apply(lambda x: 'Unified' if 'Unified' in x else None)
         df['groupType']  = df.apply( define_group_type, axis=1)
 
-        self.groups_df = df
+        self.cache.put('groups', df)
         return df.copy()
     
     def get_group(self, id, securityEnabled) -> dict:
@@ -256,8 +256,9 @@ class AzureAD:
     def list_groups_umembers(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_groups_umembers()')
         ## return cache by default if available
-        if not (refresh or self.groups_umembers_df.empty):
-            return self.groups_umembers_df
+        cached = None if refresh else self.cache.get('groups_umembers')
+        if cached is not None:
+            return cached
 
         groups_df = self.list_groups(refresh=refresh).set_index('id')
         users_df  = self.list_users(refresh=refresh).set_index('id')
@@ -296,14 +297,15 @@ class AzureAD:
         umember_df = umember_df.loc[:, cols]
 
         ## done
-        self.groups_umembers_df = umember_df
+        self.cache.put('groups_umembers', umember_df)
         return umember_df.copy()
 
     def list_groups_gmembers(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_groups_gmembers()')        
         ## return cache by default if available
-        if not (refresh or self.groups_gmembers_df.empty):
-            return self.groups_gmembers_df
+        cached = None if refresh else self.cache.get('groups_gmembers')
+        if cached is not None:
+            return cached
 
         groups_df = self.list_groups(refresh=refresh).set_index('id')
 
@@ -341,14 +343,15 @@ class AzureAD:
         gmember_df = gmember_df.loc[:, cols]
 
         ## done
-        self.groups_gmembers_df = gmember_df
+        self.cache.put('groups_gmembers', gmember_df)
         return gmember_df.copy()
 
     def list_groups_owners(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_groups_owners()')
         ## return cache by default if available
-        if not (refresh or self.groups_owners_df.empty):
-            return self.groups_owners_df
+        cached = None if refresh else self.cache.get('groups_owners')
+        if cached is not None:
+            return cached
 
         groups_df = self.list_groups(refresh=refresh).set_index('id')
         users_df  = self.list_users(refresh=refresh).set_index('id')
@@ -381,14 +384,14 @@ class AzureAD:
         # merge with users to get full columns
         users_df.columns = [ f'owner_{c}' for c in users_df.columns ]
         df = df.set_index('owner_id').merge(users_df,left_index=True, right_index=True, how='inner')
-
+        df.index.rename('owner_id', inplace=True)
         df.reset_index(inplace=True)
 
         ## rearrange columns
         cols = ['group_id','owner_id']  + df.columns.to_list()[2:]
         df = df.loc[:, cols]
 
-        self.groups_owners_df = df
+        self.cache.put('groups_owners', df)
         return df.copy()
     
     ## Devices Related
@@ -397,8 +400,9 @@ class AzureAD:
     def list_devices(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_devices()')
         ## return cache if available by default
-        if (not refresh) and (not self.devices_df.empty):
-            return self.devices_df
+        cached = None if refresh else self.cache.get('devices')
+        if cached is not None:
+            return cached
         
         url = self.base_url + "devices"
         params = {
@@ -408,34 +412,37 @@ class AzureAD:
         data =  self.get_all(url, params)
         df = pd.DataFrame(data)
 
-        self.devices_df = df
+        self.cache.put('devices', df)
         return df.copy()
 
     def list_managed_devices(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_managed_devices()')
         ## return cache if available by default
-        if (not refresh) and (not self.managed_devices_df.empty):
-            return self.managed_devices_df
+        cached = None if refresh else self.cache.get('managed_devices')
+        if cached is not None:
+            return cached
         
         url = self.base_url + "deviceManagement/managedDevices"
         
         data =  self.get_all(url)
         df = pd.DataFrame(data)
 
-        self.managed_devices_df = df
+        self.cache.put('managed_devices', df)
         return df.copy()
 
     def list_devices_users(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_devices_users')        
+
+        ## return cache if available by default
+        cached = None if refresh else self.cache.get('devices_users')
+        if cached is not None:
+            return cached
+
         users_df = self.list_users(refresh=refresh).set_index('id')
         users_df.columns = ['user_' + c for c in users_df.columns]
 
         devices_df = self.list_devices(refresh=refresh).set_index('deviceId')
         devices_df.columns = ['device_' + c for c in devices_df.columns]
-
-        ## return cache if available by default
-        if (not refresh) and (not self.devices_users_df.empty):
-            return self.devices_users_df
         
         url = self.base_url + "devices"
         params = {
@@ -459,6 +466,7 @@ class AzureAD:
                .merge(users_df, how='left', left_on='user_id', right_index=True)
       
         df.reset_index(inplace=True)
+        self.cache.put('devices_users', df)
         return df.copy()
     
     ## List Targets : Users and Devices Combined
@@ -467,8 +475,9 @@ class AzureAD:
     def list_targets(self, refresh=False) -> pd.DataFrame: 
         logging.info('AzureAD: list_targets()')
 
-        if (not refresh) and (not self.targets_df.empty):
-            return self.targets_df
+        cached = None if refresh else self.cache.get('targets')
+        if cached is not None:
+            return cached
 
         df1   = self.list_users().loc[:, ('id','displayName', 'department', 'country' )]
         df1.columns = ['target_id','target_displayName', 'user_department', 'user_country']
@@ -478,16 +487,18 @@ class AzureAD:
         df2.columns = ['target_id','target_displayName', 'user_department', 'user_country']
         df2['target_type'] = 'device'
 
-        self.targets_df = pd.concat((df1, df2), axis=0, ignore_index=True)
-        return self.targets_df.copy()
+        df = pd.concat((df1, df2), axis=0, ignore_index=True)
+        self.cache.put('targets', df)
+        return df.copy()
 
     ## List Applications
 
     def list_service_principals(self, refresh=False) -> pd.DataFrame: 
         logging.info('AzureAD: list_pplications()')
 
-        if (not refresh) and (not self.applications_df.empty):
-            return self.applications_df
+        cached = None if refresh else self.cache.get('applications')
+        if cached is not None:
+            return cached
 
         url = self.base_url + "servicePrincipals"
         params = {
@@ -503,7 +514,7 @@ class AzureAD:
         df['keys_count'] = df.keyCredentials.apply( lambda x: len(x))
         cols = ['id','appId', 'createdDateTime','accountEnabled','displayName','homepage','notes','preferredSingleSignOnMode','servicePrincipalType','owners_count','permissions_count','passwords_count','keys_count']
         df = df[cols]
-        self.applications_df = df
+        self.cache.put('applications', df)
         return df.copy()
 
 
@@ -512,7 +523,7 @@ class AzureAD:
     def list_users_licenses(self, refresh=False) -> pd.DataFrame:
         logging.info('AzureAD: list_users_licenses')
         users_df = self.list_users(refresh=refresh,include_licenses_plans=True).set_index('id')
-        microsoft_df = pd.read_csv('module/microsoft_products.csv', encoding='cp1252').loc[:, ('GUID','Product_Display_Name','String_Id')].drop_duplicates().set_index('GUID')
+        microsoft_df = load_static_csv('microsoft_products.csv', encoding='cp1252').loc[:, ('GUID','Product_Display_Name','String_Id')].drop_duplicates().set_index('GUID')
 
         users_licenses = []
         for user_id, user in users_df.iterrows():
@@ -1,6 +1,9 @@
 import pandas as pd
-import requests, logging
+import requests, logging, json, os, re
+from datetime import datetime
 from requests.adapters import HTTPAdapter, Retry
+from module.cache import DatasetCache
+from module.metrics import http_hook, MeasuredExecutor
 
 logging.info('module.bolddesk: loading...')
 
@@ -10,27 +13,59 @@ class Bolddesk:
     api_key     = ''  ## bolddesk api key, enabled through Bolddesk user account
     headers     = {}  ## request header that contains api key
     timezones   = []
-    users_df    = pd.DataFrame()  ## list of users (contacts and agents), index: emailId, columns: 'userId'
-    contacts_df = pd.DataFrame()  ## list of contacts
-    agents_df   = pd.DataFrame()  ## list of agents
-    tickets_df   = pd.DataFrame()  ## list of agents
+    timezone_index = {} ## lookup of lowercase city/country -> timezone id, built from timezones and country_timezones
+    timezone_cache = None ## optional local json file of timezones, avoids calling the API on every init
+    cache       = None  ## dataset cache of users, contacts, agents and tickets
+    user_ids    = None  ## emailId -> userId of all users, maintained incrementally on add, per instance
+    new_users   = None  ## users added since last refresh, not yet in cached contacts/agents, per instance
+    http_adapter = HTTPAdapter  ## adapter factory mounted on sessions, eg: a benchmark mock/replay transport
+
+    ## ticket enrichment endpoints, and status history fields (history entry key -> status_history column)
+    ## checked by test/test_bolddesk.py against the cassette of a live ticket, recorded with benchmark.record_bolddesk:
+    ## until one is recorded they are unverified, and enrichment is off in production (BD_HELPDESK_ENRICH)
+    ticket_history_path  = 'tickets/{ticketId}/history'
+    ticket_messages_path = 'tickets/{ticketId}/messages'
+    history_fields = {'fieldName': 'field', 'updatedOn': 'changedOn', 'oldValue': 'status_from', 'newValue': 'status_to'}
+
+    ## country rules, checked in order by get_timezone_id() and merged into timezone_index
+    country_timezones = {
+        'malaysia'             : 37,
+        'singapore'            : 37,
+        'philippines'          : 37,
+        'indonesia'            : 7,
+        'thailand'             : 7,
+        'norway'               : 123,
+        'morocco'              : 124,
+        'pakistan'             : 15,
+        'united arab emirates' : 27,
+        'vietnam'              : 7,
+        'cambodia'             : 7,
+        'india'                : 1,
+    }
 
     ## initialize headers and retrieve users, timezone, contacts and agents
-    def __init__(self, base_url, api_key) -> None:
+    def __init__(self, base_url, api_key, timezone_cache=None, cache=None, http_adapter=HTTPAdapter) -> None:
         logging.info('Bolddesk: initializing ...')
         self.base_url = base_url
+        self.http_adapter = http_adapter
         self.api_key  = api_key
         self.headers  = {
                             "x-api-key": self.api_key,
                             "Content-Type": "application/json"
                         }
-        self.timezones = self.list_timezones()
+        self.timezone_cache = timezone_cache
+        self.timezones = self.load_timezones()
+        self.timezone_index = self.build_timezone_index(self.timezones)
+        self.cache     = cache or DatasetCache()
+        self.user_ids  = {}
+        self.new_users = []
     
-    ## return request session with retry/backoff
-    def get_session(self, total=5, backoff_factor=1) -> dict:
-        retries = Retry(total=total, backoff_factor=backoff_factor)
+    ## return request session with retry/backoff, throttled (429) requests are retried after Retry-After
+    def get_session(self, total=5, backoff_factor=1, pool_size=10) -> dict:
+        retries = Retry(total=total, backoff_factor=backoff_factor, status_forcelist=[429, 502, 503, 504])
         s = requests.Session()
-        s.mount('https://', HTTPAdapter(max_retries=retries))
+        s.mount('https://', self.http_adapter(max_retries=retries, pool_connections=pool_size, pool_maxsize=pool_size))
+        s.hooks['response'].append(http_hook)
         return s
 
     ## Low Level Get All Pages(Multiple Pages Call)
@@ -58,9 +93,9 @@ class Bolddesk:
         ## done
         return result
 
-    ## Low Level Get (Single Call)
-    def get(self, url, params={}) -> dict:
-        s = self.get_session()
+    ## Low Level Get (Single Call), session can be shared by concurrent callers
+    def get(self, url, params={}, s=None) -> dict:
+        s = s or self.get_session()
         response = s.get(self.base_url+url, headers=self.headers, params=params)
         result = response.json()
         return result
@@ -83,21 +118,41 @@ class Bolddesk:
         response = s.patch(self.base_url+url, headers=self.headers, params=params)
         return response.json()
 
-    ## Update List of Users, called by refresh_agents() and refresh_contacts()
+    ## Update List of Users (contacts and agents), users index is rebuilt once
     def refresh_users(self) -> None:
-        # self.users_df = pd.concat([self.agents_df,self.contacts_df]).set_index('emailId')
-        self.refresh_contacts()
-        self.refresh_agents()
+        self.reindex_users(self.list_contacts(refresh=True), self.list_agents(refresh=True))
 
-    ## Update List of Contacts, update users_df too
+    ## Update List of Contacts, update users index too
     def refresh_contacts(self) -> None:
-        self.contacts_df = self.list_contacts(refresh=True)
-        self.users_df = pd.concat([self.agents_df,self.contacts_df]).set_index('emailId')
+        self.reindex_users(contacts_df=self.list_contacts(refresh=True))
         
-    ## Update List of Agents, update users_df too
+    ## Update List of Agents, update users index too
     def refresh_agents(self) -> None:
-        self.agents_df = self.list_agents(refresh=True)
-        self.users_df = pd.concat([self.agents_df,self.contacts_df]).set_index('emailId')
+        self.reindex_users(agents_df=self.list_agents(refresh=True))
+
+    ## Rebuild emailId -> userId index from contacts and agents, users are rebuilt lazily by list_users()
+    def reindex_users(self, contacts_df=None, agents_df=None) -> None:
+        contacts_df = self.list_contacts() if contacts_df is None else contacts_df
+        agents_df   = self.list_agents()   if agents_df   is None else agents_df
+        self.user_ids = {}
+        for df in (contacts_df, agents_df):  ## agents take precedence
+            if not df.empty:
+                self.user_ids.update(zip(df.emailId, df.userId))
+        self.new_users = []
+        self.cache.invalidate('users')
+
+    ## Add a single new user to the index, without refreshing contacts/agents
+    def index_user(self, emailId, userId) -> None:
+        if not (emailId and userId): return
+        emailId = emailId.lower()
+        self.user_ids[emailId] = userId
+        self.new_users += [{'emailId': emailId, 'userId': userId}]
+        self.cache.invalidate('users')
+
+    ## Return userId of an emailId, None if not a Bolddesk user
+    def get_user_id(self, emailId) -> int:
+        userId = self.user_ids.get(str(emailId).lower()) if emailId else None
+        return int(userId) if userId is not None else None
 
 
     #######################
@@ -107,13 +162,18 @@ class Bolddesk:
     def list_users(self, refresh=False) -> list:    
         logging.info('Bolddesk: list_users()')
 
-        ## return cache if available
-        if not (refresh or self.agents_df.empty or self.contacts_df.empty):
-            return self.users_df
+        ## refreshed, or contacts/agents expired from cache: users index is rebuilt too
+        if refresh or self.cache.get('contacts', copy=False) is None or self.cache.get('agents', copy=False) is None:
+            self.refresh_users()
 
-        self.refresh_contacts()
-        self.refresh_agents()
-        return self.users_df
+        ## (re)build once after a refresh or newly added users
+        users_df = self.cache.get('users')
+        if users_df is None:
+            frames = [self.list_agents(), self.list_contacts()] + ([pd.DataFrame(self.new_users)] if self.new_users else [])
+            users_df = pd.concat(frames).set_index('emailId')
+            self.cache.put('users', users_df)
+            users_df = users_df.copy()
+        return users_df
 
     ## Get A Single User
     def get_user(self, userId) -> dict:
@@ -140,8 +200,9 @@ class Bolddesk:
         logging.info('Bolddesk: list_agents()')
         
         ## return cache if available by default
-        if not (refresh or self.agents_df.empty):
-            return self.agents_df
+        cached = None if refresh else self.cache.get('agents')
+        if cached is not None:
+            return cached
 
         url = 'agents'
         df = pd.DataFrame(self.get_all(url))
@@ -154,19 +215,17 @@ class Bolddesk:
         for col in date_cols:
             df[col] = pd.to_datetime(df[col]).dt.tz_localize(None)    
         
-        ## fix roles
-        df['role_names'] = None
-        df['role_ids'] = None
-        for idx, roles in df.roles.items():
-            role_names = [r.get('roleName') for r in roles]
-            role_ids =   [str(r.get('roleId'))   for r in roles]
-            df.loc[idx, 'role_ids']   = ','.join(role_ids)
-            df.loc[idx, 'role_names'] = ','.join(role_names)
+        ## fix roles, one row per agent role, then join back per agent
+        roles = df.roles.explode().dropna()
+        roles_df = pd.DataFrame(roles.tolist(), index=roles.index, columns=['roleId','roleName'])
+        df['role_ids']   = roles_df.roleId.astype(str).groupby(level=0).agg(','.join)
+        df['role_names'] = roles_df.roleName.astype(str).groupby(level=0).agg(','.join)
+        df[['role_ids','role_names']] = df[['role_ids','role_names']].fillna('')
         
         df.drop(columns=['roles', 'availabilityStatus','shortCode','colorCode'], inplace=True)
 
-        self.agents_df = df.copy()
-        return df
+        self.cache.put('agents', df)
+        return df.copy()
 
     ## Verify User
     def verify_user(self, userId) -> dict:
@@ -200,6 +259,9 @@ class Bolddesk:
         ## Post it
         url = 'agents'
         result = self.post(url, new_agent)
+
+        ## keep users index up to date
+        self.index_user(new_agent.get('emailId'), result.get('id'))
         return result
 
     #######################
@@ -216,8 +278,9 @@ class Bolddesk:
         logging.info('Bolddesk: list_contacts()')
         
         ## return cache if available by default
-        if not (refresh or self.contacts_df.empty):
-            return self.contacts_df
+        cached = None if refresh else self.cache.get('contacts')
+        if cached is not None:
+            return cached
         
         url = 'contacts'
         data = self.get_all(url)
@@ -234,8 +297,8 @@ class Bolddesk:
             df[col] = pd.to_datetime(df[col]).dt.tz_localize(None)
 
         df = df.fillna('')
-        self.contacts_df = df.copy()
-        return df
+        self.cache.put('contacts', df)
+        return df.copy()
 
     ## Add Contact
     def add_contact(self, contact) -> dict:
@@ -254,19 +317,19 @@ class Bolddesk:
             }
         }
 
-        ## auto define timezone id from cf_contactCity field
+        ## auto define timezone id from cf_contactCity field, fallback to cf_contactCountry
         if contact.get('cf_contactCity'):
-            found_tz = next((item for item in self.timezones if contact.get('cf_contactCity') in item.get("description")),None)
-            if found_tz:
-                timeZoneId = found_tz.get('id')
+            timeZoneId = self.resolve_timezone_id(contact.get('cf_contactCity'), contact.get('cf_contactCountry'))
+            if timeZoneId:
                 new_contact['timeZoneId'] = timeZoneId  ## add to the dict
         
         ## cf_contactManagerEmailId provided, auto define cf_contactManagerUserId
         manager_email_id = contact.get('cf_contactManagerEmailId')
         if manager_email_id:
+            manager_user_id = self.get_user_id(manager_email_id)
             ## Manager found in Bolddesk, update custom fields
-            if manager_email_id in self.users_df.index:
-                new_contact['customFields']['cf_contactManagerUserId'] = int(self.users_df.loc[manager_email_id, 'userId'])  ## add to the dict
+            if manager_user_id:
+                new_contact['customFields']['cf_contactManagerUserId'] = manager_user_id  ## add to the dict
             ## reset the manager email if manager not exist in Bolddesk
             else:
                 new_contact['customFields']['cf_contactManagerEmailId'] = None            
@@ -274,26 +337,27 @@ class Bolddesk:
         ## Post it
         url = 'contacts'
         result = self.post(url, new_contact)
+
+        ## keep users index up to date
+        self.index_user(new_contact.get('emailId'), result.get('id'))
         return result
 
     ## Update Contact
     def update_contact(self, userId, contact_update) -> dict:
         logging.info(f'Bolddesk: update_contact() - {userId} / {contact_update}')
 
-        ## auto define timezone id from cf_contactCity field
+        ## auto define timezone id from cf_contactCity field, fallback to cf_contactCountry
         if 'cf_contactCity' in contact_update.keys():
-            timezones = self.list_timezones()
-            found_tz = next((item for item in timezones if contact_update.get('cf_contactCity') in item.get("description")),None)
-            if found_tz:
-                timeZoneId = found_tz.get('id')
+            timeZoneId = self.resolve_timezone_id(contact_update.get('cf_contactCity'), contact_update.get('cf_contactCountry'))
+            if timeZoneId:
                 contact_update['timeZoneId'] = int(timeZoneId)  ## add to the dict
         
         ## auto define cf_contactManagerUserId from cf_contactManagerEmailId
         if 'cf_contactManagerEmailId' in contact_update.keys():
-            manager_email_id = contact_update.get('cf_contactManagerEmailId')
+            manager_user_id = self.get_user_id(contact_update.get('cf_contactManagerEmailId'))
             ## manager found, update the manager user id
-            if manager_email_id in self.users_df.index:
-                contact_update['cf_contactManagerUserId'] = int(self.users_df.loc[manager_email_id,'userId'])  ## update manaager user id, fix to int to avoid json decoder error
+            if manager_user_id:
+                contact_update['cf_contactManagerUserId'] = manager_user_id  ## update manaager user id, fix to int to avoid json decoder error
             ## manager not found, reset both manager email and user id
             else:
                 contact_update['cf_contactManagerEmailId'] = None
@@ -334,6 +398,53 @@ class Bolddesk:
         logging.info('Bolddesk: list_timezones()')
         url = 'locales/timezones'
         return self.get_all(url)
+
+    ## Load Timezones from local cache file if available, otherwise from API (and save to cache file)
+    def load_timezones(self) -> list:
+        if self.timezone_cache and os.path.exists(self.timezone_cache):
+            logging.info(f'Bolddesk: load_timezones() - from {self.timezone_cache}')
+            with open(self.timezone_cache, 'r') as f:
+                return json.load(f)
+
+        timezones = self.list_timezones()
+
+        ## only cache a successful response
+        if self.timezone_cache and timezones:
+            os.makedirs(os.path.dirname(self.timezone_cache) or '.', exist_ok=True)
+            with open(self.timezone_cache, 'w') as f:
+                json.dump(timezones, f)
+        return timezones
+
+    ## Build lowercase city/country -> timezone id lookup
+    ## description format, eg: '(UTC+08:00) Kuala Lumpur, Singapore'
+    def build_timezone_index(self, timezones) -> dict:
+        index = {}
+        for tz in timezones or []:
+            description = re.sub(r'^\(.*?\)\s*', '', tz.get('description') or '')
+            for name in description.split(','):
+                name = name.strip().lower()
+                ## first match wins, same as scanning the list in order
+                if name and name not in index:
+                    index[name] = tz.get('id')
+
+        ## hardcoded country rules take precedence
+        index.update(self.country_timezones)
+        return index
+
+    ## Resolve Timezone ID by City, fallback to Country. None if not found
+    def resolve_timezone_id(self, city, country=None) -> int:
+        for name in (city, country):
+            if not name: continue
+            key = str(name).strip().lower()
+
+            ## not indexed yet, scan descriptions once and remember the result (including misses)
+            if key not in self.timezone_index:
+                found_tz = next((tz for tz in self.timezones if key in (tz.get('description') or '').lower()), None)
+                self.timezone_index[key] = found_tz.get('id') if found_tz else None
+
+            if self.timezone_index[key]:
+                return self.timezone_index[key]
+        return None
     
 
     #####################
@@ -352,8 +463,9 @@ class Bolddesk:
         logging.info('Bolddesk: list_tickets()')
         
         ## return cache if available by default
-        if not (refresh or self.tickets_df.empty):
-            return self.tickets_df
+        cached = None if refresh else self.cache.get('tickets')
+        if cached is not None:
+            return cached
         
         url = 'tickets'
         data = self.get_all(url)
@@ -368,9 +480,89 @@ class Bolddesk:
         for col in date_cols:
             df[col] = pd.to_datetime(df[col]).dt.tz_localize(None)
 
-        self.tickets_df = df.copy()
+        self.cache.put('tickets', df)
         
-        return df
+        return df.copy()
+
+    ## Get Ticket Details, Status History and Messages Count of a Single Ticket
+    def get_ticket_detail(self, ticketId, s=None) -> dict:
+        detail   = self.get(f'tickets/{ticketId}', s=s)
+        history  = self.get(self.ticket_history_path.format(ticketId=ticketId), s=s)
+        messages = self.get(self.ticket_messages_path.format(ticketId=ticketId), params={'RequiresCounts': 'true', 'PerPage': 1}, s=s)
+        return {
+            'ticketId'      : ticketId,
+            'detail'        : detail,
+            'history'       : history.get('result', []) if isinstance(history, dict) else history,
+            'messages_count': messages.get('count') if isinstance(messages, dict) else None
+        }
+
+    ## Enrich Tickets with Details, Custom Fields and Status History, fetched concurrently
+    ## 3 requests per ticket: callers pass the tickets updated since their last run only (see save_bd_helpdesk_to_warehouse)
+    ## return dict of child tables: details, custom_fields, status_history
+    def enrich_tickets(self, ticket_ids, max_workers=8) -> dict:
+        logging.info(f'Bolddesk: enrich_tickets() - tickets: {len(ticket_ids)}')
+
+        ## one shared connection pool
+        s = self.get_session(pool_size=max_workers)
+        with MeasuredExecutor(max_workers=max_workers) as executor:
+            tickets = list(executor.map(lambda t: self.get_ticket_detail(t, s=s), ticket_ids))
+
+        return self.normalize_ticket_details(tickets)
+
+    ## Flatten list of ticket details into child tables
+    def normalize_ticket_details(self, tickets) -> dict:
+
+        ## details, one row per ticket
+        details = []
+        custom_fields = []
+        histories = []
+        for t in tickets:
+            d = t['detail']
+            details += [{
+                'ticketId'       : t['ticketId'],
+                'status'         : (d.get('status') or {}).get('description') if isinstance(d.get('status'), dict) else d.get('status'),
+                'createdOn'      : d.get('createdOn'),
+                'closedOn'       : d.get('closedOn'),
+                'messages_count' : t['messages_count'],
+            }]
+            for field, value in (d.get('customFields') or {}).items():
+                custom_fields += [{'ticketId': t['ticketId'], 'field': field, 'value': None if value is None else str(value)}]
+            for h in t['history'] or []:
+                histories += [dict(self.flatten_dict_without_parent_prefix(h), ticketId=t['ticketId'])]
+
+        details_df = pd.DataFrame(details, columns=['ticketId','status','createdOn','closedOn','messages_count'])
+        custom_fields_df = pd.DataFrame(custom_fields, columns=['ticketId','field','value'])
+
+        ## status history, keep status changes only
+        history_df = pd.DataFrame(histories)
+        cols = ['ticketId','changedOn','status_from','status_to','time_in_status_hours']
+        missing = [k for k in self.history_fields if k not in history_df.columns]
+        if histories and missing:
+            logging.warning(f'Bolddesk: normalize_ticket_details() - history fields not found: {missing}, status history not saved')
+        if histories and not missing:
+            history_df = history_df.rename(columns=self.history_fields)
+            history_df = history_df[history_df.field.astype(str).str.contains('status', case=False)]
+            history_df['changedOn'] = pd.to_datetime(history_df.changedOn).dt.tz_localize(None)
+            history_df = history_df.sort_values(['ticketId','changedOn'])
+
+            ## time spent in the new status, until next change, ticket closed or now
+            closed = pd.to_datetime(details_df.set_index('ticketId').closedOn).dt.tz_localize(None)
+            until  = history_df.groupby('ticketId').changedOn.shift(-1)
+            until  = until.fillna(history_df.ticketId.map(closed)).fillna(pd.Timestamp(datetime.utcnow()))
+            history_df['time_in_status_hours'] = (until - history_df.changedOn).dt.total_seconds() / 3600
+            history_df = history_df.reindex(columns=cols)
+        else:
+            history_df = pd.DataFrame(columns=cols)
+
+        ## fix datetime columns
+        for col in ['createdOn', 'closedOn']:
+            details_df[col] = pd.to_datetime(details_df[col]).dt.tz_localize(None)
+
+        return {
+            'details'       : details_df,
+            'custom_fields' : custom_fields_df,
+            'status_history': history_df
+        }
 
     #####################
     ## Utilities
@@ -384,33 +576,10 @@ class Bolddesk:
         if country: country = str.lower(country)
         if city:    city = str.lower(city)
         
-        if country in 'malaysia':
-            timezone_id = 37
-        elif country in 'singapore':
-            timezone_id = 37
-        elif country in 'philippines':
-            timezone_id = 37
-        elif country in 'indonesia':
-            timezone_id = 7
-        elif country in 'thailand':
-            timezone_id = 7
-        elif country in 'norway':
-            timezone_id = 123
-        elif country in 'morocco':
-            timezone_id = 124
-        elif country in 'pakistan':
-            timezone_id = 15
-        elif country in 'united arab emirates':
-            timezone_id = 27
-        elif country in 'vietnam':
-            timezone_id = 7
-        elif country in 'cambodia':
-            timezone_id = 7
-        elif country in 'india':
-            timezone_id = 1
-        ## default to SG timezone
-        else:
-            timezone_id = 37
+        timezone_id = self.country_timezones.get(country)
+        if timezone_id is None:
+            ## partial country name, default to SG timezone
+            timezone_id = next((tz for name, tz in self.country_timezones.items() if country in name), 37)
         return timezone_id
 
     ## Utility: Flatten nested dict utility. No prefix applied
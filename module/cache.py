@@ -0,0 +1,58 @@
+import logging, threading, time
+from collections import OrderedDict
+import pandas as pd
+
+## Per instance dataset cache, entries expire after ttl (seconds),
+## least recently used entries are evicted beyond max_bytes
+class DatasetCache:
+
+    def __init__(self, ttl=3600, max_bytes=512*1024*1024) -> None:
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()   ## name -> (saved_at, nbytes, df), least recently used first
+        self.lock = threading.RLock()
+
+    ## cached dataframe, None if missing or expired
+    ## copy=False only for callers not modifying the result
+    def get(self, name, copy=True):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return None
+            saved_at, nbytes, df = entry
+            if time.monotonic() - saved_at > self.ttl:
+                logging.info(f'DatasetCache: get() - {name} expired')
+                del self.entries[name]
+                return None
+            self.entries.move_to_end(name)
+        return df.copy() if copy else df
+
+    ## cache a dataframe, evicting least recently used ones to stay within max_bytes
+    def put(self, name, df) -> None:
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self.lock:
+            self.entries.pop(name, None)
+            if nbytes > self.max_bytes:
+                logging.info(f'DatasetCache: put() - {name} not cached, {nbytes/2**20:.1f}MB over limit')
+                return
+            self.entries[name] = (time.monotonic(), nbytes, df)
+            while self.nbytes > self.max_bytes:
+                evicted, (_, evicted_bytes, _) = self.entries.popitem(last=False)
+                logging.info(f'DatasetCache: put() - evicted {evicted}, {evicted_bytes/2**20:.1f}MB')
+
+    ## drop one dataset, or all if name is not provided
+    def invalidate(self, name=None) -> None:
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(name, None)
+
+    ## memory used by each dataset, in bytes
+    def usage(self) -> dict:
+        with self.lock:
+            return {name: nbytes for name, (_, nbytes, _) in self.entries.items()}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(nbytes for _, nbytes, _ in self.entries.values())
@@ -1,5 +1,8 @@
-import logging, os
+import logging, os, time
+import pandas as pd
+from datetime import datetime, timedelta, timezone
 from module.warehouse import Warehouse
+from module.metrics import RunMetrics
 
 def add_new_user_to_bd(ad, bd):
     logging.info('started: add_new_user_to_bd()')
@@ -47,13 +50,14 @@ def deactivate_invalid_agent(ad, bd):
     invalid_agents_df = active_agents_df.loc[invalid_agents]
 
     ## (safety check) proceed only if agents to deactivate is < 10% of total AD users
-    if len(invalid_agents_df)/len(ad.users_df) < 0.1:
+    if len(invalid_agents_df)/len(ad.list_users()) < 0.1:
         for emailId, agent in invalid_agents_df.iterrows():
             bd.deactivate_agent(agent.userId)
 
-def save_to_warehouse(ad, credential):
+## wh: warehouse to save to, the one of DB_SERVER/DB_NAME if not given
+def save_to_warehouse(ad, credential, wh=None):
 
-    wh = Warehouse(
+    wh = wh or Warehouse(
             server=os.environ["DB_SERVER"],
             database=os.environ["DB_NAME"],
             credential=credential
@@ -78,12 +82,444 @@ def save_to_warehouse(ad, credential):
     ]
 
     ## run all save jobs
+    metrics = RunMetrics('save_to_warehouse')
     for job in save_list:
         logging.info(job[0])
 
         table_name = job[1]
         list_func = getattr(ad, job[2])
-        df = list_func()
-    
+        with metrics.table(table_name):
+            df = list_func()
+            wh.erase(table_name)
+            wh.append(table_name, df)
+    metrics.save(wh)
+
+def save_logs_to_warehouse(la, credential, time_span=timedelta(days=30), overlap=timedelta(minutes=15), ingestion_lag=timedelta(minutes=5), include_raw=False, rollups=None, max_bytes=256*1024**2, wh=None):
+
+    wh = wh or Warehouse(
+            server=os.environ["DB_SERVER"],
+            database=os.environ["DB_NAME"],
+            credential=credential
+    )
+
+    logging.info('started: save_logs_to_warehouse()')
+
+    ## Rollups summarized at source, latest day is refreshed on every run
+    metrics = RunMetrics('save_logs_to_warehouse')
+    for profile in (rollups or la.rollup_profiles.keys()):
+        rollup     = la.rollup_profiles[profile]
+        table_name = rollup['table']
+        watermark  = f'{table_name}_Day'
+        logging.info(f'save_logs_to_warehouse(): saving {table_name}')
+
+        since = wh.get_watermark(watermark)
+        with metrics.table(table_name):
+            df = la.list_rollup(profile, time_span=time_span, since=since)
+            wh.upsert(table_name, df, keys=rollup['keys'])
+        if not df.empty:
+            wh.set_watermark(watermark, df.Day.max())
+    metrics.save(wh)
+
+    ## Raw logs, opt-in only
+    if not include_raw:
+        return
+
+    ## Define the save jobs
+    save_list = [
+        ## log_message, table_name, function_name
+        ('save_logs_to_warehouse(): saving ad_signins',      'ad_signins',       'list_signins'),
+        ('save_logs_to_warehouse(): saving ad_audits',       'ad_audits',        'list_audits'),
+        ('save_logs_to_warehouse(): saving ad_audits_alerts','ad_audits_alerts', 'list_audits_alerts')
+    ]
+
+    ## run all save jobs, streamed slice by slice from the last checkpoint (full time_span on first run)
+    ## each slice is loaded before the next one is queried, and checkpointed so that a failed run resumes from there
+    ## events are queryable minutes after their TimeGenerated: the checkpoint stays ingestion_lag behind now,
+    ## and the next run re-reads overlap before it (15 minutes, 3x the 5 minutes lag) for events ingested later still
+    for job in save_list:
+        logging.info(job[0])
+
+        table_name = job[1]
+        checkpoint = f'{table_name}_TimeGenerated'
+        list_func  = getattr(la, job[2])
+        with metrics.table(table_name):
+            for slice_end, df in la.stream(list_func, time_span=time_span, since=wh.get_watermark(checkpoint), overlap=overlap, max_bytes=max_bytes):
+                ## rows in the overlap window are replaced, not duplicated
+                wh.upsert(table_name, df, keys=['Id'])
+                wh.set_watermark(checkpoint, min(slice_end, datetime.now(timezone.utc) - ingestion_lag))
+    metrics.save(wh)
+
+def save_ns_audits_to_warehouse(ns, wh, keep_days=60):
+
+    logging.info('started: save_ns_audits_to_warehouse()')
+
+    ## rows older than keep_days age out
+    cutoff = (datetime.utcnow() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+
+    ## Define the daily save jobs
+    save_list = [
+        ## log_message, table_name, function_name
+        ('save_ns_audits_to_warehouse(): saving ns_login_audits',  'ns_login_audits',  'list_login_audits'),
+        ('save_ns_audits_to_warehouse(): saving ns_login_failure', 'ns_login_failure', 'list_login_failure')
+    ]
+
+    ## run all daily save jobs, last loaded day is re-read and replaced (full keep_days on first run)
+    for job in save_list:
+        logging.info(job[0])
+
+        table_name = job[1]
+        watermark  = f'{table_name}_date'
+        since      = wh.get_watermark(watermark)
+        list_func  = getattr(ns, job[2])
+        df = list_func(last_n_days=keep_days, since=since)
+
+        ## nothing read: loaded rows are kept as they are
+        if df.empty:
+            logging.info(f'save_ns_audits_to_warehouse(): no rows for {table_name}')
+            continue
+
+        if since:
+            wh.delete_rows(table_name, 'date', since, operator='>=')
+        else:
+            wh.erase(table_name)
+        wh.append(table_name, df)
+        wh.delete_rows(table_name, 'date', cutoff, operator='<')
+        wh.set_watermark(watermark, str(df.date.max())[:10])
+
+    ## script logs, new internalId only
+    logging.info('save_ns_audits_to_warehouse(): saving ns_script_logs')
+    table_name = 'ns_script_logs'
+    watermark  = f'{table_name}_internalid'
+    since_id   = wh.get_watermark(watermark)
+    df = ns.list_script_logs(since_id=since_id)
+    if df.empty:
+        logging.info(f'save_ns_audits_to_warehouse(): no rows for {table_name}')
+        return
+
+    if not since_id:
+        wh.erase(table_name)
+    wh.append(table_name, df)
+    wh.delete_rows(table_name, 'date', cutoff, operator='<')
+    wh.set_watermark(watermark, int(df.internalid.max()))
+
+
+## Bolddesk Nera Care contacts, agents and tickets, full refresh
+def save_bd_care_to_warehouse(bd, wh):
+    logging.info('started: save_bd_care_to_warehouse()')
+
+    ## Define the save jobs
+    save_list = [
+        ## log_message, table_name, function_name
+        ('save_bd_care_to_warehouse(): saving bd_nera_care_contacts', 'bd_nera_care_contacts', 'list_contacts'),
+        ('save_bd_care_to_warehouse(): saving bd_nera_care_agents',   'bd_nera_care_agents',   'list_agents'),
+        ('save_bd_care_to_warehouse(): saving bd_nera_care_tickets',  'bd_nera_care_tickets',  'list_tickets')
+    ]
+
+    metrics = RunMetrics('timer_update_bd_care')
+    for job in save_list:
+        logging.info(job[0])
+        with metrics.table(job[1]):
+            df = getattr(bd, job[2])()
+            wh.erase(job[1])
+            wh.append(job[1], df)
+    metrics.save(wh)
+
+## Bolddesk IT Helpdesk tickets, and their details, custom fields and status history
+## details cost 3 requests per ticket, only tickets updated since the last run are enriched, their child rows replaced:
+## - first run: open tickets and tickets updated in the last first_run_days only
+## - closed tickets already enriched with the same closedOn are not fetched again, child tables are their cache
+## - tickets are enriched by batch_size in lastUpdatedOn order, the watermark moves after each batch is saved,
+##   so that an interrupted run resumes from its last saved batch, and to the last ticket once completed
+## enrich: False saves the tickets only
+def save_bd_helpdesk_to_warehouse(bd, wh, enrich=True, first_run_days=90, batch_size=500):
+    logging.info('started: save_bd_helpdesk_to_warehouse()')
+
+    metrics = RunMetrics('timer_update_bd_helpdesk')
+    table_name = 'bd_helpdesk_tickets'
+    with metrics.table(table_name):
+
+        ## get tickets
+        df = bd.list_tickets()
+
+        ## fix datetime columns
+        date_cols = ['cf_last_date_of_service', 'cf_last_day_of_retention', 'resolutionDue', 'createdOn', 'closedOn', 'responseDue', 'lastRepliedOn', 'lastUpdatedOn', 'lastStatusChangedOn',]
+        for col in date_cols:
+            df[col] = pd.to_datetime(df[col]).dt.tz_localize(None)
+
+        ## write to SQL
         wh.erase(table_name)
-        wh.append(table_name, df)
\ No newline at end of file
+        wh.append(table_name, df)
+
+    if not enrich:
+        metrics.save(wh)
+        return
+
+    ## tickets updated since last run, tickets updated at the watermark itself are enriched again (idempotent)
+    watermark = 'bd_helpdesk_ticket_enrichment_lastUpdatedOn'
+    since = wh.get_watermark(watermark)
+    if since is None:
+        updated = df[df.closedOn.isna() | (df.lastUpdatedOn >= datetime.utcnow() - timedelta(days=first_run_days))]
+    else:
+        updated = df[df.lastUpdatedOn >= pd.Timestamp(since)]
+
+    ## closed tickets already enriched
+    details_table = 'bd_helpdesk_ticket_details'
+    if since is not None and wh.has_table(details_table):
+        enriched = wh.get_table(details_table)[['ticketId', 'closedOn']].dropna()
+        closed   = pd.to_datetime(updated.ticketId.map(enriched.set_index('ticketId').closedOn))
+        updated  = updated[updated.closedOn.isna() | (closed != updated.closedOn)]
+    updated = updated.sort_values('lastUpdatedOn')
+    logging.info(f'save_bd_helpdesk_to_warehouse(): enriching {len(updated)} of {len(df)} tickets, updated since {since}')
+
+    with metrics.table('bd_helpdesk_ticket_enrichment'):
+        ## first run, child tables rebuilt
+        if since is None:
+            for name in ('details', 'custom_fields', 'status_history'):
+                wh.erase(f'bd_helpdesk_ticket_{name}')
+
+        for start in range(0, len(updated), batch_size):
+            batch = updated.iloc[start:start + batch_size]
+            child_tables = bd.enrich_tickets(batch.ticketId.to_list())
+            for name, child_df in child_tables.items():
+                wh.upsert(f'bd_helpdesk_ticket_{name}', child_df, keys=['ticketId'])
+            wh.set_watermark(watermark, batch.lastUpdatedOn.max())
+
+        ## completed, tickets left out (first run bound, cached) are not considered again until updated
+        if not df.empty:
+            wh.set_watermark(watermark, df.lastUpdatedOn.max())
+
+    metrics.save(wh)
+
+## Infosec learners, campaigns and learner progress
+def save_infosec_to_warehouse(ifs, wh):
+    logging.info('started: save_infosec_to_warehouse()')
+
+    ##task name; db table name; method name to get info from infosec
+    save_list = [
+        ('saving ifs_learners',         'ifs_learners',         'list_learners'), 
+        ('saving ifs_campaigns',        'ifs_campaigns',        'list_campaigns'), 
+    ]
+
+    ## run all saving jobs
+    metrics = RunMetrics('timer_update_infosec')
+    for job in save_list:
+        logging.info(job[0])
+        with metrics.table(job[1]):
+            ## Get Data
+            list_func = getattr(ifs, job[2])
+            df = list_func()
+            ## refresh table 
+            wh.erase(job[1])
+            wh.append(job[1], df)
+
+    ## learner progress is upserted by learner/run, so that GiT rows loaded incrementally are kept
+    logging.info('saving ifs_learner_progress')
+    with metrics.table('ifs_learner_progress'):
+        df = ifs.list_learner_progress()
+        wh.upsert('ifs_learner_progress', df, keys=['learner_id', 'run_id'])
+
+    ## GiT campaign progress from timeline events, new events since last run only
+    logging.info('saving git_ifs_learner_progress')
+    watermark = 'ifs_timeline_events_GiT'
+    cursor = wh.get_watermark(watermark)
+    with metrics.table('ifs_learner_progress_GiT'):
+        df = ifs.list_timeline_events(campaign_id='GiT', cursor=cursor)
+        wh.upsert('ifs_learner_progress', df, keys=['learner_id', 'run_id'])
+    wh.set_watermark(watermark, ifs.timeline_cursor)
+    metrics.save(wh)
+
+## Return the last run of run_name if it can be resumed, None otherwise
+## resumable: paused by time budget, or still marked running with no progress for stale_after (killed by host timeout)
+def get_resumable_run(wh, run_name, stale_after=timedelta(minutes=20), max_age=timedelta(hours=1)):
+    state = wh.get_run_state(run_name).set_index('table_name')
+    if '_run' not in state.index:
+        return None
+
+    run = state.loc['_run']
+    now = datetime.utcnow()
+    if now - run.started_on > max_age:
+        return None
+    if run.status == 'paused' or (run.status == 'running' and now - run.finished_on > stale_after):
+        return run
+    return None
+
+
+## Run a single save job (log_message, table_name, func), recording its progress in the run-state ledger
+## and its stages timing in metrics (RunMetrics)
+## the table is claimed first: return False, without running it, if another worker holds it for run_id
+def run_save_job(wh, run_name, run_id, job, metrics, stale_after=timedelta(minutes=20)) -> bool:
+    log_message, table_name, func = job
+    logging.info(log_message)
+    table_start, started_on = time.monotonic(), datetime.utcnow()
+    if not wh.claim_run_state(run_name, table_name, run_id, stale_before=started_on - stale_after):
+        logging.info(f'run_save_job(): {run_name} {run_id}: {table_name} claimed by another worker, skipped')
+        return False
+    try:
+        with metrics.table(table_name):
+            df = func()
+            row_count = None
+            if df is not None:
+                wh.erase(table_name)
+                wh.append(table_name, df)
+                row_count = len(df)
+    except:
+        wh.set_run_state(run_name, table_name, run_id=run_id, status='failed', started_on=started_on, finished_on=datetime.utcnow())
+        raise
+
+    wh.set_run_state(run_name, table_name, run_id=run_id, status='completed', row_count=row_count,
+                     started_on=started_on, finished_on=datetime.utcnow(), seconds=time.monotonic() - table_start)
+    return True
+
+
+## Run save jobs under a time budget (seconds), progress of each table kept in the run-state ledger
+## jobs: [(log_message, table_name, func)], func returns dataframe to refresh the table, or None if it saved by itself
+## resumes the last run from its first incomplete table if resumable, a table not fitting the remaining budget
+## (estimated from its last duration) pauses the run, for a continuation to resume
+## skipped while the last run is still running (progress within stale_after), tables are claimed before running
+## return True if all jobs are completed
+def run_save_jobs(wh, run_name, jobs, time_budget=900, stale_after=timedelta(minutes=20)):
+
+    logging.info(f'started: run_save_jobs() - {run_name}')
+    start = time.monotonic()
+    state = wh.get_run_state(run_name).set_index('table_name')
+
+    ## another invocation is on it
+    if '_run' in state.index and state.loc['_run'].status == 'running' and datetime.utcnow() - state.loc['_run'].finished_on <= stale_after:
+        logging.info(f'run_save_jobs(): {run_name} {state.loc["_run"].run_id} still running, skipped')
+        return False
+
+    ## resume or start a new run
+    run = get_resumable_run(wh, run_name, stale_after)
+    if run is not None:
+        run_id, run_started = run.run_id, run.started_on
+        completed = set(state.index[(state.run_id == run_id) & (state.status == 'completed')])
+        logging.info(f'run_save_jobs(): resuming {run_name} {run_id}, completed: {len(completed)} tables')
+    else:
+        run_started = datetime.utcnow()
+        run_id, completed = run_started.strftime('%Y%m%d%H%M%S'), set()
+
+    ## run row (table '_run'), finished_on is the last progress time while running
+    def set_run(status):
+        wh.set_run_state(run_name, '_run', run_id=run_id, status=status, started_on=run_started, finished_on=datetime.utcnow())
+
+    set_run('running')
+    metrics = RunMetrics(run_name, run_id)
+    ran_any, skipped = False, False
+    for log_message, table_name, func in jobs:
+        if table_name in completed:
+            continue
+
+        ## first table always runs, so every invocation makes progress
+        estimate = state.seconds.get(table_name, 0) if 'seconds' in state.columns else 0
+        if ran_any and time.monotonic() - start + (estimate or 0) > time_budget:
+            logging.info(f'run_save_jobs(): {run_name} paused before {table_name}, time budget: {time_budget}s')
+            set_run('paused')
+            metrics.save(wh)
+            return False
+
+        try:
+            claimed = run_save_job(wh, run_name, run_id, (log_message, table_name, func), metrics, stale_after)
+        except:
+            set_run('failed')
+            metrics.save(wh)
+            raise
+        set_run('running')
+        ran_any, skipped = ran_any or claimed, skipped or not claimed
+
+    ## tables held by another worker: left for a continuation to check
+    if skipped:
+        set_run('paused')
+        metrics.save(wh)
+        return False
+
+    set_run('completed')
+    metrics.save(wh)
+    logging.info(f'run_save_jobs(): {run_name} {run_id} completed')
+    return True
+
+
+## Netsuite tables refreshed by full reload
+ns_save_list = [
+    ## log_message, table_name, function_name
+    ('Processing ns_subsidiaries',         'ns_subsidiaries',         'list_subsidiaries'),       
+    ('Processing ns_roles',                'ns_roles',                'list_roles'),       
+    ('Processing ns_role_record_usage',    'ns_role_record_usage',    'list_role_record_usage'),
+    ('Processing ns_role_permissions',     'ns_role_permissions',     'list_role_permissions'),
+    ('Processing ns_role_subsidiaries',    'ns_role_subsidiaries',    'list_role_subsidiaries'),
+    ('Processing ns_employee_roles',       'ns_employee_roles',       'list_employee_roles'),
+    ('Processing ns_employee_license',     'ns_employee_license',     'list_employee_license'),
+    ('Processing ns_partner_roles',        'ns_partner_roles',        'list_partner_roles'),
+    ('Processing ns_union_employees_partners','ns_union_employees_partners', 'union_employees_partners'),
+    ('Processing ns_approval_matrix',      'ns_approval_matrix',      'list_approval_matrix'),
+    ('Processing ns_employee_all',         'ns_employee_all',         'list_employee_all'),
+    ('Processing ns_scripts',              'ns_scripts',              'list_scripts'),
+    ('Processing ns_client_scripts',              'ns_client_scripts',            'list_client_scripts'),
+    ('Processing ns_client_script_deployments',   'ns_client_script_deployments', 'list_client_script_deployments'),
+]
+
+## Netsuite save jobs, independent of each other
+## audit tables (ns_login_audits, ns_login_failure, ns_script_logs) save new events only by themselves
+def get_ns_jobs(ns, wh) -> list:
+    jobs = [(job[0], job[1], getattr(ns, job[2])) for job in ns_save_list]
+    jobs += [('Processing ns audit tables', 'ns_audits', lambda: save_ns_audits_to_warehouse(ns, wh))]
+    return jobs
+
+## Netsuite and AD users merge jobs, run after all Netsuite jobs
+def get_ns_merge_jobs(ns, wh) -> list:
+
+    ## AD users, for merging with Netsuite Employees and Partners
+    def get_ad_users():
+        users_df    = wh.get_table('ad_users')\
+                        .drop(columns=['id','passwordProfile_forceChangePasswordNextSignInWithMfa','passwordProfile_forceChangePasswordNextSignIn'])
+        users_df.columns = [ 'ad_'+c for c in users_df.columns]
+        return users_df
+
+    ## merge Netsuite Active Employees and AD users (ns_employees_ad_users)
+    ## This is a outer join, we are expecting all AD users to be Employees
+    def list_employees_ad_users():
+        employee_df = ns.list_employees(giveaccess_only=False, refresh=True, active_only=True)
+        return pd.merge(employee_df, get_ad_users(), how='outer', left_on='email', right_on='ad_userPrincipalName')
+
+    ## merge Netsuite Partners and AD users (ns_partners_ad_users)
+    ## This is a left join, not all AD users should be partners
+    def list_partners_ad_users():
+        partners_df = ns.list_partners(giveaccess_only=False, refresh=True)
+        return pd.merge(partners_df, get_ad_users(), how='left', left_on='email', right_on='ad_userPrincipalName')
+
+    return [
+        ('Processing ns_employees_ad_users',  'ns_employees_ad_users',   list_employees_ad_users),
+        ('Processing ns_partners_ad_users',   'ns_partners_ad_users',    list_partners_ad_users),
+    ]
+
+
+## Fan-out mode: start a run by putting one work item per table, for queue triggered workers to process in parallel
+def start_fanout_run(queue, source, tables) -> str:
+    run_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    logging.info(f'started: start_fanout_run() - {source} {run_id}, tables: {len(tables)}')
+    queue.put([{'source': source, 'run_id': run_id, 'table': table_name} for table_name in tables])
+    return run_id
+
+## Fan-out mode: process a single work item {'source', 'run_id', 'table'}, progress kept in the run-state ledger
+## the worker completing the last table puts the aggregation item ('_aggregate'), once, which runs merge_jobs
+def process_work_item(item, wh, jobs, merge_jobs, queue) -> None:
+    run_name, run_id, table_name = f"{item['source']}_fanout", item['run_id'], item['table']
+    logging.info(f'started: process_work_item() - {run_name} {run_id}: {table_name}')
+
+    metrics = RunMetrics(run_name, run_id)
+    if table_name == '_aggregate':
+        started_on = datetime.utcnow()
+        for job in merge_jobs:
+            run_save_job(wh, run_name, run_id, job, metrics)
+        wh.set_run_state(run_name, '_aggregate', run_id=run_id, status='completed', started_on=started_on, finished_on=datetime.utcnow())
+        metrics.save(wh)
+        return
+
+    job = next(job for job in jobs if job[1] == table_name)
+    run_save_job(wh, run_name, run_id, job, metrics)
+    metrics.save(wh)
+
+    ## all tables of the run completed
+    state = wh.get_run_state(run_name)
+    completed = set(state.table_name[(state.run_id == run_id) & (state.status == 'completed')])
+    if completed.issuperset(job[1] for job in jobs) and wh.claim_run_state(run_name, '_aggregate', run_id):
+        queue.put([{**item, 'table': '_aggregate'}])
@@ -1,6 +1,8 @@
 import pandas as pd
-import requests, logging
+import requests, logging, os
 from requests.adapters import HTTPAdapter, Retry
+from module.cache import DatasetCache
+from module.metrics import http_hook, MeasuredExecutor
 
 
 logging.info('module.infosec: loading...')
@@ -10,14 +12,22 @@ class Infosec:
     base_url    = ''  ## api base url, eg: 'https://securityiq-eu.infosecinstitute.com/api/v2'
     api_key     = ''  ## api key, enabled through user account
     headers     = {}  ## request header that contains api key
-    learners_df = pd.DataFrame()
-    campaigns_df        = pd.DataFrame()
+    cache       = None  ## per instance dataset cache of learners and campaigns
+    run_cache   = None  ## optional local folder of completed runs learners, kept between invocations
+    max_workers = 8     ## concurrent requests for campaigns/runs fan-out
+    http_adapter = HTTPAdapter  ## adapter factory mounted on sessions, eg: a benchmark mock/replay transport
 
     ## initialize headers
-    def __init__(self, base_url, api_key) -> None:
+    def __init__(self, base_url, api_key, run_cache=None, max_workers=8, cache=None, http_adapter=HTTPAdapter) -> None:
         logging.info('Infosec: initializing ...')
+        self.cache = cache or DatasetCache()
+        self.http_adapter = http_adapter
         self.base_url = base_url
         self.api_key  = api_key
+        self.run_cache   = run_cache
+        self.max_workers = max_workers
+        self.completed_runs = {}  ## (campaign, run) -> learners of completed runs
+        self.timeline_cursor = None  ## {'timestamp','id'} of the last timeline event read
         self.headers = { 
                             'Authorization' : f'Bearer {api_key}',
                              "Content-Type": "application/json"
@@ -27,14 +37,16 @@ class Infosec:
     def get_session(self, total=5, backoff_factor=1) -> dict:
         retries = Retry(total=total, backoff_factor=backoff_factor)
         s = requests.Session()
-        s.mount('https://', HTTPAdapter(max_retries=retries))
+        s.mount('https://', self.http_adapter(max_retries=retries))
+        s.hooks['response'].append(http_hook)
         return s    
 
     ## Low Level Get All Pages(Multiple Pages Call)
-    def get_all(self, url, params={}) -> dict:
+    def get_all(self, url, params=None, limit=100) -> dict:
         s = self.get_session()
+        params = dict(params or {})  ## own copy, get_all() runs concurrently
         params['page']  = 0       ## start from 1
-        params['limit'] = 100     ## maximize per page return
+        params['limit'] = limit   ## maximize per page return
         result = []
         ## loop till last page
         while (True): 
@@ -45,7 +57,7 @@ class Infosec:
                 temp_result = temp['data']
                 result += temp_result
                 ## last page reached, break
-                if len(temp_result) <100: break
+                if len(temp_result) <limit: break
             except Exception as e:
                 logging.info(f'Infosec: get_all() - Error: {{e}}')
                 result = False
@@ -57,14 +69,15 @@ class Infosec:
     ## Return List of Learners
     def list_learners(self, refresh=False) ->pd.DataFrame:
         logging.info('Infosec: list_learners()')
-        if (not refresh) and (not self.learners_df.empty):
-            return self.learners_df.copy()
+        cached = None if refresh else self.cache.get('learners')
+        if cached is not None:
+            return cached
         url = '/learners'
         data = self.get_all(url=url)
         df = pd.DataFrame(data)
         df['modified'] = pd.to_datetime(df.modified).dt.tz_localize(None)
 
-        self.learners_df = df
+        self.cache.put('learners', df)
         return df.copy()
     
     ## Return List of Learner Status For A Specific Campagin/Run
@@ -73,20 +86,59 @@ class Infosec:
         url = f'/campaigns/{campaign}/runs/{run}/learners'
         data = self.get_all(url=url)
         df = pd.DataFrame(data)
-        df['completed_on'] = pd.to_datetime(df.completed_on).dt.tz_localize(None)
+        if 'completed_on' in df.columns:
+            df['completed_on'] = pd.to_datetime(df.completed_on).dt.tz_localize(None)
         return df
 
+    ## Return Learner Status of many (campaign, run, completed) concurrently, as one dataframe
+    ## completed runs are served from cache, their learner status no longer change
+    def list_runs_learners(self, campaign_runs) -> pd.DataFrame:
+
+        def fetch(campaign_run):
+            campaign, run, completed = campaign_run
+            df = self.load_run_cache(campaign, run) if completed else None
+            if df is None:
+                df = self.list_campaignRunLearners(campaign=campaign, run=run)
+                df['campaign_id'] = campaign
+                df['run_id']      = run
+                if completed: self.save_run_cache(campaign, run, df)
+            return df
+
+        with MeasuredExecutor(max_workers=self.max_workers) as executor:
+            frames = list(executor.map(fetch, campaign_runs))
+
+        ## concat once
+        return pd.concat(frames, axis=0, ignore_index=True) if frames else pd.DataFrame()
+
+    ## Read learners of a completed run from cache, None if not cached
+    def load_run_cache(self, campaign, run) -> pd.DataFrame:
+        if (campaign, run) in self.completed_runs:
+            return self.completed_runs[(campaign, run)]
+        path = os.path.join(self.run_cache, f'{campaign}_{run}.pkl') if self.run_cache else None
+        if path and os.path.exists(path):
+            self.completed_runs[(campaign, run)] = pd.read_pickle(path)
+            return self.completed_runs[(campaign, run)]
+        return None
+
+    ## Cache learners of a completed run, in memory and in run_cache folder (if enabled)
+    def save_run_cache(self, campaign, run, df) -> None:
+        self.completed_runs[(campaign, run)] = df
+        if self.run_cache:
+            os.makedirs(self.run_cache, exist_ok=True)
+            df.to_pickle(os.path.join(self.run_cache, f'{campaign}_{run}.pkl'))
+
+    ## Return true if learner status of the run can no longer change
+    def is_run_completed(self, run) -> bool:
+        return str(run.get('status')).lower() in ('completed', 'complete', 'ended', 'finished', 'closed')
+
     ## Return list of learner progress for all runs of single campaign
     def list_campaignRunsLearners(self, campaign=None, runs=[]) -> pd.DataFrame:
         logging.info('Infosec: list_campaignRunsLearners()')
-        df = pd.DataFrame()
-        for run in runs:
-            temp_df = self.list_campaignRunLearners(campaign=campaign, run=run)
-            temp_df['campaign_id'] = campaign
-            temp_df['run_id']      = run
-            df = pd.concat([df,temp_df], axis=0)
-                
-        
+        df = self.list_runs_learners([(campaign, run, False) for run in runs])
+        return self.format_learner_progress(df)
+
+    ## Merge with learners and reformat header of learner progress
+    def format_learner_progress(self, df) -> pd.DataFrame:
         cols = ['learner_id', 'email', 'first_name', 'last_name', 'campaign_id', 'run_id', 'status', 'completed_on']
         
         ## Rows found, reformat header
@@ -104,12 +156,13 @@ class Infosec:
     ## List ALl Campaings
     def list_campaigns(self, refresh=False) -> pd.DataFrame:
         logging.info('Infosec: list_campaigns()')
-        if (not refresh) and (not self.campaigns_df.empty):
-            return self.campaigns_df.copy()        
+        cached = None if refresh else self.cache.get('campaigns')
+        if cached is not None:
+            return cached
         url = '/campaigns'
         data = self.get_all(url=url)
         df = pd.DataFrame(data)
-        self.campaigns_df = df
+        self.cache.put('campaigns', df)
         return df.copy()
 
     ## List All Runs For A Single Campaign
@@ -119,73 +172,85 @@ class Infosec:
         data = self.get_all(url=url)
         return data
 
-    ## List All Awareness Campaigns, and All associated Runs
+    ## List All Awareness Campaigns, and All associated Runs (runs fetched concurrently)
     def list_awareness_campaigns_runs(self) -> [dict]:
         logging.info('Infosec: list_awareness_campaigns_runs()')
-        campaigns_df = self.list_campaigns().query('type=="awareness"')
+        campaigns = self.list_campaigns().query('type=="awareness"').to_dict('records')
         
-        data = []
-        for idx, campaign in campaigns_df.iterrows():
-            data = data + [{
-                'campaign' : campaign.to_dict(),
-                'runs': self.list_campaign_runs(campaign=campaign.id)
-            }] 
-        return data
+        with MeasuredExecutor(max_workers=self.max_workers) as executor:
+            runs = list(executor.map(lambda c: self.list_campaign_runs(campaign=c.get('id')), campaigns))
+
+        return [{'campaign': c, 'runs': r or []} for c, r in zip(campaigns, runs)]
     
     ## Return Learner Progress Of Awareness Campaigns
+    ## campaigns -> runs -> learners fan out concurrently, only active runs are re-fetched
     def list_learner_progress(self) -> pd.DataFrame():
-        df = pd.DataFrame()
-        cam_runs     = self.list_awareness_campaigns_runs()
-        for cr in cam_runs:
-            run_ids = [r.get('id') for r in cr.get('runs')]
-            campaign_id = cr.get('campaign').get('id')
-            temp_df = self.list_campaignRunsLearners(campaign = campaign_id, runs = run_ids)
-            df = pd.concat([df, temp_df], axis=0)
-        return df
+        logging.info('Infosec: list_learner_progress()')
+        cam_runs = self.list_awareness_campaigns_runs()
+        campaign_runs = [
+            (cr.get('campaign').get('id'), r.get('id'), self.is_run_completed(r))
+            for cr in cam_runs for r in cr.get('runs')
+        ]
+        logging.info(f'Infosec: list_learner_progress() - runs: {len(campaign_runs)}, completed: {sum(c for _, _, c in campaign_runs)}')
+        df = self.list_runs_learners(campaign_runs)
+        return self.format_learner_progress(df)
     
-    def list_timeline_events(self, limit=1000) -> pd.DataFrame:
-        logging.info('Infosec: list_timeline_events()')
-        url = f'/timeline-events?limit={limit}'
-        records = self.get_all(url=url)
-        target_campaign_id = 'GiT'
-        results = [record for record in records if record.get('campaign_id') == target_campaign_id]
-        df = pd.DataFrame(results)
- 
-        return df
+    ## sort keys of event ids: numeric, so that '9' < '10', as strings only if an id is not numeric
+    @staticmethod
+    def id_keys(ids: pd.Series) -> pd.Series:
+        numeric = pd.to_numeric(ids, errors='coerce')
+        return ids if numeric.isna().any() else numeric
 
-    ## List All Runs For A Single Campaign
-    # List All Runs For A Single Campaign
-    def list_timeline_events(self, limit=1000) -> pd.DataFrame:
-        logging.info('Infosec: list_timeline_events()')
-        url = f'/timeline-events?limit={limit}'
-        records = self.get_all(url=url)
-        target_campaign_id = 'GiT'
-        results = [record for record in records if record.get('campaign_id') == target_campaign_id]
-        df = pd.DataFrame(results)
-        print(df.columns)
-
-        df.rename(columns={
-            'learner_id': 'learner_id',
-            'campaign_id': 'campaign_id',
+    ## List Latest Timeline Event per Learner/Run of a campaign, as learner progress rows
+    ## only events after cursor {'timestamp','id'} are read, cursor of the last event read is kept in timeline_cursor
+    def list_timeline_events(self, campaign_id='GiT', cursor=None, limit=1000) -> pd.DataFrame:
+        logging.info(f'Infosec: list_timeline_events() - campaign: {campaign_id}, cursor: {cursor}')
+        cols = ['learner_id', 'email', 'first_name', 'last_name', 'campaign_id', 'run_id', 'status', 'completed_on']
+        self.timeline_cursor = cursor
+
+        ## filter by campaign and start time at source
+        ## campaign_id and start_date are not in the api reference, unverified against a live response: filtered again below
+        params = {'campaign_id': campaign_id}
+        if cursor:
+            params['start_date'] = cursor.get('timestamp')
+        records = self.get_all(url='/timeline-events', params=params, limit=limit) or []
+
+        ## in case the filters are not supported by the api, filter again here
+        df = pd.DataFrame(records)
+        if df.empty:
+            return pd.DataFrame(columns=cols)
+        df = df[df.campaign_id == campaign_id].copy()
+        df['timestamp'] = pd.to_datetime(df.timestamp)
+        df['id'] = df.id.astype(str)
+        cursor_ids = [str(cursor.get('id'))] if cursor else []
+        keys = self.id_keys(pd.concat([df.id, pd.Series(cursor_ids, dtype=str)], ignore_index=True))
+        df['id_key'] = keys.iloc[:len(df)].values
+        if cursor:
+            cursor_ts = pd.to_datetime(cursor.get('timestamp'))
+            df = df[(df.timestamp > cursor_ts) | ((df.timestamp == cursor_ts) & (df.id_key > keys.iloc[-1]))]
+        if df.empty:
+            return pd.DataFrame(columns=cols)
+
+        ## move cursor to the last event read
+        last = df.sort_values(['timestamp', 'id_key']).iloc[-1]
+        self.timeline_cursor = {'timestamp': last.timestamp.isoformat(), 'id': last.id}
+
+        df = df.rename(columns={
             'campaign_run_id': 'run_id',
             'type': 'status',
             'timestamp': 'completed_on'
-        }, inplace=True)
+        })
 
         df['email'] = None
         df['first_name'] = None
         df['last_name'] = None
 
-        if 'completed_on' in df.columns:
-            df['completed_on'] = pd.to_datetime(df['completed_on'])
-        else:
-            raise KeyError("The 'completed_on' column (timestamp) is missing in the DataFrame.")
-
+        ## latest event per learner/run
         df = df.sort_values(by=['learner_id', 'completed_on'], ascending=[True, False])
-        df = df.drop_duplicates(subset=['learner_id'], keep='first')
+        df = df.drop_duplicates(subset=['learner_id', 'run_id'], keep='first')
         
         df['status'] = df['status'].apply(lambda x: 'completed' if x == 'completed-aware-module' else 'not_started' if x == 'started-aware-reminder' else 'started')
         df['completed_on'] = df['completed_on'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
-        df = df[['learner_id', 'email', 'first_name', 'last_name', 'campaign_id', 'run_id', 'status', 'completed_on']]
+        df = df[cols]
     
-        return df
\ No newline at end of file
+        return df
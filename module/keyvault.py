@@ -0,0 +1,73 @@
+import logging, os, threading, time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+## Process level credential and Key Vault secrets, kept between invocations on a warm host
+## azure sdk packages are imported on first use, keeping them out of the function app cold start
+
+credential = None  ## shared DefaultAzureCredential, caches its own access tokens
+clients    = {}    ## vault_url -> SecretClient
+secrets    = {}    ## (vault_url, name) -> (value, expiry in time.monotonic())
+lock       = threading.Lock()
+
+
+## Return the shared credential, created on first use
+def get_credential():
+    global credential
+    with lock:
+        if credential is None:
+            from azure.identity import DefaultAzureCredential
+            logging.info('keyvault: get_credential() - creating DefaultAzureCredential')
+            credential = DefaultAzureCredential()
+        return credential
+
+
+## Return the shared client of a vault, vault_name defaults to KEY_VAULT_NAME
+def get_client(vault_name=None):
+    from azure.keyvault.secrets import SecretClient
+    vault_name = vault_name or os.environ["KEY_VAULT_NAME"]
+    vault_url  = f"https://{vault_name}.vault.azure.net"
+    cred = get_credential()
+    with lock:
+        if vault_url not in clients:
+            clients[vault_url] = SecretClient(vault_url=vault_url, credential=cred)
+        return clients[vault_url]
+
+
+## Seconds a secret can be cached: ttl, or less if the secret expires earlier
+def get_secret_ttl(secret, ttl) -> float:
+    expires_on = secret.properties.expires_on
+    if expires_on is None:
+        return ttl
+    return max(0, min(ttl, (expires_on - datetime.now(timezone.utc)).total_seconds()))
+
+
+## Return {name: value} of secrets, missing or expired ones are fetched concurrently
+def get_secrets(names, vault_name=None, ttl=3600, max_workers=5) -> dict:
+    client = get_client(vault_name)
+    now = time.monotonic()
+
+    result, missing = {}, []
+    with lock:
+        for name in names:
+            cached = secrets.get((client.vault_url, name))
+            if cached and cached[1] > now:
+                result[name] = cached[0]
+            else:
+                missing += [name]
+
+    if missing:
+        logging.info(f'keyvault: get_secrets() - fetching {missing}')
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+            fetched = list(executor.map(client.get_secret, missing))
+        with lock:
+            for name, secret in zip(missing, fetched):
+                secrets[(client.vault_url, name)] = (secret.value, now + get_secret_ttl(secret, ttl))
+                result[name] = secret.value
+
+    return result
+
+
+## Return value of a single secret
+def get_secret(name, vault_name=None, ttl=3600) -> str:
+    return get_secrets([name], vault_name=vault_name, ttl=ttl)[name]
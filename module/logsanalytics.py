@@ -1,35 +1,210 @@
-import logging
-from datetime import datetime, timedelta
-from azure.monitor.query import LogsQueryClient
+import logging, json, time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import wait, FIRST_COMPLETED
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+from azure.monitor.query import LogsQueryClient, LogsQueryStatus
 import pandas as pd
-import numpy as np
+from module.metrics import add_http_response, MeasuredExecutor
+
+## arrow backed strings if pyarrow is installed, less memory than python objects
+try:
+    import pyarrow
+    string_dtype = 'string[pyarrow]'
+except ImportError:
+    string_dtype = 'string'
+
+## azure sdk pipeline policy adding each query response (retries included) to the measured table, see module.metrics
+class HttpMetricsPolicy(SansIOHTTPPolicy):
+
+    def on_request(self, request):
+        request.context['metrics_start'] = time.perf_counter()
+
+    def on_response(self, request, response):
+        body = response.http_response.body()
+        add_http_response(len(body or b''), time.perf_counter() - request.context['metrics_start'])
+
 
 class LogsAnalytics:
 
     client    = None
     logs_id   = ''
+    max_rows  = 500000  ## Log Analytics result rows limit, a slice returning this many rows is truncated
+
+    ## Log Analytics column type -> pandas nullable dtype, datetime handled separately
+    column_dtypes = {
+        'string'  : string_dtype,
+        'guid'    : string_dtype,
+        'dynamic' : string_dtype,
+        'timespan': string_dtype,
+        'long'    : 'Int64',
+        'int'     : 'Int32',
+        'real'    : 'Float64',
+        'decimal' : 'Float64',
+        'bool'    : 'boolean',
+    }
 
-    def __init__(self, logs_id, credential) -> None:
+    ## Rollup profiles, summarized at source by list_rollup()
+    ## query: KQL with {param} placeholders, keys: group by columns, measures: summable counts
+    rollup_profiles = {
+        'signins_daily_user_app_country': {
+            'table'  : 'ad_signins_daily',
+            'query'  : """
+                SigninLogs
+                | extend Country = tostring(LocationDetails.countryOrRegion)
+                | extend IsFailure = ResultType !in ({success_codes})
+                | summarize signins = count(), failures = countif(IsFailure)
+                    by Day = bin(TimeGenerated, {bin}), UserId, UserPrincipalName, AppDisplayName, Country
+                """,
+            'params'  : {'success_codes': '"0", "50125", "50140"', 'bin': '1d'},
+            'keys'    : ['Day', 'UserId', 'UserPrincipalName', 'AppDisplayName', 'Country'],
+            'measures': ['signins', 'failures'],
+        },
+        'signin_failures_daily_ip_reason': {
+            'table'  : 'ad_signin_failures_daily',
+            'query'  : """
+                SigninLogs
+                | where ResultType !in ({success_codes})
+                | extend Country = tostring(LocationDetails.countryOrRegion)
+                | extend FailureReason = tostring(Status.failureReason)
+                | summarize failures = count(), users = count_distinct(UserId)
+                    by Day = bin(TimeGenerated, {bin}), IPAddress, Country, ResultType, FailureReason
+                """,
+            'params'  : {'success_codes': '"0", "50125", "50140"', 'bin': '1d'},
+            'keys'    : ['Day', 'IPAddress', 'Country', 'ResultType', 'FailureReason'],
+            'measures': ['failures', 'users'],
+        },
+        'audits_daily_activity': {
+            'table'  : 'ad_audits_daily',
+            'query'  : """
+                AuditLogs
+                | summarize operations = count()
+                    by Day = bin(TimeGenerated, {bin}), Category, ActivityDisplayName, Result
+                """,
+            'params'  : {'bin': '1d'},
+            'keys'    : ['Day', 'Category', 'ActivityDisplayName', 'Result'],
+            'measures': ['operations'],
+        },
+    }
+
+    ## transport: optional azure-core transport, eg: a benchmark mock/replay transport
+    def __init__(self, logs_id, credential, transport=None) -> None:
         logging.info('LogAanalytics: initializing...')
-        self.client = LogsQueryClient(credential)
+        options = dict(transport=transport) if transport else {}
+        self.client = LogsQueryClient(credential, per_retry_policies=[HttpMetricsPolicy()], **options)
         self.logs_id = logs_id
 
     ## default timeout is 5m
-    def query_table(self, query, time_span, server_timeout=300) -> pd.DataFrame:
+    ## slice_span: raw row queries only, time_span is split into slices (aligned to midnight UTC) queried concurrently,
+    ## slices returned partial/truncated are split further and retried, rows are concatenated
+    ## aggregate queries (summarize, top, take, distinct...) must not be sliced: slice_span=None queries time_span at once
+    def query_table(self, query, time_span, server_timeout=300, slice_span=None, min_slice=timedelta(minutes=10), max_workers=4) -> pd.DataFrame:
         
-        logging.info('LogAanalytics: query_table()')
-        ## query and process response
-        response = self.client.query_workspace(self.logs_id, query, timespan=time_span, server_timeout=server_timeout)
-
-        ## query and return
-        data = response.tables
-        for table in data:   ## always one table returned only
-            df  = pd.DataFrame(table.rows, columns=table.columns)
-        return df
+        start, end = self.get_time_range(time_span)
+        slices = self.split_time_range(start, end, slice_span) if slice_span else [(start, end)] if start < end else []
+        logging.info(f'LogAanalytics: query_table() - {start} to {end}, slices: {len(slices)}')
+
+        ## empty time span, no rows but typed columns
+        if not slices:
+            return self.query_slice(f'{query}\n| take 0', (start - timedelta(minutes=1), start), server_timeout)[0]
+
+        frames = {}
+        with MeasuredExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(self.query_slice, query, s, server_timeout): s for s in slices}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    s = pending.pop(future)
+                    splittable = slice_span and s[1] - s[0] > min_slice
+                    try:
+                        df, complete = future.result()
+                    except HttpResponseError as e:
+                        ## timeout or size limit, smallest slice (or unsliced query) cannot be split further
+                        if not splittable: raise
+                        logging.info(f'LogAanalytics: query_table() - slice {s[0]} failed, splitting: {e.message}')
+                        df, complete = None, False
+
+                    if complete or not splittable:
+                        if not complete:
+                            logging.warning(f'LogAanalytics: query_table() - slice {s[0]} to {s[1]} is incomplete')
+                        frames[s] = df
+                        continue
 
+                    ## split in half and retry
+                    mid = s[0] + (s[1] - s[0]) / 2
+                    for sub in ((s[0], mid), (mid, s[1])):
+                        pending[executor.submit(self.query_slice, query, sub, server_timeout)] = sub
 
-    def list_signins(self, time_span=timedelta(days=30), server_timeout=300) -> pd.DataFrame:
+        ## concat once, in time order
+        return pd.concat([frames[s] for s in sorted(frames)], ignore_index=True) if len(frames) > 1 else frames[slices[0]]
+
+    ## query a single time slice, return dataframe and whether result is complete
+    def query_slice(self, query, time_range, server_timeout=300) -> (pd.DataFrame, bool):
+        response = self.client.query_workspace(self.logs_id, query, timespan=time_range, server_timeout=server_timeout)
+
+        ## partial result, keep what is returned in case it can't be split further
+        if response.status == LogsQueryStatus.PARTIAL:
+            table = response.partial_data[0]
+            return self.table_to_df(table), False
+
+        table = response.tables[0]   ## always one table returned only
+        return self.table_to_df(table), len(table.rows) < self.max_rows
+
+    ## convert LogsTable to dataframe column by column, typed from the table column types
+    ## nulls become pd.NA/NaT, datetime are naive UTC so that they are compatible with SQL datetime field type
+    def table_to_df(self, table) -> pd.DataFrame:
+        values = list(zip(*table.rows)) if table.rows else [()] * len(table.columns)
+        data = {}
+        for name, col_type, col in zip(table.columns, table.columns_types, values):
+            if col_type == 'datetime':
+                data[name] = pd.to_datetime(pd.Series(col, dtype=object), utc=True, errors='coerce').dt.tz_localize(None)
+                continue
+            col = pd.Series(col, dtype=object)
+            if col_type in ('guid', 'timespan'):
+                col = col.mask(col == 'None')  ## sdk converts null guid/timespan to 'None'
+            elif col_type == 'dynamic':
+                col = col.map(lambda v: v if v is None or isinstance(v, str) else json.dumps(v))
+            data[name] = col.astype(self.column_dtypes.get(col_type, object))
+        return pd.DataFrame(data, columns=table.columns)
+
+    ## remove duplicates by key columns only (whole row if keys not given)
+    def drop_duplicates(self, df, keys=None) -> pd.DataFrame:
+        keys = [k for k in keys if k in df.columns] if keys else None
+        return df.drop_duplicates(subset=keys, ignore_index=True)
+
+    ## convert time_span (timedelta, (start, end) or (start, timedelta)) to (start, end)
+    def get_time_range(self, time_span) -> (datetime, datetime):
+        if isinstance(time_span, timedelta):
+            end = datetime.now(timezone.utc)
+            return end - time_span, end
+        start, end = time_span
+        if isinstance(end, timedelta):
+            end = start + end
+        return start, end
+
+    ## split (start, end) into consecutive slices of slice_span, boundaries aligned to midnight UTC (slice_span dividing a day)
+    ## first and last slices may be shorter
+    def split_time_range(self, start, end, slice_span) -> list:
+        midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        boundary = midnight + slice_span * ((start - midnight) // slice_span + 1)
+        slices = []
+        while start < end:
+            slices += [(start, min(boundary, end))]
+            start, boundary = boundary, boundary + slice_span
+        return slices
+
+
+    ## return (since - overlap, now) if since provided, else time_span unchanged
+    def get_incremental_span(self, time_span, since=None, overlap=timedelta(minutes=15)):
+        if since is None:
+            return time_span
+        since = pd.Timestamp(since)
+        since = since.tz_localize('UTC') if since.tzinfo is None else since  ## TimeGenerated is saved as naive UTC
+        return (since.to_pydatetime() - overlap, datetime.now(timezone.utc))
+
+    def list_signins(self, time_span=timedelta(days=30), server_timeout=300, since=None, overlap=timedelta(minutes=15)) -> pd.DataFrame:
         logging.info('LogAanalytics: list_signin()')
+        time_span = self.get_incremental_span(time_span, since, overlap)
         query="""
         SigninLogs
         | project TimeGenerated, Id, UserId, AppDisplayName, ResultType, IPAddress, LocationDetails, DeviceDetail
@@ -40,18 +215,15 @@ class LogsAnalytics:
         | project-away  DeviceDetail, LocationDetails
         """
 
-        df = self.query_table(query, time_span, server_timeout)
+        df = self.query_table(query, time_span, server_timeout, slice_span=timedelta(days=1))
 
-        # standardize null values to None
-        df = df.fillna(np.nan).replace([np.nan], [None]).drop_duplicates()
-
-        # Fix DateTime so that it is compatible with SQL datetime field type
-        df['TimeGenerated'] = pd.to_datetime(df.TimeGenerated).dt.tz_localize(None) 
-        
-        return df
+        ## slices may overlap at the boundaries
+        return self.drop_duplicates(df, keys=['Id'])
     
 
-    def list_audits_alerts(self, time_span=timedelta(days=30), server_timeout=300) -> pd.DataFrame:
+    def list_audits_alerts(self, time_span=timedelta(days=30), server_timeout=300, since=None, overlap=timedelta(minutes=15)) -> pd.DataFrame:
+        logging.info('LogAanalytics: list_audits_alerts()')
+        time_span = self.get_incremental_span(time_span, since, overlap)
         query = r'''
             AuditLogs
             | extend initiatedby_userid  = tostring(InitiatedBy.user.id)          
@@ -71,21 +243,17 @@ class LogsAnalytics:
                 | summarize modified_properties = replace_strings(strcat_array(make_list(modified_properties), '/'),dynamic(['"',']','[','/']),dynamic(['','','','']))
             )
             | where InitiatedBy  has "user"  and target_id != "" and target_id  != initiatedby_userid
-            | project TimeGenerated, Category, AADOperationType, ActivityDisplayName, Result, initiatedby_userid, initiatedby_upn, initiatedby_name, initiatedby_ip, target_id, target_displayName, target_upn, target_type, additional_detail, modified_properties
+            | project Id, TimeGenerated, Category, AADOperationType, ActivityDisplayName, Result, initiatedby_userid, initiatedby_upn, initiatedby_name, initiatedby_ip, target_id, target_displayName, target_upn, target_type, additional_detail, modified_properties
             '''
-        df = self.query_table(query, time_span)
+        df = self.query_table(query, time_span, server_timeout, slice_span=timedelta(days=1))
         
-        # standardize null values to None
-        df = df.fillna(np.nan).replace([np.nan], [None]).drop_duplicates()
-        
-        # Fix DateTime so that it is compatible with SQL datetime field type
-        df['TimeGenerated'] = pd.to_datetime(df.TimeGenerated).dt.tz_localize(None) 
-        
-        return df
+        ## one row per audit / additional detail / target
+        return self.drop_duplicates(df, keys=['Id', 'additional_detail', 'target_id'])
     
     ## Query for Realtime Alerts Purpose
-    def list_audits(self, time_span=timedelta(days=30), server_timeout=300) -> pd.DataFrame:
+    def list_audits(self, time_span=timedelta(days=30), server_timeout=300, since=None, overlap=timedelta(minutes=15)) -> pd.DataFrame:
         logging.info('LogAanalytics: list_audits()')
+        time_span = self.get_incremental_span(time_span, since, overlap)
         query = """ 
         AuditLogs
         | extend Initiatedby_userId           = tostring(InitiatedBy.user.id)          
@@ -104,28 +272,62 @@ class LogsAnalytics:
                 LoggedByService, target_id, target_displayName, target_type, target_modifiedProperties, AdditionalDetails
         """ 
 
-        df = self.query_table(query, time_span)
+        df = self.query_table(query, time_span, server_timeout, slice_span=timedelta(days=1))
         
-        # standardize null values to None
-        df = df.fillna(np.nan).replace([np.nan], [None]).drop_duplicates()
-        
-        # Fix DateTime so that it is compatible with SQL datetime field type
-        df['TimeGenerated'] = pd.to_datetime(df.TimeGenerated).dt.tz_localize(None) 
-        
-        return df
+        ## one row per audit / target
+        return self.drop_duplicates(df, keys=['Id', 'target_id'])
     
 
     ### Generic Query
     #################
-    def list(self, query=None, time_span=timedelta(days=30), server_timeout=300) -> pd.DataFrame:
+    ## slice_span: raw row queries only, aggregate queries are run at once
+    def list(self, query=None, time_span=timedelta(days=30), server_timeout=300, keys=None, slice_span=None) -> pd.DataFrame:
         logging.info('LogAanalytics: list()')
-        df = self.query_table(query, time_span)
-        
-        # standardize null values to None
-        df = df.fillna(np.nan).replace([np.nan], [None]).drop_duplicates()
-        
-        # Fix DateTime so that it is compatible with SQL datetime field type
-        if 'TimeGenerated' in df.columns:
-            df['TimeGenerated'] = pd.to_datetime(df.TimeGenerated).dt.tz_localize(None) 
-        
-        return df
\ No newline at end of file
+        df = self.query_table(query, time_span, server_timeout, slice_span)
+        return self.drop_duplicates(df, keys)
+
+    ### Streaming
+    #############
+    ## Yield (slice_end, dataframe) of list_func one time slice at a time, the whole time span is never held in memory
+    ## the first slice is a short probe (probe_span), next slices are resized from the size of the last one,
+    ## so that each dataframe stays under max_bytes, up to slice_span
+    def stream(self, list_func, time_span=timedelta(days=30), since=None, overlap=timedelta(minutes=15), slice_span=timedelta(hours=6), min_slice=timedelta(minutes=10), probe_span=timedelta(minutes=30), max_bytes=256*1024**2):
+        start, end = self.get_time_range(self.get_incremental_span(time_span, since, overlap))
+        span = min(probe_span, slice_span)
+        while start < end:
+            slice_end = min(start + span, end)
+            df = list_func(time_span=(start, slice_end))
+            size = df.memory_usage(deep=True).sum()
+            logging.info(f'LogAanalytics: stream() - {start} to {slice_end}, rows: {df.shape[0]}, MB: {size/1024**2:.1f}')
+            yield slice_end, df
+            del df
+
+            ## at most double the slice when far below the ceiling
+            ratio = min(0.8 * max_bytes / size, 2) if size else 2
+            span  = min(slice_span, max(min_slice, (slice_end - start) * ratio))
+            start = slice_end
+
+    ### Rollups
+    ###########
+    ## Summarized rows of a rollup profile, params override the profile default params
+    ## since: rollup from start of that day only, for incremental refresh of the latest days
+    def list_rollup(self, profile, time_span=timedelta(days=30), server_timeout=300, since=None, **params) -> pd.DataFrame:
+        logging.info(f'LogAanalytics: list_rollup() - {profile}')
+        rollup = self.rollup_profiles[profile]
+        query  = rollup['query'].format(**{**rollup['params'], **params})
+        keys, measures = rollup['keys'], rollup['measures']
+
+        if since is not None:
+            time_span = self.get_incremental_span(time_span, pd.Timestamp(since).floor('D'), overlap=timedelta(0))
+        ## summarized query, run at once
+        df = self.query_table(query, time_span, server_timeout)
+
+        ## empty keys instead of null, so that rows can be upserted by keys
+        df[keys] = df[keys].apply(lambda col: col.fillna('') if col.dtype != 'datetime64[ns]' else col)
+
+        ## one row per keys, so that rows can be upserted
+        df = df.groupby(keys, as_index=False, sort=False)[measures].sum()
+
+        if 'failures' in measures and 'signins' in measures:
+            df['failure_rate'] = (df.failures / df.signins).astype('Float64')
+        return df
@@ -0,0 +1,148 @@
+import logging, json, os, threading, time, contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+
+## resource (peak RSS) is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+## App Insights custom metrics through OpenTelemetry, optional (azure-monitor-opentelemetry, see requirements-optional.txt)
+try:
+    from azure.monitor.opentelemetry import configure_azure_monitor
+    from opentelemetry import metrics as otel_metrics
+except ImportError:
+    configure_azure_monitor = None
+
+## ETL instrumentation, per job and per table:
+##   extract_seconds   : wall time reading the source, including transforms done by the source module
+##   transform_seconds : CPU time of the source module (parsing, pandas), network waits excluded
+##   load_seconds      : wall time writing to the warehouse
+##   http_requests, http_bytes, http_seconds : requests made, bytes received and time waited on responses
+##   rows, rows_per_sec
+##   process_peak_rss_mb : peak resident memory of the whole process so far, not of the table
+## HTTP hooks and warehouse loads add to the current table of their context (thread, or MeasuredExecutor task),
+## so that tables measured concurrently in a process do not mix
+
+current = contextvars.ContextVar('metrics_current', default=None)  ## record of the table being measured
+lock    = threading.Lock()
+meter   = None
+instruments = {}
+
+metrics_table = 'etl_run_metrics'
+metric_names  = ['extract_seconds', 'transform_seconds', 'load_seconds', 'http_requests', 'http_bytes', 'http_seconds', 'rows', 'rows_per_sec', 'process_peak_rss_mb']
+
+
+## add a response to the current table, for HTTP clients without requests hooks (eg: azure sdk pipeline policies)
+def add_http_response(nbytes, seconds):
+    record = current.get()
+    if record is None:
+        return
+    with lock:
+        record['http_requests'] += 1
+        record['http_bytes']    += nbytes
+        record['http_seconds']  += seconds
+
+
+## requests response hook, add to session.hooks['response']
+def http_hook(response, *args, **kwargs):
+    add_http_response(len(response.content or b''), response.elapsed.total_seconds())
+
+
+## time a warehouse load of the current table
+@contextmanager
+def timed_load(rows=0):
+    record = current.get()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        ## a table measured concurrently (eg: in-memory fan-out workers) may have completed in the meantime
+        with lock:
+            if record is not None and 'load_cpu_seconds' in record:
+                record['load_seconds']     += time.perf_counter() - wall
+                record['load_cpu_seconds'] += time.process_time() - cpu
+                record['rows']             += rows
+
+
+## peak resident memory of the process so far, in MB
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  ## KB on Linux
+
+
+## ThreadPoolExecutor running tasks in a copy of the submitter context, so that their HTTP requests
+## add to the table measured by the submitter
+class MeasuredExecutor(ThreadPoolExecutor):
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+## App Insights meter, configured once if APPLICATIONINSIGHTS_CONNECTION_STRING is set
+def get_meter():
+    global meter
+    with lock:
+        if meter is None and configure_azure_monitor and os.environ.get('APPLICATIONINSIGHTS_CONNECTION_STRING'):
+            configure_azure_monitor()
+            meter = otel_metrics.get_meter('idgov.etl')
+        return meter
+
+
+## Metrics of a job run (eg: timer_update_ns), one record per table
+class RunMetrics:
+
+    def __init__(self, job_name, run_id=None) -> None:
+        self.job_name = job_name
+        self.run_id   = run_id or datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        self.records  = []
+
+    ## measure a table, for the duration of the with-block
+    @contextmanager
+    def table(self, table_name):
+        record = {
+            'job_name': self.job_name, 'run_id': self.run_id, 'table_name': table_name, 'started_on': datetime.utcnow(),
+            'http_requests': 0, 'http_bytes': 0, 'http_seconds': 0.0, 'load_seconds': 0.0, 'load_cpu_seconds': 0.0, 'rows': 0
+        }
+        token = current.set(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            current.reset(token)
+            wall = time.perf_counter() - wall
+            cpu  = time.process_time() - cpu
+            with lock:
+                load_cpu_seconds = record.pop('load_cpu_seconds')
+            record['extract_seconds']   = wall - record['load_seconds']
+            record['transform_seconds'] = max(0.0, cpu - load_cpu_seconds)
+            record['rows_per_sec']      = record['rows'] / wall if wall > 0 else None
+            record['process_peak_rss_mb'] = get_peak_rss_mb()
+            self.records += [record]
+            logging.info(f'metrics: {json.dumps(record, default=str)}')
+
+    ## send records as App Insights custom metrics, dimensions: job_name, table_name
+    def emit(self) -> None:
+        meter = get_meter()
+        if meter is None:
+            return
+        for record in self.records:
+            attributes = {'job_name': self.job_name, 'table_name': record['table_name']}
+            for name in metric_names:
+                if record.get(name) is None:
+                    continue
+                if name not in instruments:
+                    instruments[name] = meter.create_histogram(f'etl_{name}')
+                instruments[name].record(record[name], attributes=attributes)
+
+    ## emit and save records to the warehouse metrics table, saved records are cleared
+    def save(self, wh) -> None:
+        if not self.records:
+            return
+        self.emit()
+        wh.append(metrics_table, pd.DataFrame(self.records))
+        self.records = []
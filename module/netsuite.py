@@ -1,10 +1,14 @@
-import requests, logging, math, random, time, urllib, hmac, hashlib, base64
+import requests, logging, math, random, time, urllib, hmac, hashlib, base64, os, json
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine, MetaData, Table, func, text
 from math import floor 
 import pandas as pd
 from requests.adapters import HTTPAdapter, Retry
 from requests_oauthlib import OAuth1Session
 from oauthlib import oauth1
+from module.cache import DatasetCache
+from module.metrics import http_hook, MeasuredExecutor
+from module.static import load_static_csv
 
 # import sys
 # sys.path.append('./module')
@@ -22,26 +26,34 @@ class Netsuite:
     deploy = 1
     script = 1740
     standard_params = {}
-
-    ## data related
-    employees_df = pd.DataFrame()
-    partners_df = pd.DataFrame()
-    subsidiaries_df = pd.DataFrame()
-    roles_df = pd.DataFrame()
-    role_permissions_df = pd.DataFrame()
-    employee_roles_df = pd.DataFrame()
-    employee_permissions_df = pd.DataFrame()
-    partner_roles_df = pd.DataFrame()
-    partner_permissions_df = pd.DataFrame()
-    role_subsidiaries_df = pd.DataFrame()
-    approval_matrix_df = pd.DataFrame()
-    employee_license_df = pd.DataFrame()
-    role_usage_df = pd.DataFrame()
-    scripts_df    = pd.DataFrame()
+    http_adapter = HTTPAdapter  ## adapter factory mounted on sessions, eg: a benchmark mock/replay transport
+
+    ## data related, per instance dataset cache
+    cache = None
+
+    ## SuiteQL result cache, by dataset: (ttl, freshness probe[, max age])
+    ## past ttl, an entry is still served while its probe (single value query) returns the same value, up to its max age
+    ## role, role permission/restriction and script records have no last modified date in SuiteQL:
+    ## their probes are row checksums (count, sums of ids and levels), missing renames and other attribute changes,
+    ## so they are probed every 15 minutes and fully re-queried every 6 hours (their former blind ttl)
+    query_cache = None
+    cache_policies = {
+        'subsidiaries'     : (timedelta(hours=24), "SELECT TO_CHAR(MAX(lastmodifieddate), 'YYYY-MM-DD HH24:MI:SS') AS probe FROM Subsidiary"),
+        'roles'            : (timedelta(minutes=15), "SELECT COUNT(*) || '/' || SUM(id) || '/' || SUM(CASE WHEN isinactive = 'T' THEN id ELSE 0 END) AS probe FROM role", timedelta(hours=6)),
+        'role_restrictions': (timedelta(minutes=15), "SELECT COUNT(*) || '/' || SUM(role) || '/' || SUM(segment) || '/' || SUM(CASE WHEN viewingallowed = 'T' THEN role ELSE 0 END) AS probe FROM roleRestrictions", timedelta(hours=6)),
+        'role_permissions' : (timedelta(minutes=15), "SELECT COUNT(*) || '/' || SUM(role) || '/' || SUM(permlevel) || '/' || SUM(role * permlevel) AS probe FROM RolePermissions", timedelta(hours=6)),
+        'scripts'          : (timedelta(minutes=15), "SELECT COUNT(*) || '/' || SUM(id) || '/' || SUM(CASE WHEN isinactive = 'T' THEN id ELSE 0 END) AS probe FROM script", timedelta(hours=6)),
+        'custom_records'   : (timedelta(hours=24), "SELECT TO_CHAR(MAX(lastModifiedDate), 'YYYY-MM-DD HH24:MI:SS') AS probe FROM CustomRecordType"),
+        'custom_lists'     : (timedelta(hours=24), "SELECT TO_CHAR(MAX(lastModifiedDate), 'YYYY-MM-DD HH24:MI:SS') AS probe FROM CustomList")
+    }
+    ## default max age: entries are fully re-queried past it, whatever their probe says (changes not seen by lastmodifieddate)
+    cache_max_age = timedelta(days=7)
 
     ## Initialize
-    def __init__(self, account_id, consumer_key, consumer_secret, token_id, token_secret, signature_method='HMAC-SHA256', version='1.0', script=1740, deploy=1) -> None:
+    def __init__(self, account_id, consumer_key, consumer_secret, token_id, token_secret, signature_method='HMAC-SHA256', version='1.0', script=1740, deploy=1, query_cache=None, cache=None, http_adapter=HTTPAdapter) -> None:
         logging.info('Netsuite: initializing ...')
+        self.cache = cache or DatasetCache()
+        self.http_adapter = http_adapter
         self.account_id = account_id
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
@@ -57,6 +69,11 @@ class Netsuite:
             'deploy': deploy
         }
 
+        ## SuiteQL result cache folder, disabled if not provided
+        self.query_cache = query_cache
+        if query_cache:
+            os.makedirs(query_cache, exist_ok=True)
+
     ############################
     ## Low Level Data Retrieval
     ############################
@@ -71,6 +88,8 @@ class Netsuite:
             realm=self.account_id,
             signature_method=oauth1.SIGNATURE_HMAC_SHA256
         )
+        client.mount('https://', self.http_adapter())
+        client.hooks['response'].append(http_hook)
 
         params = self.standard_params
         headers = {
@@ -82,7 +101,11 @@ class Netsuite:
         return response.json()
     
     ## Low Level Query All Pages(Multiple Pages Call)
-    def query_all(self, action='queryRun', query=None,  ss_id=None, page_szie=10000):
+    ## cache: dataset name in cache_policies, result served from query_cache if still fresh
+    def query_all(self, action='queryRun', query=None,  ss_id=None, page_szie=10000, cache=None):
+
+        if cache and self.query_cache and action == 'queryRun':
+            return self.query_cached(query, cache, page_szie)
 
         body= {
             "action":   action,
@@ -109,6 +132,66 @@ class Netsuite:
 
         ## done
         return result
+
+    ## Query through the result cache, keyed by normalised query text
+    def query_cached(self, query, cache, page_szie=10000):
+        ttl, probe_query, *max_age = self.cache_policies[cache]
+        max_age = max_age[0] if max_age else self.cache_max_age
+        normalised = ' '.join(query.split())
+        key = hashlib.sha1(f'{self.account_id}|{normalised}'.encode()).hexdigest()
+        path = os.path.join(self.query_cache, f'{cache}_{key}.json')
+
+        entry = None
+        if os.path.exists(path):
+            with open(path) as f:
+                entry = json.load(f)
+
+        ## fresh within ttl
+        now = datetime.utcnow()
+        if entry and now - datetime.fromisoformat(entry['saved_at']) < ttl:
+            logging.info(f'Netsuite: query_cached() - {cache}: hit')
+            return entry['data']
+
+        ## past ttl, cheap probe decides, up to max_age since the last full query
+        probe = None
+        if probe_query:
+            probe_result = self.query_all(query=probe_query)
+            probe = probe_result[0].get('probe') if probe_result else None
+            fetched_at = datetime.fromisoformat(entry.get('fetched_at', entry['saved_at'])) if entry else None
+            if entry and probe is not None and probe == entry['probe'] and now - fetched_at < max_age:
+                logging.info(f'Netsuite: query_cached() - {cache}: unchanged ({probe})')
+                entry['saved_at'] = now.isoformat()
+                self.save_cache_entry(path, entry)
+                return entry['data']
+
+        ## full query, failed queries are not cached
+        logging.info(f'Netsuite: query_cached() - {cache}: miss')
+        data = self.query_all(query=query, page_szie=page_szie)
+        if data is not False:
+            self.save_cache_entry(path, {'saved_at': now.isoformat(), 'fetched_at': now.isoformat(), 'probe': probe, 'data': data})
+        return data
+
+    ## atomic write, concurrent readers never see a partial file
+    def save_cache_entry(self, path, entry):
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    ## Run independent queries concurrently, return {name: dataframe}
+    ## a query is either SuiteQL text, (SuiteQL text, cache name), or a method returning a dataframe (eg: another list_ method)
+    def query_group(self, queries, max_workers=4) -> dict:
+        logging.info(f'Netsuite: query_group() - {list(queries.keys())}')
+
+        def run(query):
+            if callable(query):
+                return query()
+            query, cache = query if isinstance(query, tuple) else (query, None)
+            return pd.DataFrame(self.query_all(query=query, cache=cache))
+
+        with MeasuredExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            futures = {name: executor.submit(run, query) for name, query in queries.items()}
+            return {name: future.result() for name, future in futures.items()}
     
 
     ############################
@@ -121,6 +204,49 @@ class Netsuite:
         elif level==3: return "Edit" 
         else: return "Full"
 
+    ## Encode roleRestrictions rows to one row per role, one column per segment, eg: 'Own (view=T, items=T)'
+    def encode_role_restrictions(self, df):
+
+        ## encode restriction description
+        df = df.replace(-101, 'class').replace(-102,'department').replace(-103,'location')
+
+        ## encode restriction parameters
+        view  = df.viewingallowed == 'T'
+        items = df.itemsrestricted == 'T'
+        value = pd.Series('', index=df.index)
+        value = value.mask(view, 'view=T').mask(view & items, 'view=T, items=T').mask(~view & items, '(items=T)')
+        df['restriction'] = df.restriction.where(value == '', df.restriction + ' (' + value + ')')
+
+        ## convert to pivot
+        return df.pivot(index='role', columns='segment',values='restriction')
+
+    ## Map roles to their effective subsidiaries, one row per (role_id, subsi_id)
+    def explode_role_subsidiaries(self, roles_df):
+        subsi = roles_df.role_effectivesubsidiaries.str.split(', ').explode()
+        return pd.DataFrame({
+            'role_id' : roles_df.role_id.loc[subsi.index].values,
+            'subsi_id': subsi.astype(int).values
+        })
+
+    ## Add <col>_names column for each col of comma separated employee ids, eg: '12,34' -> 'John, Jane'
+    ## unknown or non numeric ids are named 'Invalid(<id>)'
+    def resolve_employee_names(self, df, cols, employees_df):
+        names = employees_df.loc[~employees_df.index.duplicated(), 'entityid']
+
+        ## one row per (row, col, id)
+        ids = df[cols].stack().astype(str)
+        ids = ids[ids != ''].str.split(',').explode().str.strip()
+
+        ## single lookup for all ids
+        resolved = pd.to_numeric(ids, errors='coerce').map(names)
+        resolved = resolved.fillna('Invalid(' + ids + ')')
+
+        ## join back per (row, col)
+        joined = resolved.groupby(level=[0, 1], sort=False).agg(', '.join).unstack()
+        for col in cols:
+            df[f'{col}_names'] = joined[col].reindex(df.index).fillna('') if col in joined.columns else ''
+        return df
+
     ############################
     ## High Level Data Return
     ############################
@@ -129,10 +255,12 @@ class Netsuite:
     def list_roles(self, refresh=False):
         logging.info('Netsuite: list_roles()')
 
-        if (not refresh) and (not self.roles_df.empty):
-            return self.roles_df.copy()
+        cached = None if refresh else self.cache.get('roles')
+        if cached is not None:
+            return cached
 
-        query = """ 
+        ## Active Roles
+        roles_query = """ 
             SELECT
                 id,
                 name,
@@ -152,11 +280,9 @@ class Netsuite:
             WHERE
                 role.isinactive = 'F'
         """
-        data = self.query_all(query=query)
-        df = pd.DataFrame(data)
 
         ## Employee Roles with User Assigned
-        query = """ 
+        employee_roles_query = """ 
             SELECT DISTINCT
                 EmployeeRolesForSearch.role as role_id
             FROM
@@ -165,11 +291,9 @@ class Netsuite:
             WHERE
                 Employee.giveaccess = 'T'
         """
-        data = self.query_all(query=query)
-        employee_roles = pd.DataFrame(data).role_id
 
         ## Partner Roles with User Assigned
-        query=""" 
+        partner_roles_query = """ 
             SELECT DISTINCT
                 role_id 
             FROM 
@@ -187,8 +311,17 @@ class Netsuite:
             WHERE
                 A.row_num =1
         """
-        data = self.query_all(query=query)
-        partner_roles = pd.DataFrame(data).role_id
+
+        ## all independent, run concurrently
+        result = self.query_group({
+            'roles'         : (roles_query, 'roles'),
+            'employee_roles': employee_roles_query,
+            'partner_roles' : partner_roles_query,
+            'restrictions'  : self.list_role_restrictions
+        })
+        df = result['roles']
+        employee_roles = result['employee_roles'].role_id
+        partner_roles  = result['partner_roles'].role_id
 
         ## we want to know if any user assigned to this role
         active_role_ids = pd.concat([employee_roles, partner_roles])
@@ -196,20 +329,21 @@ class Netsuite:
         df['with_user_assigned'] = df.id.isin(active_role_ids)
 
         ## Merge with Role Restriction
-        restrict_df = self.list_role_restrictions()
+        restrict_df = result['restrictions']
         restrict_df.columns = [ 'restrict_' + x for x in restrict_df.columns]
         restrict_df['with_restriction'] = True
         df = pd.merge(df,restrict_df,left_on='id', right_index=True, how='left')
         df['with_restriction'] = df.with_restriction == True
-        self.roles_df = df
+        self.cache.put('roles', df)
         return df.copy()
 
     ## List All Active Roles and Its Permissions 
     def list_role_permissions(self, refresh=False):
         logging.info('Netsuite: list_role_permissions()')
 
-        if (not refresh) and (not self.role_permissions_df.empty):
-            return self.role_permissions_df.copy()
+        cached = None if refresh else self.cache.get('role_permissions')
+        if cached is not None:
+            return cached
 
         query = """ 
         SELECT
@@ -227,7 +361,7 @@ class Netsuite:
         FROM
             RolePermissions
         """
-        data = self.query_all(query=query)
+        data = self.query_all(query=query, cache='role_permissions')
         df = pd.DataFrame(data)
 
         ## merge with roles to get role columns
@@ -242,7 +376,7 @@ class Netsuite:
         df = pd.merge(df, role_usage_df, on=['role_id', 'perm_name'], how='left')
 
         ## save cache
-        self.role_permissions_df = df
+        self.cache.put('role_permissions', df)
 
         return df.copy()
 
@@ -250,8 +384,9 @@ class Netsuite:
     def list_subsidiaries(self, refresh=False):
         logging.info('Netsuite: list_subsidiaries()')
 
-        if (not refresh) and (not self.subsidiaries_df.empty):
-            return self.subsidiaries_df.copy()
+        cached = None if refresh else self.cache.get('subsidiaries')
+        if cached is not None:
+            return cached
         
         query = """ 
         SELECT 
@@ -269,12 +404,12 @@ class Netsuite:
         WHERE
             Subsidiary.isinactive = 'F'
         """
-        data = self.query_all(query=query)
+        data = self.query_all(query=query, cache='subsidiaries')
         df = pd.DataFrame(data)
         df['lastmodifieddate'] = pd.to_datetime(df.lastmodifieddate, format="%d/%m/%Y")
 
         ## save cache
-        self.subsidiaries_df = df
+        self.cache.put('subsidiaries', df)
 
         return df.copy()
 
@@ -282,8 +417,9 @@ class Netsuite:
     def list_employees(self, giveaccess_only=False, refresh=False, active_only=True):
         logging.info('Netsuite: list_employees()')
 
-        if (not refresh) and (not self.employees_df.empty):
-            return self.employees_df.copy()
+        cached = None if refresh else self.cache.get('employees')
+        if cached is not None:
+            return cached
         
         # where = "WHERE Employee.isinactive = 'F' and Employee.giveaccess = 'T'" if giveaccess_only else "WHERE Employee.isinactive = 'F'"
         
@@ -344,7 +480,7 @@ class Netsuite:
         df['email'] = df.email.str.lower()
         
         ## save cache
-        self.employees_df = df
+        self.cache.put('employees', df)
         
         return df.copy()
 
@@ -358,8 +494,9 @@ class Netsuite:
     def list_partners(self, giveaccess_only=False, refresh=False):
         logging.info('Netsuite: list_partners()')
 
-        if (not refresh) and (not self.partners_df.empty):
-            return self.partners_df.copy()
+        cached = None if refresh else self.cache.get('partners')
+        if cached is not None:
+            return cached
 
         where = "WHERE Partner.giveaccess = 'T'" if giveaccess_only else "WHERE Partner.isinactive = 'F'"
 
@@ -400,7 +537,7 @@ class Netsuite:
         df['email'] = df.email.str.lower()
 
         ## save cache
-        self.partners_df = df
+        self.cache.put('partners', df)
 
         return df.copy()
     
@@ -418,8 +555,9 @@ class Netsuite:
     ## List Given Access Partners Roles
     def list_partner_roles(self, refresh=False):
         logging.info('Netsuite: list_partner_roles()')
-        if (not refresh) and (not self.partner_roles_df.empty):
-            return self.partner_roles_df.copy()
+        cached = None if refresh else self.cache.get('partner_roles')
+        if cached is not None:
+            return cached
                 
         query=""" 
         SELECT 
@@ -453,15 +591,16 @@ class Netsuite:
                .merge(roles_df, how='inner',left_on='role_id', right_on='role_id')\
                .drop(columns=['partner_id'])
 
-        self.partner_roles_df = df
+        self.cache.put('partner_roles', df)
         return df.copy()
 
     ## List Given Access Employees Roles
     def list_employee_roles(self, refresh=False):
         logging.info('Netsuite: list_employee_roles()')
 
-        if (not refresh) and (not self.employee_roles_df.empty):
-            return self.employee_roles_df.copy()
+        cached = None if refresh else self.cache.get('employee_roles')
+        if cached is not None:
+            return cached
         
         query = """ 
             SELECT 
@@ -487,15 +626,16 @@ class Netsuite:
                .drop(columns=['role','entity'])
 
         ## save cache
-        self.employee_roles_df = df
+        self.cache.put('employee_roles', df)
 
         return df.copy()        
     
     ## List Employee License (Given Access, regarless active or not)
     def list_employee_license(self, refresh=False):
     
-        if (not refresh) and (not self.employee_license_df.empty):
-            return self.employee_license_df.copy()
+        cached = None if refresh else self.cache.get('employee_license')
+        if cached is not None:
+            return cached
         
         df = self.list_employee_roles()  # employees given access only, regardless Active or not
         df['license_type'] = df.role_centertype.apply(lambda x: 'Employee' if x=='EMPLOYEE' else 'Full')
@@ -503,14 +643,15 @@ class Netsuite:
         df = df[cols].drop_duplicates()
         
         ## save cache
-        self.employee_license_df = df
+        self.cache.put('employee_license', df)
 
         return df.copy()
 
     ## Join All Active Roles and Its Effective Subsidiaries
     def list_role_subsidiaries(self, refresh=False):
-        if (not refresh) and (not self.role_subsidiaries_df.empty):
-            return self.role_subsidiaries_df.copy()
+        cached = None if refresh else self.cache.get('role_subsidiaries')
+        if cached is not None:
+            return cached
         
         subsidiaries_df = self.list_subsidiaries()
         subsidiaries_df.columns = [ 'subsi_' + c for c in subsidiaries_df.columns]
@@ -520,28 +661,19 @@ class Netsuite:
 
         non_na = roles_df.role_effectivesubsidiaries.notna()
         roles_df = roles_df[non_na]
-        records = []
-        for idx, row in roles_df.iterrows():
-                subsidiaries = row.role_effectivesubsidiaries.split(', ')
-                for s in subsidiaries:
-                        record = {
-                                'role_id': row.role_id,
-                                'subsi_id': int(s)
-                        }
-                        records = records + [record]
-
-        role_subsi_map = pd.DataFrame(records)
+        role_subsi_map = self.explode_role_subsidiaries(roles_df)
 
         df = pd.merge(role_subsi_map, roles_df, how='left', left_on='role_id', right_on='role_id')\
                .merge(subsidiaries_df, how='left', left_on='subsi_id', right_on='subsi_id')
         
-        self.role_subsidiaries_df = df
+        self.cache.put('role_subsidiaries', df)
         return df.copy()
     
     ## List All Active Approval Matrix
     def list_approval_matrix(self, refresh=False):
-        if (not refresh) and (not self.approval_matrix_df.empty):
-            return self.approval_matrix_df.copy()
+        cached = None if refresh else self.cache.get('approval_matrix')
+        if cached is not None:
+            return cached
         
 
         employees_df = self.list_employees().set_index('id')
@@ -562,9 +694,9 @@ class Netsuite:
             Matrix.custrecord_nra_record_approver_l4       AS approver_l4,
             Matrix.custrecord_nra_record_approver_l4_email AS approver_l4_email,
             Matrix.custrecord_nra_record_approver_l5       AS approver_l5,
-            Matrix.custrecord_nra_record_approver_l5 AS approver_l5_email,
+            Matrix.custrecord_nra_record_approver_l5_email AS approver_l5_email,
             Matrix.custrecord_nra_record_approver_l6       AS approver_l6,
-            Matrix.custrecord_nra_record_approver_l6 AS approver_l6_email
+            Matrix.custrecord_nra_record_approver_l6_email AS approver_l6_email
         FROM
             CUSTOMLIST_NERA_APPROVAL_RECORD_LIST RecordList
         LEFT JOIN
@@ -575,100 +707,20 @@ class Netsuite:
         data = self.query_all(query=query)
         approval_matrix_df = pd.DataFrame(data)
 
-        approval_matrix_df['approver_l1_names'] = ''
-        approval_matrix_df['approver_l2_names'] = ''
-        approval_matrix_df['approver_l3_names'] = ''
-        approval_matrix_df['approver_l1_email_names'] = ''
-        approval_matrix_df['approver_l2_email_names'] = ''
-        approval_matrix_df['approver_l3_email_names'] = ''
-
-        for idx, row in approval_matrix_df.iterrows():
+        ## resolve approver ids of all levels (L1-L6 and email variants) to employee names
+        approver_cols = [f'approver_l{n}{suffix}' for n in range(1, 7) for suffix in ('', '_email')]
+        approval_matrix_df = self.resolve_employee_names(approval_matrix_df, approver_cols, employees_df)
 
-            ## L1 Approvers Renaming
-            if row.approver_l1:
-                approver_list = [int(x) for x in row.approver_l1.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l1_names'] = l1_names
-
-            ## L1_Email Approvers Renaming
-            if row.approver_l1_email:
-                approver_list = [int(x) for x in row.approver_l1_email.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l1_email_names'] = l1_names
-
-            ## L2 Approvers Renaming
-            if row.approver_l2:
-                approver_list = [int(x) for x in row.approver_l2.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l2_names'] = l1_names
-
-            ## L2_Email Approvers Renaming
-            if row.approver_l2_email:
-                approver_list = [int(x) for x in row.approver_l2_email.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l2_email_names'] = l1_names        
-            ## L3 Approvers Renaming
-            if row.approver_l3:
-                approver_list = [int(x) for x in row.approver_l3.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l3_names'] = l1_names
-
-            ## L3_Email Approvers Renaming
-            if row.approver_l3_email:
-                approver_list = [int(x) for x in row.approver_l3_email.split(',')]
-                
-                approver_names=[]
-                for id in approver_list:
-                    try: 
-                        approver_names = approver_names + [employees_df.loc[id, 'entityid']]
-                    except:
-                        approver_names = approver_names + [f'Invalid({str(id)})']
-                l1_names = ', '.join(approver_names)
-                approval_matrix_df.loc[idx, 'approver_l3_email_names'] = l1_names
-
-        cols = ['list_id','list_name','record_id','record_name','description','approver_l1_names','approver_l1_email_names','approver_l2_names','approver_l2_email_names','approver_l3_names','approver_l3_email_names']
+        cols = ['list_id','list_name','record_id','record_name','description'] + [f'{c}_names' for c in approver_cols]
         approval_matrix_df = approval_matrix_df[cols]
 
-        self.approval_matrix_df = approval_matrix_df
+        self.cache.put('approval_matrix', approval_matrix_df)
         return approval_matrix_df.copy()
         
-    ## List All Daily Successful/Failure Logins
-    def list_login_audits(self, last_n_days=60):
+    ## List All Daily Successful/Failure Logins, since date ('YYYY-MM-DD') if provided
+    def list_login_audits(self, last_n_days=60, since=None):
+        logging.info(f'Netsuite: list_login_audits() - since: {since}')
+        date_filter = f"LoginAudit.Date >= TO_DATE('{since}', 'YYYY-MM-DD')" if since else f"LoginAudit.Date >= SYSDATE - {last_n_days}"
 
         query = f""" 
             SELECT 
@@ -681,20 +733,23 @@ class Netsuite:
             FROM
                 LoginAudit
             WHERE
-                LoginAudit.Date >= SYSDATE - {last_n_days} and status='Success'
+                {date_filter} and status='Success'
             )
             GROUP BY
                 user_id, date
         """
 
         data = self.query_all(query=query)
-        df = pd.DataFrame(data)
+        ## no login (or failed query): empty frame, same columns
+        df = pd.DataFrame(data) if data else pd.DataFrame(columns=['user_id', 'date', 'login_count'])
         df['date'] = pd.to_datetime(df.date, format="%d/%m/%Y")
 
         return df
     
-    ## List all Daily Failure Logins
-    def list_login_failure(self, last_n_days=60):
+    ## List all Daily Failure Logins, since date ('YYYY-MM-DD') if provided
+    def list_login_failure(self, last_n_days=60, since=None):
+        logging.info(f'Netsuite: list_login_failure() - since: {since}')
+        date_filter = f"LoginAudit.Date >= TO_DATE('{since}', 'YYYY-MM-DD')" if since else f"LoginAudit.Date >= SYSDATE - {last_n_days}"
 
         query = f""" 
             SELECT
@@ -709,13 +764,14 @@ class Netsuite:
             FROM
                 LoginAudit
             WHERE 
-                LoginAudit.Date >= SYSDATE - {last_n_days} and status='Failure'
+                {date_filter} and status='Failure'
             ORDER BY
                 LoginAudit.date DESC
         """
 
         data = self.query_all(query=query)
-        df = pd.DataFrame(data)
+        ## no failure (or failed query): empty frame, same columns
+        df = pd.DataFrame(data) if data else pd.DataFrame(columns=['datetime', 'date', 'user_id', 'entitiid', 'detail', 'ipaddress', 'requesturi', 'useragent'])
         df['date'] =     pd.to_datetime(df['date'],     format="%Y-%m-%d").dt.date
         df['datetime'] = pd.to_datetime(df['datetime'], format="%Y-%m-%d %H:%M:%S")
         return df
@@ -745,7 +801,7 @@ class Netsuite:
             CustomRecordType
         """
 
-        data = self.query_all(query=query)
+        data = self.query_all(query=query, cache='custom_records')
         df = pd.DataFrame(data)
 
         return df
@@ -766,7 +822,7 @@ class Netsuite:
         FROM
             CustomList
         """
-        data = self.query_all(query=query)
+        data = self.query_all(query=query, cache='custom_lists')
         df = pd.DataFrame(data)
         return df
 
@@ -777,14 +833,18 @@ class Netsuite:
 
         ## internal record types read from CSV
         # internal_df = pd.read_csv('ns_internal_recordtypes.csv')
-        internal_df = pd.read_csv('module/ns_internal_recordtypes.csv')
+        internal_df = load_static_csv('ns_internal_recordtypes.csv').copy()
         internal_df['recordtype_type'] = 'Standard'
         
-        ## custom record types read from Netsuite
-        customrec_df = self.list_custom_records_definition().loc[:, ['internalid','name']]
+        ## custom record types and lists read from Netsuite, concurrently
+        result = self.query_group({
+            'custom_records': self.list_custom_records_definition,
+            'custom_lists'  : self.list_custom_list_definition
+        })
+        customrec_df = result['custom_records'].loc[:, ['internalid','name']]
         customrec_df['recordtype_type'] = 'Custom Record'
 
-        customlist_df = self.list_custom_list_definition().loc[:, ['internalid','name']]
+        customlist_df = result['custom_lists'].loc[:, ['internalid','name']]
         customlist_df['recordtype_type'] = 'Custom List'
         
         ## Union Them
@@ -796,8 +856,9 @@ class Netsuite:
     def list_role_record_usage(self, refresh=False, ndays=180):
         logging.info('Netsuite: list_role_record_usage()')
 
-        if (not refresh) and (not self.role_usage_df.empty):
-            return self.role_usage_df.copy()
+        cached = None if refresh else self.cache.get('role_usage')
+        if cached is not None:
+            return cached
 
         q = f''' 
             SELECT
@@ -829,9 +890,10 @@ class Netsuite:
         ## join to get role definition
         df4 = self.list_roles().loc[:, ['id','name']]
         df4.columns = ['role_id','role_name']
-        self.role_usage_df = pd.merge(df4, df3, on='role_id', how='right')
-        
-        return self.role_usage_df.copy()
+        df = pd.merge(df4, df3, on='role_id', how='right')
+        self.cache.put('role_usage', df)
+
+        return df.copy()
     
     ## List Role Restrictions (index is role id)
     def list_role_restrictions(self):
@@ -846,23 +908,9 @@ class Netsuite:
             FROM
                 roleRestrictions
             '''
-        result = self.query_all(query=q)
+        result = self.query_all(query=q, cache='role_restrictions')
         df = pd.DataFrame(result)
-
-        ## encode restriction description
-        df = df.replace(-101, 'class').replace(-102,'department').replace(-103,'location')
-        ## encode restriction parameters
-        for idx, row in df.iterrows():
-            value = '' 
-            if row.viewingallowed == 'T':
-                value =  'view=T'
-            if row.itemsrestricted == 'T':
-                value =   value + ', items=T' if value else '(items=T)'
-            df.loc[idx, 'restriction'] = row.restriction + ' (' + value + ')' if value else row.restriction
-            
-        ## convert to pivot
-        df = df.pivot(index='role', columns='segment',values='restriction')
-        return df
+        return self.encode_role_restrictions(df)
 
     ## List All Script Records
     def list_client_scripts(self):
@@ -951,10 +999,11 @@ class Netsuite:
         # df.drop(columns='script', inplace=True)
         return df
     
-    ## List Script logs
-    def list_script_logs(self):
-        logging.info('Netsuite: list_script_logs()')
-        q = ''' 
+    ## List Script logs, only internalId greater than since_id if provided
+    def list_script_logs(self, since_id=None):
+        logging.info(f'Netsuite: list_script_logs() - since_id: {since_id}')
+        id_filter = f'AND ScriptNote.internalId > {int(since_id)}' if since_id else ''
+        q = f''' 
             SELECT
                 ScriptNote.internalId,
                 ScriptNote.date,
@@ -968,11 +1017,12 @@ class Netsuite:
                 ScriptNote
                 LEFT OUTER JOIN script ON ScriptNote.scriptType = script.id		
             WHERE 
-                type IN ('ERROR','SYSTEM')
+                type IN ('ERROR','SYSTEM') {id_filter}
             ORDER BY date asc
         '''
         result = self.query_all(query=q)
-        df = pd.DataFrame(result)
+        ## no new log (or failed query): empty frame, same columns
+        df = pd.DataFrame(result) if result else pd.DataFrame(columns=['internalid', 'date', 'log_type', 'script_id', 'script_type', 'script_name', 'title', 'detail'])
         df['date'] = pd.to_datetime(df.date, format="%d/%m/%Y")
 
         return df
@@ -981,8 +1031,9 @@ class Netsuite:
     def list_scripts(self, refresh=False):
         logging.info('Netsuite: list_scripts()')
 
-        if (not refresh) and (not self.scripts_df.empty):
-            return self.scripts_df.copy()
+        cached = None if refresh else self.cache.get('scripts')
+        if cached is not None:
+            return cached
                 
         q = ''' 
             SELECT
@@ -1040,7 +1091,7 @@ class Netsuite:
             FROM
                 script
         '''
-        result = self.query_all(query=q)
+        result = self.query_all(query=q, cache='scripts')
         df = pd.DataFrame(result)
 
         ## merge with employee records to get owner detail
@@ -1048,5 +1099,5 @@ class Netsuite:
         e.columns = [ 'owner_' + x for x in e.columns]
         df = pd.merge( df, e, how='left', left_on='owner', right_on='owner_id')        
         df.drop(columns='owner_id', inplace=True)
-        self.scripts_df = df
+        self.cache.put('scripts', df)
         return df.copy()
\ No newline at end of file
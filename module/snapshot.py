@@ -0,0 +1,187 @@
+import logging, os, re, threading
+from datetime import datetime
+import pandas as pd
+
+## Parquet snapshots are optional (pyarrow), blob storage too (azure-storage-blob), see requirements-optional.txt
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+## Parquet snapshots of the extracted datasets, one per source, table and run:
+##   {source}/{table}/run_date={YYYY-MM-DD}/{run_id}_{part}.parquet
+## eg: ad/users/run_date=2024-01-01/20240101010000_0000.parquet for ad.list_users() of run 20240101010000
+## a run has several parts when its list is called with different arguments, eg: LogsAnalytics slices, read back together
+## stored in a local folder, or in a blob container (azure.storage.blob.ContainerClient) under the root prefix
+
+path_pattern = re.compile(r'(?P<source>[^/]+)/(?P<table>[^/]+)/run_date=(?P<run_date>[\d-]+)/(?P<run_id>\d+)_(?P<part>\d+)\.parquet$')
+
+
+class SnapshotStore:
+
+    def __init__(self, root, container=None, compression='zstd') -> None:
+        if pa is None:
+            raise ImportError('SnapshotStore: pyarrow is not installed, pip install pyarrow')
+        self.root        = root.rstrip('/')
+        self.container   = container
+        self.compression = compression
+        self.lock        = threading.Lock()
+        self.parts       = {}  ## (source, table, run_id) -> parts written by this store
+
+    ## write a dataframe as the next part of a run, return its path
+    def write(self, source, table, df, run_id=None) -> str:
+        run_id = run_id or datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        with self.lock:
+            part = self.parts.get((source, table, run_id), 0)
+            self.parts[(source, table, run_id)] = part + 1
+        run_date = datetime.strptime(run_id, '%Y%m%d%H%M%S').strftime('%Y-%m-%d')
+        path = f'{source}/{table}/run_date={run_date}/{run_id}_{part:04d}.parquet'
+        logging.info(f'SnapshotStore: write() - {path}, rows: {len(df)}')
+
+        table_data = pa.Table.from_pandas(df, preserve_index=False)
+        if self.container is None:
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            temp_path = f'{full_path}.{os.getpid()}.tmp'
+            pq.write_table(table_data, temp_path, compression=self.compression)
+            os.replace(temp_path, full_path)
+        else:
+            buffer = pa.BufferOutputStream()
+            pq.write_table(table_data, buffer, compression=self.compression)
+            self.container.upload_blob(self.get_blob_name(path), buffer.getvalue().to_pybytes(), overwrite=True)
+        return path
+
+    def get_blob_name(self, path) -> str:
+        return f'{self.root}/{path}' if self.root else path
+
+    ## snapshots parts: source, table, run_date, run_id, part, path (relative to root)
+    def list(self, source=None, table=None) -> pd.DataFrame:
+        prefix = '/'.join(p for p in (source, table) if p)
+        if self.container is None:
+            base  = os.path.join(self.root, prefix)
+            paths = [os.path.relpath(os.path.join(folder, f), self.root).replace(os.sep, '/')
+                     for folder, _, files in os.walk(base) for f in files]
+        else:
+            root  = f'{self.root}/' if self.root else ''
+            paths = [blob.name[len(root):] for blob in self.container.list_blobs(name_starts_with=root + prefix)]
+
+        rows = []
+        for path in paths:
+            match = path_pattern.search(path)
+            if match and (source is None or match['source'] == source) and (table is None or match['table'] == table):
+                rows += [{**match.groupdict(), 'part': int(match['part']), 'path': path}]
+        columns = ['source', 'table', 'run_date', 'run_id', 'part', 'path']
+        return pd.DataFrame(rows, columns=columns).sort_values(['source', 'table', 'run_id', 'part'], ignore_index=True)
+
+    ## run ids of a table, oldest first
+    def runs(self, source, table) -> list:
+        return sorted(self.list(source, table).run_id.unique())
+
+    ## run id of a table: run_id if given, else the last run at or before as_of (datetime), else the last run
+    def get_run_id(self, source, table, run_id=None, as_of=None) -> str:
+        if run_id:
+            return run_id
+        runs = self.runs(source, table)
+        if as_of is not None:
+            as_of = pd.Timestamp(as_of).strftime('%Y%m%d%H%M%S')
+            runs = [r for r in runs if r <= as_of]
+        if not runs:
+            raise ValueError(f'SnapshotStore: no snapshot of {source}/{table}' + (f' at or before {as_of}' if as_of else ''))
+        return runs[-1]
+
+    ## dataframe of a run (see get_run_id), local files are memory-mapped, columns: subset to read
+    def read(self, source, table, run_id=None, as_of=None, columns=None) -> pd.DataFrame:
+        run_id = self.get_run_id(source, table, run_id, as_of)
+        parts  = self.list(source, table).query('run_id == @run_id')
+        if parts.empty:
+            raise ValueError(f'SnapshotStore: no snapshot of {source}/{table} for run {run_id}')
+        logging.info(f'SnapshotStore: read() - {source}/{table} {run_id}, parts: {len(parts)}')
+
+        dfs = []
+        for path in parts.path:
+            if self.container is None:
+                table_data = pq.read_table(os.path.join(self.root, path), columns=columns, memory_map=True)
+            else:
+                data = self.container.download_blob(self.get_blob_name(path)).readall()
+                table_data = pq.read_table(pa.BufferReader(data), columns=columns)
+            dfs += [table_data.to_pandas()]
+        return pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+
+    ## rows added, removed or changed between two runs, by keys, column '_change': 'added', 'removed', 'changed'
+    ## removed rows have their before values, others their after values; last two runs by default
+    def diff(self, source, table, keys, before=None, after=None, columns=None) -> pd.DataFrame:
+        runs   = self.runs(source, table)
+        after  = self.get_run_id(source, table, after)
+        before = before or max((r for r in runs if r < after), default=None)
+        if before is None:
+            raise ValueError(f'SnapshotStore: no snapshot of {source}/{table} before {after}')
+        logging.info(f'SnapshotStore: diff() - {source}/{table} {before} -> {after}')
+
+        old = self.read(source, table, run_id=before, columns=columns).drop_duplicates(keys, keep='last').set_index(keys)
+        new = self.read(source, table, run_id=after,  columns=columns).drop_duplicates(keys, keep='last').set_index(keys)
+
+        added   = new.loc[new.index.difference(old.index)]
+        removed = old.loc[old.index.difference(new.index)]
+
+        ## changed: any common column differs, missing values on both sides are equal
+        common  = new.index.intersection(old.index)
+        compare = new.columns.intersection(old.columns)
+        a, b    = old.loc[common, compare], new.loc[common, compare]
+        differs = ~((a == b) | (a.isna() & b.isna()))
+        changed = new.loc[common[differs.any(axis=1).to_numpy()]]
+
+        df = pd.concat([added.assign(_change='added'), removed.assign(_change='removed'), changed.assign(_change='changed')])
+        return df.reset_index()
+
+    ## refresh a warehouse table from a snapshot (see get_run_id), without calling the source
+    def load_to_warehouse(self, wh, source, table, table_name, run_id=None, as_of=None) -> int:
+        df = self.read(source, table, run_id, as_of)
+        wh.erase(table_name)
+        wh.append(table_name, df)
+        return len(df)
+
+
+## Source wrapper snapshotting the dataframes returned by its list_* methods, eg: SnapshotSource(ad, 'ad', store)
+## other attributes are the source ones; calls repeated with the same arguments (refresh aside) in a run are snapshotted once
+## a failed snapshot is logged, never failing the ETL
+class SnapshotSource:
+
+    def __init__(self, source, source_name, store, run_id=None) -> None:
+        self.__dict__.update(
+            source      = source,
+            source_name = source_name,
+            store       = store,
+            run_id      = run_id or datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+            calls       = set(),  ## (method, arguments) snapshotted
+            calls_lock  = threading.Lock()
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self.source, name)
+        if not name.startswith('list_') or not callable(attr):
+            return attr
+
+        def list_and_snapshot(*args, **kwargs):
+            df = attr(*args, **kwargs)
+            if not isinstance(df, pd.DataFrame):
+                return df
+            call = (name, repr(args), repr(sorted((k, v) for k, v in kwargs.items() if k != 'refresh')))  ## refreshed or cached, same dataset
+            with self.calls_lock:
+                if call in self.calls:
+                    return df
+                self.calls.add(call)
+            ## lists of a named dataset are tables of their own, eg: list_rollup('signins_daily') -> rollup_signins_daily
+            table = name[len('list_'):]
+            if args and isinstance(args[0], str):
+                table += f'_{args[0]}'
+            try:
+                self.store.write(self.source_name, table, df, self.run_id)
+            except Exception as e:
+                logging.warning(f'SnapshotSource: {self.source_name}.{name}() not snapshotted - {e}')
+            return df
+        return list_and_snapshot
+
+    ## attributes set on the wrapper are set on the source, eg: caches
+    def __setattr__(self, name, value) -> None:
+        setattr(self.source, name, value)
@@ -0,0 +1,31 @@
+import logging, os, tempfile
+from functools import lru_cache
+import pandas as pd
+
+## Static reference data shipped next to the modules (eg: microsoft_products.csv)
+## parsed once per process; a pickled copy in CACHE_DIR is reused by later cold starts until the csv changes
+module_dir = os.path.dirname(os.path.abspath(__file__))
+static_cache = os.path.join(os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'idgov')), 'static')
+
+
+## Return a static csv as dataframe, callers must not modify it (copy first)
+@lru_cache(maxsize=None)
+def load_static_csv(file_name, encoding=None) -> pd.DataFrame:
+    csv_path = os.path.join(module_dir, file_name)
+    stat = os.stat(csv_path)
+    pickle_path = os.path.join(static_cache, f'{file_name}.{stat.st_size}.{int(stat.st_mtime)}.pkl')
+
+    if os.path.exists(pickle_path):
+        return pd.read_pickle(pickle_path)
+
+    logging.info(f'static: load_static_csv() - parsing {file_name}')
+    df = pd.read_csv(csv_path, encoding=encoding)
+    try:
+        os.makedirs(static_cache, exist_ok=True)
+        temp_path = f'{pickle_path}.{os.getpid()}.tmp'
+        df.to_pickle(temp_path)
+        os.replace(temp_path, pickle_path)
+    ## read-only file system, csv is parsed again on next cold start
+    except OSError as e:
+        logging.info(f'static: load_static_csv() - not cached: {e}')
+    return df
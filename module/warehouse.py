@@ -1,27 +1,115 @@
-import logging, struct, urllib
-from sqlalchemy import create_engine, MetaData, Table, func, text
+import logging, struct, urllib, json, uuid
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+from sqlalchemy import create_engine, MetaData, Table, Column, String, DateTime, Integer, Float, func, text, inspect
 from math import floor 
 import pandas as pd
+from module.metrics import timed_load
 
-class Warehouse:
+## DuckDB backend is optional (duckdb, duckdb-engine, see requirements-optional.txt)
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
-    db_engine = None
+## Warehouse backends: SQLAlchemy engine of the database, and how dataframes are written to and read from it
+##   MssqlBackend  : Azure SQL through pyodbc, with the AAD token of a credential (default)
+##   SQLiteBackend : local file or in memory, for notebooks, tests and benchmarks
+##   DuckDBBackend : local file or in memory, dataframes ingested natively (no INSERT statements)
+## eg: Warehouse(backend=SQLiteBackend('local.db'))
+
+
+## Base backend: engine, write() and read() of dataframes
+class Backend:
+
+    engine = None
+
+    ## write dataframe to a table, created if not exists, if_exists: 'append' or 'replace'
+    def write(self, conn, table_name, df, if_exists='append') -> None:
+        raise NotImplementedError
+
+    def read(self, conn, table_name) -> pd.DataFrame:
+        return pd.read_sql(table_name, con=conn)
+
+
+## Azure SQL, rows inserted by multi-row INSERT statements
+class MssqlBackend(Backend):
+
+    max_params = 2100  ## parameters per statement
+    max_rows   = 1000  ## rows per INSERT ... VALUES statement (error 10738)
 
     def __init__(self, server, database, credential) -> None:
-        logging.info('Warehouse: initializing ...')
         token = credential.get_token("https://database.windows.net/.default").token.encode("UTF-16-LE")
         token_struct = struct.pack(f'<I{len(token)}s', len(token), token)
         driver="{ODBC Driver 18 for SQL Server}"
         connection_string = 'DRIVER='+driver+';SERVER='+server+';DATABASE='+database
         params = urllib.parse.quote(connection_string)
         SQL_COPT_SS_ACCESS_TOKEN = 1256
-        self.db_engine = create_engine("mssql+pyodbc:///?odbc_connect={0}".format(params), connect_args={'attrs_before': {SQL_COPT_SS_ACCESS_TOKEN:token_struct}})
+        self.engine = create_engine("mssql+pyodbc:///?odbc_connect={0}".format(params), connect_args={'attrs_before': {SQL_COPT_SS_ACCESS_TOKEN:token_struct}})
+
+    def write(self, conn, table_name, df, if_exists='append') -> None:
+        chunksize = min(self.max_rows, floor(self.max_params/df.shape[1]) -1)
+        df.to_sql(table_name, con=conn, index=False, if_exists=if_exists, method='multi', chunksize=chunksize)
+
+
+## SQLite file, ':memory:' for a database shared by the threads of the process
+## rows inserted by a single executemany per table, no parameters limit
+class SQLiteBackend(Backend):
+
+    def __init__(self, path=':memory:', timeout=60) -> None:
+        if path == ':memory:':
+            self.engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+        else:
+            self.engine = create_engine(f'sqlite:///{path}', connect_args={'timeout': timeout})  ## seconds waiting on other writers
+
+    def write(self, conn, table_name, df, if_exists='append') -> None:
+        df.to_sql(table_name, con=conn, index=False, if_exists=if_exists)
+
+
+## DuckDB file or ':memory:', dataframes are registered and scanned by DuckDB (columnar, through Arrow)
+class DuckDBBackend(Backend):
+
+    def __init__(self, path=':memory:') -> None:
+        if duckdb is None:
+            raise ImportError('DuckDBBackend: duckdb is not installed, pip install duckdb duckdb-engine')
+        self.engine = create_engine(f'duckdb:///{path}')
+
+    def write(self, conn, table_name, df, if_exists='append') -> None:
+        view = f'{table_name}_df'
+        driver_conn = conn.connection.driver_connection
+        driver_conn.register(view, df)
+        try:
+            if if_exists == 'replace':
+                conn.exec_driver_sql(f'CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {view}')
+            else:
+                conn.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM {view} LIMIT 0')
+                conn.exec_driver_sql(f'INSERT INTO {table_name} BY NAME SELECT * FROM {view}')
+        finally:
+            driver_conn.unregister(view)
+
+    def read(self, conn, table_name) -> pd.DataFrame:
+        return conn.connection.driver_connection.execute(f'SELECT * FROM {table_name}').df()
+
+
+class Warehouse:
+
+    db_engine = None
+    backend   = None
+    watermarks_table = 'etl_watermarks'  ## control table of incremental loads cursors, name -> json value
+    run_state_table  = 'etl_run_state'   ## control table of ETL runs progress, (run_name, table_name) -> status
+
+    ## Azure SQL of server/database, or backend if given
+    def __init__(self, server=None, database=None, credential=None, backend=None) -> None:
+        logging.info('Warehouse: initializing ...')
+        self.backend   = backend or MssqlBackend(server, database, credential)
+        self.db_engine = self.backend.engine
 
     ## delete all rows in the table
     def erase(self, table_name) -> None:
         logging.info(f'Warehouse: erase() --> table: {table_name}')
         try:
-            with self.db_engine.connect() as conn:
+            with timed_load(), self.db_engine.connect() as conn:
                 conn.execute(text(f"DELETE FROM {table_name}"))
                 conn.commit()
         ## if Table not exist, this avoid error interupt
@@ -40,30 +128,145 @@ class Warehouse:
     ## append dataframe to existing table
     def append(self, table_name, df) -> None: 
         logging.info(f'Warehouse: append() - dataframe rows: {df.shape[0]}')
-        chunksize = floor(2100/df.shape[1]) -1
-        with self.db_engine.connect() as conn:
-            df.to_sql(table_name, con=conn, index=False, if_exists='append', method='multi', chunksize=chunksize)
+        with timed_load(len(df)), self.db_engine.connect() as conn:
+            self.backend.write(conn, table_name, df)
+            conn.commit()
+
+    ## True if the table exists
+    def has_table(self, table_name) -> bool:
+        return inspect(self.db_engine).has_table(table_name)
 
     ## retrieve all rows from a table
     def get_table(self, table_name) -> pd.DataFrame:
-        df = pd.read_sql(table_name, con = self.db_engine)
+        with self.db_engine.connect() as conn:
+            df = self.backend.read(conn, table_name)
         logging.info(f'Warehouse: get_table() - {table_name} : {df.shape[0]}')
         return df
 
-    ## remove rows with criteria
-    def delete_rows(self, table_name, column_name, value):
-        logging.info(f'Warehouse: delete_rows() --> table: {table_name}')
-        try:
-            with self.db_engine.connect() as conn:
-                conn.execute(text(f"DELETE FROM {table_name} WHERE {column_name}='{value}'"))
-                conn.commit()
-        ## for no existig table, this avoid error interupt
-        except:
-            pass   
+    ## remove rows with criteria, operator: '=', '<', '>=', etc, value bound as a parameter
+    ## nothing to remove from a table not created yet
+    delete_operators = ('=', '<>', '<', '<=', '>', '>=')
+    def delete_rows(self, table_name, column_name, value, operator='='):
+        logging.info(f'Warehouse: delete_rows() --> table: {table_name}, where: {column_name} {operator} {value}')
+        if operator not in self.delete_operators:
+            raise ValueError(f'delete_rows(): unsupported operator {operator!r}, expected one of {self.delete_operators}')
+        if not self.has_table(table_name):
+            return
+        with timed_load(), self.db_engine.connect() as conn:
+            conn.execute(text(f"DELETE FROM {table_name} WHERE {column_name} {operator} :value"), {'value': value})
+            conn.commit()
 
     ## refresh rows by first delete rows and then append
     def refresh_table_rows(self, table_name, df, column_name, value):
         logging.info(f'Warehouse: refresh_table_rows() --> table: {table_name}')
         ## First Delete the 
         self.delete_rows(table_name, column_name, value)
-        self.append(table_name, df)
\ No newline at end of file
+        self.append(table_name, df)
+
+    ## upsert dataframe, rows with the same keys are replaced by rows in df
+    ## rows with a NULL key are dropped with a warning: NULL never matches in sql, they would be appended on every run
+    def upsert(self, table_name, df, keys) -> None:
+        logging.info(f'Warehouse: upsert() --> table: {table_name}, keys: {keys}, dataframe rows: {df.shape[0]}')
+        null_keys = df[keys].isna().any(axis=1)
+        if null_keys.any():
+            logging.warning(f'Warehouse: upsert() --> table: {table_name}, dropped {null_keys.sum()} rows with NULL keys')
+            df = df[~null_keys]
+        if df.empty: return
+
+        ## new table, nothing to replace
+        if not self.has_table(table_name):
+            return self.append(table_name, df)
+
+        ## stage the keys, delete matching rows and append in one transaction
+        ## stage table unique per call, concurrent upserts of the same table do not share it
+        stage_name = f'{table_name}_stage_{uuid.uuid4().hex[:12]}'
+        match = ' AND '.join([f'{stage_name}.{k} = {table_name}.{k}' for k in keys])
+        with timed_load(len(df)), self.db_engine.connect() as conn:
+            self.backend.write(conn, stage_name, df[keys].drop_duplicates(), if_exists='replace')
+            conn.execute(text(f"DELETE FROM {table_name} WHERE EXISTS (SELECT 1 FROM {stage_name} WHERE {match})"))
+            conn.execute(text(f"DROP TABLE {stage_name}"))
+            self.backend.write(conn, table_name, df)
+            conn.commit()
+
+    ## return incremental load cursor saved by set_watermark(), None if not set
+    def get_watermark(self, name):
+        logging.info(f'Warehouse: get_watermark() --> {name}')
+        table = self.get_watermarks_table()
+        with self.db_engine.connect() as conn:
+            row = conn.execute(table.select().where(table.c.name == name)).fetchone()
+        return json.loads(row.value) if row else None
+
+    ## save incremental load cursor, any json serializable value
+    def set_watermark(self, name, value) -> None:
+        logging.info(f'Warehouse: set_watermark() --> {name}: {value}')
+        table = self.get_watermarks_table()
+        with self.db_engine.connect() as conn:
+            conn.execute(table.delete().where(table.c.name == name))
+            conn.execute(table.insert().values(name=name, value=json.dumps(value, default=str), updated_on=datetime.utcnow()))
+            conn.commit()
+
+    ## watermarks control table, created on first use
+    def get_watermarks_table(self) -> Table:
+        table = Table(self.watermarks_table, MetaData(),
+            Column('name',       String(200), primary_key=True),
+            Column('value',      String(4000)),
+            Column('updated_on', DateTime)
+        )
+        table.create(self.db_engine, checkfirst=True)
+        return table
+
+    ## return progress of a run, one row per table: run_id, status, row_count, started_on, finished_on, seconds
+    def get_run_state(self, run_name) -> pd.DataFrame:
+        logging.info(f'Warehouse: get_run_state() --> {run_name}')
+        table = self.get_run_state_table()
+        with self.db_engine.connect() as conn:
+            result = conn.execute(table.select().where(table.c.run_name == run_name))
+            return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+    ## save progress of a table in a run, replacing previous runs row
+    def set_run_state(self, run_name, table_name, **values) -> None:
+        logging.info(f'Warehouse: set_run_state() --> {run_name}.{table_name}: {values.get("status")}')
+        table = self.get_run_state_table()
+        with self.db_engine.connect() as conn:
+            conn.execute(table.delete().where((table.c.run_name == run_name) & (table.c.table_name == table_name)))
+            conn.execute(table.insert().values(run_name=run_name, table_name=table_name, **values))
+            conn.commit()
+
+    ## atomically mark a table of a run as started, return False if already claimed for run_id by another worker
+    ## stale_before: a claim of run_id started before then is taken over (its worker is gone)
+    def claim_run_state(self, run_name, table_name, run_id, stale_before=None) -> bool:
+        logging.info(f'Warehouse: claim_run_state() --> {run_name}.{table_name}: {run_id}')
+        table = self.get_run_state_table()
+        key = (table.c.run_name == run_name) & (table.c.table_name == table_name)
+        claimable = table.c.run_id != run_id
+        if stale_before is not None:
+            claimable = claimable | ((table.c.status == 'started') & (table.c.started_on < stale_before))
+        values = dict(run_id=run_id, status='started', row_count=None, started_on=datetime.utcnow(), finished_on=None, seconds=None)
+        with self.db_engine.connect() as conn:
+            ## row of a previous run, or stale claim
+            if conn.execute(table.update().where(key & claimable).values(**values)).rowcount:
+                conn.commit()
+                return True
+            ## no row yet, the primary key lets only one insert through
+            try:
+                conn.execute(table.insert().values(run_name=run_name, table_name=table_name, **values))
+                conn.commit()
+                return True
+            except IntegrityError:
+                conn.rollback()
+                return False
+
+    ## run state control table, created on first use
+    def get_run_state_table(self) -> Table:
+        table = Table(self.run_state_table, MetaData(),
+            Column('run_name',    String(200), primary_key=True),
+            Column('table_name',  String(200), primary_key=True),
+            Column('run_id',      String(50)),
+            Column('status',      String(20)),
+            Column('row_count',   Integer),
+            Column('started_on',  DateTime),
+            Column('finished_on', DateTime),
+            Column('seconds',     Float)
+        )
+        table.create(self.db_engine, checkfirst=True)
+        return table
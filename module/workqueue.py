@@ -0,0 +1,54 @@
+import logging, json, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+## Work queues of ETL work items, eg: {'source': 'ns', 'run_id': '20240101010000', 'table': 'ns_roles'}
+## items are json encoded, the same way as Azure Storage queue messages
+
+
+## Azure Storage queue, through the function queue output binding (func.Out[List[str]])
+## items put during an invocation are sent together when it completes
+class StorageWorkQueue:
+
+    def __init__(self, out) -> None:
+        self.out   = out
+        self.items = []
+
+    def put(self, items) -> None:
+        logging.info(f'StorageWorkQueue: put() - {len(items)} items')
+        self.items += [json.dumps(item) for item in items]
+        self.out.set(self.items)
+
+
+## Local in-memory stand-in of the storage queue, for tests and local runs
+## run() processes items in parallel threads, each thread standing for a function instance
+class InMemoryWorkQueue:
+
+    def __init__(self) -> None:
+        self.items = deque()
+        self.lock  = threading.Lock()
+
+    def put(self, items) -> None:
+        logging.info(f'InMemoryWorkQueue: put() - {len(items)} items')
+        with self.lock:
+            self.items.extend(json.dumps(item) for item in items)
+
+    def get(self):
+        with self.lock:
+            return json.loads(self.items.popleft()) if self.items else None
+
+    ## process all items with handler(item, queue), including items put by handlers, until the queue is empty
+    def run(self, handler, max_workers=4) -> None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = set()
+            while True:
+                while len(running) < max_workers:
+                    item = self.get()
+                    if item is None:
+                        break
+                    running.add(executor.submit(handler, item, self))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
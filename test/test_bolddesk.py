@@ -0,0 +1,96 @@
+## Bolddesk ticket enrichment against the cassette of a live ticket, recorded with benchmark.record_bolddesk
+## python -m pytest test
+import logging, os, re
+import pandas as pd
+import pytest
+from benchmark import generators as gen
+from benchmark.mock_servers import BolddeskServer
+from benchmark.transport import MockTransport, ReplayTransport, load_cassette
+from module.bolddesk import Bolddesk
+from module.warehouse import Warehouse, SQLiteBackend
+from module.idgov import save_bd_helpdesk_to_warehouse
+
+cassette = os.path.join(os.path.dirname(__file__), 'cassettes', 'bolddesk_ticket.json.gz')
+
+
+## base url and ticket id of the recorded ticket detail request, eg: 'GET https://xxx.bolddesk.com/api/v1/tickets/12345 '
+def get_recorded_ticket() -> tuple:
+    for interaction in load_cassette(cassette):
+        match = re.match(r'GET (\S+/)tickets/(\d+) ', interaction['key'])
+        if match:
+            return match[1], int(match[2])
+
+
+@pytest.mark.skipif(not os.path.exists(cassette), reason='no recorded Bolddesk ticket, see benchmark.record_bolddesk')
+def test_enrich_recorded_ticket(caplog):
+    base_url, ticket_id = get_recorded_ticket()
+    bd = Bolddesk(base_url, 'recorded-key', http_adapter=ReplayTransport(cassette))
+
+    with caplog.at_level(logging.WARNING):
+        tables = bd.enrich_tickets([ticket_id], max_workers=1)
+
+    ## endpoints and history fields match the live API
+    assert 'history fields not found' not in caplog.text
+    details = tables['details']
+    assert details.ticketId.tolist() == [ticket_id]
+    assert details.status.notna().all() and details.messages_count.notna().all()
+    assert not tables['status_history'].empty
+    assert tables['status_history'].time_in_status_hours.ge(0).all()
+
+
+## incremental enrichment, against the mock server: its payloads follow the same (unverified) endpoints and fields
+
+def get_bolddesk(tickets=60) -> tuple:
+    transport = MockTransport([BolddeskServer(scale={**gen.SCALES['small'], 'tickets': tickets})])
+    return Bolddesk('https://mock.bolddesk.com/api/v1/', 'mock-key', http_adapter=transport), transport
+
+
+def test_save_bd_helpdesk_first_run_is_bounded():
+    (bd, transport), wh = get_bolddesk(), Warehouse(backend=SQLiteBackend())
+    tickets = bd.list_tickets()
+    open_tickets = tickets.closedOn.isna().sum()
+
+    ## mock tickets are all older than first_run_days: open tickets only
+    save_bd_helpdesk_to_warehouse(bd, wh, first_run_days=30)
+    assert len(wh.get_table('bd_helpdesk_ticket_details')) == open_tickets
+
+    ## nothing updated since: open tickets updated at the watermark itself only
+    requests = transport.stats['requests']
+    save_bd_helpdesk_to_warehouse(bd, wh, first_run_days=30)
+    last = tickets.lastUpdatedOn == tickets.lastUpdatedOn.max()
+    assert transport.stats['requests'] - requests == 3 * (last & tickets.closedOn.isna()).sum()
+
+
+def test_save_bd_helpdesk_resumes_from_last_batch():
+    (bd, transport), wh = get_bolddesk(), Warehouse(backend=SQLiteBackend())
+    enrich_tickets, batches = bd.enrich_tickets, []
+
+    def fail_second_batch(ticket_ids, **kwargs):
+        batches.append(ticket_ids)
+        if len(batches) == 2:
+            raise ConnectionError('interrupted')
+        return enrich_tickets(ticket_ids, **kwargs)
+
+    bd.enrich_tickets = fail_second_batch
+    with pytest.raises(ConnectionError):
+        save_bd_helpdesk_to_warehouse(bd, wh, first_run_days=10**4, batch_size=20)
+
+    ## watermark of the saved batch only
+    tickets = bd.list_tickets().set_index('ticketId')
+    assert pd.Timestamp(wh.get_watermark('bd_helpdesk_ticket_enrichment_lastUpdatedOn')) == tickets.loc[batches[0]].lastUpdatedOn.max()
+
+    ## resumed from the failed batch
+    bd.enrich_tickets = enrich_tickets
+    save_bd_helpdesk_to_warehouse(bd, wh, first_run_days=10**4, batch_size=20)
+    assert wh.get_table('bd_helpdesk_ticket_details').ticketId.nunique() == len(tickets)
+
+
+def test_save_bd_helpdesk_skips_enriched_closed_tickets():
+    (bd, transport), wh = get_bolddesk(), Warehouse(backend=SQLiteBackend())
+    save_bd_helpdesk_to_warehouse(bd, wh, first_run_days=10**4)
+
+    ## all tickets updated since the watermark: closed ones are served by the child tables
+    wh.set_watermark('bd_helpdesk_ticket_enrichment_lastUpdatedOn', '2000-01-01')
+    requests = transport.stats['requests']
+    save_bd_helpdesk_to_warehouse(bd, wh)
+    assert transport.stats['requests'] - requests == 3 * bd.list_tickets().closedOn.isna().sum()
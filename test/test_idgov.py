@@ -0,0 +1,59 @@
+## Resumable save runs, run from project root: python -m pytest test
+from datetime import datetime, timedelta
+import pandas as pd
+from benchmark import generators as gen
+from benchmark.clients import MockCredential, azure_transport
+from benchmark.mock_servers import LogsAnalyticsServer
+from benchmark.transport import MockTransport
+from module.logsanalytics import LogsAnalytics
+from module.warehouse import Warehouse, SQLiteBackend
+from module.idgov import run_save_jobs, save_logs_to_warehouse
+
+
+def get_jobs(calls):
+    def job(table_name):
+        return (f'saving {table_name}', table_name, lambda: calls.append(table_name) or pd.DataFrame({'id': [1]}))
+    return [job('t1'), job('t2')]
+
+
+def test_run_save_jobs_skips_running_run():
+    wh, calls = Warehouse(backend=SQLiteBackend()), []
+    now = datetime.utcnow()
+    wh.set_run_state('test', '_run', run_id='1', status='running', started_on=now, finished_on=now)
+
+    assert run_save_jobs(wh, 'test', get_jobs(calls)) is False
+    assert calls == []
+
+    ## no progress for stale_after: resumed
+    wh.set_run_state('test', '_run', run_id='1', status='running', started_on=now, finished_on=now - timedelta(minutes=30))
+    assert run_save_jobs(wh, 'test', get_jobs(calls)) is True
+    assert calls == ['t1', 't2']
+
+
+def test_run_save_jobs_skips_claimed_table():
+    wh, calls = Warehouse(backend=SQLiteBackend()), []
+    now = datetime.utcnow()
+    wh.set_run_state('test', '_run', run_id='1', status='paused', started_on=now, finished_on=now)
+    wh.set_run_state('test', 't1', run_id='1', status='started', started_on=now)
+
+    ## t1 held by another worker of run 1
+    assert run_save_jobs(wh, 'test', get_jobs(calls)) is False
+    assert calls == ['t2']
+    assert wh.get_run_state('test').set_index('table_name').loc['_run'].status == 'paused'
+
+    ## its claim gone stale: taken over
+    wh.set_run_state('test', 't1', run_id='1', status='started', started_on=now - timedelta(minutes=30))
+    assert run_save_jobs(wh, 'test', get_jobs(calls)) is True
+    assert calls == ['t2', 't1']
+
+
+def test_logs_checkpoint_behind_ingestion_lag():
+    transport = MockTransport([LogsAnalyticsServer(scale={**gen.SCALES['small'], 'la_rows_per_hour': 10})])
+    la = LogsAnalytics('mock-workspace', MockCredential(), transport=azure_transport(transport))
+    wh = Warehouse(backend=SQLiteBackend())
+
+    ## last slice ends now: events of the last ingestion_lag are read again by the next run
+    started = pd.Timestamp.utcnow()
+    save_logs_to_warehouse(la, None, time_span=timedelta(hours=1), ingestion_lag=timedelta(minutes=5), include_raw=True, wh=wh)
+    checkpoint = pd.Timestamp(wh.get_watermark('ad_signins_TimeGenerated'))
+    assert started - timedelta(minutes=5) <= checkpoint <= pd.Timestamp.utcnow() - timedelta(minutes=5)
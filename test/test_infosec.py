@@ -0,0 +1,31 @@
+## Infosec timeline events cursor, run from project root: python -m pytest test
+import pandas as pd
+from benchmark import generators as gen
+from benchmark.mock_servers import InfosecServer
+from benchmark.transport import MockTransport
+from module.infosec import Infosec
+
+
+def get_infosec() -> Infosec:
+    transport = MockTransport([InfosecServer()])
+    return Infosec('https://mock.infosecinstitute.com/api/v2', 'mock-key', http_adapter=transport)
+
+
+def test_timeline_cursor_compares_ids_as_numbers():
+    infosec, scale = get_infosec(), gen.SCALES['small']
+    last = gen.is_timeline_event(0, scale, scale['timeline_events'] - 2)  ## last 'GiT' event
+
+    ## same timestamp, lower id: read, '701998' > '9' as numbers only
+    df = infosec.list_timeline_events(cursor={'timestamp': last['timestamp'], 'id': '9'})
+    assert df.learner_id.tolist() == [last['learner_id']]
+    assert infosec.timeline_cursor['id'] == str(last['id'])
+
+    ## from the cursor of the last event read: nothing new
+    df = infosec.list_timeline_events(cursor=infosec.timeline_cursor)
+    assert df.empty and infosec.timeline_cursor['id'] == str(last['id'])
+
+
+def test_timeline_ids_fall_back_to_strings():
+    keys = Infosec.id_keys(pd.Series(['10', '9', 'a1']))
+    assert sorted(keys) == ['10', '9', 'a1']
+    assert Infosec.id_keys(pd.Series(['10', '9'])).tolist() == [10, 9]
@@ -0,0 +1,56 @@
+## ETL metrics: concurrent tables, HTTP requests of the requests and azure sdk clients, python -m pytest test
+import threading
+from types import SimpleNamespace
+from datetime import timedelta
+from benchmark import generators as gen
+from benchmark.clients import MockCredential, azure_transport
+from benchmark.mock_servers import LogsAnalyticsServer
+from benchmark.transport import MockTransport
+from module.metrics import RunMetrics, MeasuredExecutor, http_hook, metrics_table
+from module.logsanalytics import LogsAnalytics
+from module.warehouse import Warehouse, SQLiteBackend
+from module.idgov import save_logs_to_warehouse
+
+RESPONSE = SimpleNamespace(content=b'1234', elapsed=timedelta(seconds=1))
+
+
+def test_executor_tasks_add_to_submitter_table():
+    metrics = RunMetrics('test')
+    with metrics.table('t1') as record, MeasuredExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: http_hook(RESPONSE), range(8)))
+    assert record['http_requests'] == 8 and record['http_bytes'] == 32
+
+    ## no table measured: nothing recorded
+    http_hook(RESPONSE)
+    assert record['http_requests'] == 8
+
+
+def test_concurrent_tables_do_not_mix():
+    metrics, barrier = RunMetrics('test'), threading.Barrier(2)
+
+    def measure(table_name, requests):
+        with metrics.table(table_name):
+            barrier.wait()
+            for _ in range(requests):
+                http_hook(RESPONSE)
+            barrier.wait()
+
+    threads = [threading.Thread(target=measure, args=args) for args in (('t1', 3), ('t2', 5))]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert {r['table_name']: r['http_requests'] for r in metrics.records} == {'t1': 3, 't2': 5}
+    assert all('process_peak_rss_mb' in r for r in metrics.records)
+
+
+def test_logs_analytics_tables_are_measured():
+    transport = MockTransport([LogsAnalyticsServer(scale={**gen.SCALES['small'], 'la_rows_per_hour': 10})])
+    la = LogsAnalytics('mock-workspace', MockCredential(), transport=azure_transport(transport))
+    wh = Warehouse(backend=SQLiteBackend())
+    save_logs_to_warehouse(la, None, time_span=timedelta(days=2), include_raw=True, wh=wh)
+
+    ## one record per table, every query counted once
+    df = wh.get_table(metrics_table).set_index('table_name')
+    assert df.index.is_unique and {'ad_signins', 'ad_audits', 'ad_signins_daily'} <= set(df.index)
+    assert df.http_requests.sum() == transport.stats['requests']
+    assert (df.http_requests > 0).all() and (df.http_bytes > 0).all()
+    assert df.loc['ad_signins'].extract_seconds > 0
@@ -0,0 +1,60 @@
+## Netsuite audit lists on empty results, run from project root: python -m pytest test
+from datetime import timedelta
+import pandas as pd
+from benchmark import generators as gen
+from benchmark.mock_servers import NetsuiteServer
+from benchmark.transport import MockTransport
+from module.netsuite import Netsuite
+from module.warehouse import Warehouse, SQLiteBackend
+from module.idgov import save_ns_audits_to_warehouse
+
+
+## client on the mock server, SuiteQL result cache in cache_dir, ns_rows=0 for empty audit results
+def get_mock_netsuite(cache_dir=None, ns_rows=gen.SCALES['small']['ns_rows']) -> tuple:
+    transport = MockTransport([NetsuiteServer(scale={**gen.SCALES['small'], 'ns_rows': ns_rows})])
+    ns = Netsuite('1234567', 'key', 'secret', 'token', 'token_secret', query_cache=cache_dir, http_adapter=transport)
+    return ns, transport
+
+
+def test_empty_audits_have_columns():
+    ns, _ = get_mock_netsuite(ns_rows=0)
+
+    df = ns.list_login_audits()
+    assert df.empty and list(df.columns) == ['user_id', 'date', 'login_count']
+    assert df.date.dtype == 'datetime64[ns]'
+
+    df = ns.list_login_failure(since='2024-01-01')
+    assert df.empty and {'date', 'datetime', 'user_id'} <= set(df.columns)
+    assert df.datetime.dtype == 'datetime64[ns]'
+
+    df = ns.list_script_logs(since_id=10)
+    assert df.empty and {'internalid', 'date'} <= set(df.columns)
+
+
+def test_save_empty_audits_keeps_loaded_rows():
+    wh = Warehouse(backend=SQLiteBackend())
+    wh.append('ns_script_logs', pd.DataFrame({'internalid': [10], 'date': [pd.Timestamp.utcnow().tz_localize(None)]}))
+    wh.set_watermark('ns_script_logs_internalid', 10)
+    wh.set_watermark('ns_login_audits_date', '2024-01-01')
+
+    save_ns_audits_to_warehouse(get_mock_netsuite(ns_rows=0)[0], wh)
+
+    assert wh.get_watermark('ns_script_logs_internalid') == 10
+    assert wh.get_watermark('ns_login_audits_date') == '2024-01-01'
+    assert len(wh.get_table('ns_script_logs')) == 1
+
+
+def test_query_cache_probes(tmp_path):
+    ns, transport = get_mock_netsuite(str(tmp_path))
+    query, (ttl, probe, max_age) = 'SELECT id, name FROM script', Netsuite.cache_policies['scripts']
+
+    def requests(policy):
+        ns.cache_policies = {'scripts': policy}
+        start = transport.stats['requests']
+        assert len(ns.query_all(query=query, cache='scripts')) == NetsuiteServer.table_rows['script']
+        return transport.stats['requests'] - start
+
+    assert requests((ttl, probe, max_age)) == 2                ## miss: probe and query
+    assert requests((ttl, probe, max_age)) == 0                ## within ttl
+    assert requests((timedelta(0), probe, max_age)) == 1       ## past ttl, same probe: probe only
+    assert requests((timedelta(0), probe, timedelta(0))) == 2  ## past max age: probe and query, however fresh the probe
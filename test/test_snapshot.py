@@ -0,0 +1,15 @@
+## Parquet snapshots, run from project root: python -m pytest test
+import pytest
+import pandas as pd
+
+pytest.importorskip('pyarrow')
+from module.snapshot import SnapshotStore
+
+
+def test_read_unknown_run(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write('ad', 'users', pd.DataFrame({'id': [1]}), run_id='20240101010000')
+
+    assert store.read('ad', 'users').id.tolist() == [1]
+    with pytest.raises(ValueError):
+        store.read('ad', 'users', run_id='20240102010000')
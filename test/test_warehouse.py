@@ -0,0 +1,30 @@
+## Warehouse writes, run from project root: python -m pytest test
+import pandas as pd
+import pytest
+from module.warehouse import Warehouse, SQLiteBackend
+
+
+def test_upsert_drops_null_keys():
+    wh = Warehouse(backend=SQLiteBackend())
+    df = pd.DataFrame({'id': [1, None], 'value': ['a', 'b']})
+    wh.upsert('t', df, keys=['id'])
+    wh.upsert('t', df.assign(value=['c', 'd']), keys=['id'])
+    assert wh.get_table('t').to_dict('records') == [{'id': 1, 'value': 'c'}]
+
+    ## only NULL keys: nothing written
+    wh.upsert('t2', df.iloc[1:], keys=['id'])
+    assert not wh.has_table('t2')
+
+
+def test_delete_rows():
+    wh = Warehouse(backend=SQLiteBackend())
+    wh.append('t', pd.DataFrame({'date': ['2024-01-01', '2024-01-02'], 'name': ["o'neil", 'b']}))
+
+    ## values bound as parameters
+    wh.delete_rows('t', 'name', "o'neil")
+    assert wh.get_table('t').name.tolist() == ['b']
+
+    ## no table yet: nothing to delete
+    wh.delete_rows('t2', 'date', '2024-01-01', operator='<')
+    with pytest.raises(ValueError):
+        wh.delete_rows('t', 'date', '2024-01-01', operator='; DROP TABLE t; --')